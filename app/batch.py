@@ -0,0 +1,248 @@
+"""Batch Mode for NBA-SHOT-SELECTION-LLM
+=====================================================
+Runs many analyses in one process from a job file instead of answering input() prompts.
+
+Each line of the job file is one JSON object:
+    {"team": "New York Knicks", "opponent": "league", "season": "2024-25", "season_type": "Playoffs", "visual": "team"}
+- opponent defaults to "league", season to 2024-25 and season_type to Playoffs
+- visual is "team", a player name, or left out / null for no chart
+- id is optional, it defaults to the line number and team
+
+Every job goes through ingest -> compare -> (summarize and chart). Each stage has its own concurrency limit,
+so api requests, cpu work, LLM requests and chart rendering are bounded separately:
+- ingest runs on threads, jobs for the same team, season and season type share one ingest. A team opponent
+  is ingested the same way, and the league side (baseline, store or ShotChartLeagueWide) counts as an ingest
+- compare runs on threads, it is only the zone summaries and the merge
+- summarize runs on the event loop against Ollama (see llm/summarizer.astream_comparison)
+- chart runs on a process pool of reusable court figures (see viz/batch.py)
+
+Results are written to <output dir>/results.jsonl as each job finishes, with the comparison, summary,
+chart path, per-stage seconds and the stage that failed, if any. Charts go to <output dir>/charts.
+=====================================================
+"""
+
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from llm.summarizer import astream_comparison
+from pipelines import ingest, transformation
+from pipelines.schema import SHOT_COLUMNS
+
+DEFAULT_STAGE_LIMITS = {"ingest": 2, "compare": 4, "summarize": 4, "chart": 2}
+
+
+def load_jobs(job_path):
+    """Reads and fills in the defaults of a JSONL job file
+    Parameters:
+    - job_path (str | Path): File with one JSON job per line
+    Returns:
+    - jobs (list): Job dicts with id, team, opponent, season, season_type and visual
+    """
+    jobs = []
+    for line_number, line in enumerate(Path(job_path).read_text().splitlines(), 1):
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        team = job.get("team") or job.get("team_name")
+        if not team:
+            raise ValueError(f"Job on line {line_number} has no team")
+        visual = job.get("visual")
+        if visual is True:
+            visual = "team"
+        elif not visual or str(visual).strip().lower() in ("no", "none", "false"):
+            visual = None
+        jobs.append(
+            {
+                "id": str(job.get("id") or f"{line_number}:{team}"),
+                "team": team,
+                "opponent": job.get("opponent") or job.get("opponent_name") or "league",
+                "season": job.get("season", "2024-25"),
+                "season_type": job.get("season_type", "Playoffs"),
+                "visual": visual,
+            }
+        )
+    return jobs
+
+
+class BatchRunner:
+    """Runs jobs through the pipeline with a concurrency limit per stage
+    Parameters:
+    - output_dir (str | Path): Where results.jsonl and the charts are written
+    - limits (dict): Concurrency per stage, missing stages use DEFAULT_STAGE_LIMITS. A chart limit of 0 skips charts
+    """
+
+    def __init__(self, output_dir, limits=None):
+        self.output_dir = Path(output_dir)
+        self.limits = {**DEFAULT_STAGE_LIMITS, **(limits or {})}
+        self._ingests = {}
+
+    async def run(self, jobs):
+        """Runs every job, writing each result as soon as its job finishes
+        Parameters:
+        - jobs (list): Jobs from load_jobs()
+        Returns:
+        - results (list): One result per job, in job order
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._summarize_slots = asyncio.Semaphore(self.limits["summarize"])
+        self._ingest_pool = ThreadPoolExecutor(self.limits["ingest"])
+        self._compare_pool = ThreadPoolExecutor(self.limits["compare"])
+        needs_charts = self.limits["chart"] > 0 and any(job["visual"] for job in jobs)
+        self._chart_pool = None
+        if needs_charts:
+            # matplotlib is only loaded when a job asks for a chart
+            from viz.batch import make_render_pool
+
+            self._chart_pool = make_render_pool(self.limits["chart"])
+        try:
+            with open(self.output_dir / "results.jsonl", "w") as output:
+
+                async def run_and_write(job):
+                    result = await self.run_job(job)
+                    output.write(json.dumps(result, default=str) + "\n")
+                    output.flush()
+                    print(
+                        f"[{result['status']}] {job['id']} in {result['seconds']['total']}s"
+                    )
+                    return result
+
+                return await asyncio.gather(*(run_and_write(job) for job in jobs))
+        finally:
+            self._ingest_pool.shutdown()
+            self._compare_pool.shutdown()
+            if self._chart_pool is not None:
+                self._chart_pool.shutdown()
+
+    def ingest(self, team, season, season_type):
+        # Coalescing ingests: every job for the same team and season waits on the same future
+        key = (team, season, season_type)
+        if key not in self._ingests:
+            self._ingests[key] = asyncio.get_running_loop().run_in_executor(
+                self._ingest_pool,
+                lambda: ingest.ingest_data(
+                    team_name=team,
+                    num_players=-1,
+                    season=season,
+                    season_type=season_type,
+                ),
+            )
+        return self._ingests[key]
+
+    def league_summary(self, season, season_type):
+        # The league side may call the api too (ShotChartLeagueWide), so it is an ingest like any team
+        key = ("league", season, season_type)
+        if key not in self._ingests:
+            self._ingests[key] = asyncio.get_running_loop().run_in_executor(
+                self._ingest_pool,
+                transformation.opponent_summary,
+                "league",
+                season,
+                season_type,
+            )
+        return self._ingests[key]
+
+    async def run_job(self, job):
+        """Runs one job through every stage
+        Parameters:
+        - job (dict): Job from load_jobs()
+        Returns:
+        - result (dict): Job fields plus status, comparison, summary, chart, seconds and error
+        """
+        loop = asyncio.get_running_loop()
+        result = {**job, "status": "ok", "seconds": {}}
+        started = time.perf_counter()
+        season, season_type = job["season"], job["season_type"]
+        try:
+            # The opponent is ingested next to the team, under the same limit and coalescing
+            if job["opponent"] == "league":
+                opponent = self.league_summary(season, season_type)
+            else:
+                opponent = self.ingest(job["opponent"], season, season_type)
+            team_shots, opponent = await self._timed(
+                result,
+                "ingest",
+                asyncio.gather(self.ingest(job["team"], season, season_type), opponent),
+            )
+
+            # Only cpu work is left for the compare pool
+            def compare():
+                if job["opponent"] == "league":
+                    return transformation.compare_summaries(
+                        transformation.summarize_team_shots(team_shots), opponent
+                    )
+                return transformation.compare_stats(
+                    team_shots, opponent, league_y_n=False
+                )
+
+            comparison = await self._timed(
+                result, "compare", loop.run_in_executor(self._compare_pool, compare)
+            )
+            result["comparison"] = comparison.to_dict(orient="records")
+            # The summary and the chart only need the earlier stages, so they run side by side
+            summary, chart = await asyncio.gather(
+                self._timed(result, "summarize", self.summarize(job, comparison)),
+                self._timed(result, "chart", self.chart(job, team_shots)),
+            )
+            result["summary"] = summary
+            result["chart"] = chart
+        except Exception as exc:
+            result.update(status="error", error=f"{type(exc).__name__}: {exc}")
+        result["seconds"]["total"] = round(time.perf_counter() - started, 3)
+        return result
+
+    async def _timed(self, result, stage, awaitable):
+        # Records how long a stage took, including time spent waiting for a free slot, and the stage that failed
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        except Exception:
+            result.setdefault("stage", stage)
+            raise
+        finally:
+            result["seconds"][stage] = round(time.perf_counter() - started, 3)
+
+    async def summarize(self, job, comparison):
+        async with self._summarize_slots:
+            pieces = [
+                piece
+                async for piece in astream_comparison(
+                    job["team"], job["opponent"], comparison
+                )
+            ]
+        return "".join(pieces)
+
+    async def chart(self, job, team_shots):
+        if not job["visual"] or self._chart_pool is None:
+            return None
+        from viz.batch import chart_filename, render_job
+
+        subject = job["visual"]
+        shots = team_shots[[c for c in SHOT_COLUMNS if c in team_shots.columns]]
+        if subject == "team":
+            subject = job["team"]
+        else:
+            shots = shots[shots["PLAYER_NAME"] == subject]
+        output_path = (
+            self.output_dir
+            / "charts"
+            / chart_filename(subject, job["season"], job["season_type"])
+        )
+        return await asyncio.get_running_loop().run_in_executor(
+            self._chart_pool, render_job, (shots, output_path, subject)
+        )
+
+
+def run_batch(job_path, output_dir, limits=None):
+    """Runs a job file and blocks until every job is done
+    Parameters:
+    - job_path (str | Path): JSONL job file, see the module docstring
+    - output_dir (str | Path): Where results.jsonl and the charts are written
+    - limits (dict): Concurrency per stage, ie: {"ingest": 2, "summarize": 4}
+    Returns:
+    - results (list): One result per job, in job order
+    """
+    jobs = load_jobs(job_path)
+    return asyncio.run(BatchRunner(output_dir, limits).run(jobs))
@@ -3,16 +3,19 @@ from pathlib import Path
 
 # Dynamically add the repo root to PYTHONPATH
 repo_root = Path(__file__).resolve().parent.parent
-print(repo_root)
 sys.path.append(str(repo_root))
 
 from pipelines import ingest, transformation
-from llm.summarizer import summarize_comparison
+from llm.summarizer import stream_comparison
 from viz.charts import plot_shot_chart
 from pathlib import Path
 
 ## Run the code from git bash to start the bot
 # PYTHONPATH=. py app/cli_bot.py
+## Or run a file of jobs without prompts (see app/batch.py)
+# py app/cli_bot.py --jobs jobs.jsonl --output-dir data/batch
+## Stage timings, cache hits and LLM token counts can be saved with (see pipelines/metrics.py)
+# py app/cli_bot.py --metrics-out data/metrics.prom --metrics-log data/metrics.jsonl --profile-dir data/profiles
 
 
 def main():
@@ -53,9 +56,11 @@ def main():
 
     # Generate LLM summary
     print("\nGenerating LLM summary...")
-    summary = summarize_comparison(team_name, opponent_name, comparison)
     print("\nLLM Analysis:\n")
-    print(summary)
+    # Printing the response as it is generated instead of waiting on the whole summary
+    for token in stream_comparison(team_name, opponent_name, comparison):
+        print(token, end="", flush=True)
+    print()
 
     # Optional visualization
     if show_visual == "yes":
@@ -69,5 +74,51 @@ def main():
             plot_shot_chart(player_shots, output_path, plt_title=visual_subject)
 
 
+def parse_args():
+    import argparse
+    from app.batch import DEFAULT_STAGE_LIMITS
+
+    parser = argparse.ArgumentParser(description="NBA Shot Selection Assistant")
+    parser.add_argument("--jobs", help="JSONL job file, runs without prompts")
+    parser.add_argument("--output-dir", default="data/batch")
+    for stage, limit in DEFAULT_STAGE_LIMITS.items():
+        parser.add_argument(
+            f"--{stage}-workers",
+            type=int,
+            default=limit,
+            help=f"Concurrent {stage} jobs (default {limit})",
+        )
+    parser.add_argument("--metrics-out", help="Prometheus text dump written at exit")
+    parser.add_argument("--metrics-log", help="JSON lines file, one line per stage")
+    parser.add_argument(
+        "--profile-dir", help="Save a cProfile file per top level stage"
+    )
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    main()
+    from pipelines import metrics
+
+    args = parse_args()
+    metrics.configure_metrics(log_path=args.metrics_log, profile_dir=args.profile_dir)
+    if args.jobs:
+        from app.batch import run_batch
+
+        results = run_batch(
+            args.jobs,
+            args.output_dir,
+            limits={
+                "ingest": args.ingest_workers,
+                "compare": args.compare_workers,
+                "summarize": args.summarize_workers,
+                "chart": args.chart_workers,
+            },
+        )
+        failed = sum(result["status"] != "ok" for result in results)
+        print(
+            f"{len(results) - failed}/{len(results)} jobs succeeded: {args.output_dir}"
+        )
+    else:
+        main()
+    if args.metrics_out:
+        print(f"Metrics written to {metrics.write_prometheus(args.metrics_out)}")
@@ -0,0 +1,505 @@
+"""HTTP Server for NBA-SHOT-SELECTION-LLM
+=====================================================
+A long running asyncio HTTP api over the pipeline, so repeat requests reuse warm in-process state
+instead of paying for a new process and reloading parquet every time.
+
+Endpoints (GET, parameters in the query string, season defaults to 2024-25 and season_type to Playoffs):
+    /health                                               cache sizes, hit rates and queue depths
+    /metrics                                              stage timings, cache hits and LLM tokens (Prometheus text)
+    /status?team=New York Knicks                          where the team's shots are available (memory, store, cache)
+    /compare?team=New York Knicks&opponent=league         comparison records as json
+    /summary?team=New York Knicks&opponent=league         LLM summary, streamed as plain text while it generates
+    /chart?team=New York Knicks[&player=Jalen Brunson]    shot chart png, mode=grid|scatter and kind=hex|square
+
+- Shot frames and opponent/league summaries are kept in in-memory LRU caches
+- Concurrent requests for the same team, season and season type share one upstream fetch
+- The nba_api and Ollama paths each allow a fixed number of calls at once with a bounded wait queue,
+  requests past the queue are turned away with 503 and Retry-After instead of piling up
+- Bad parameters and unknown teams are answered with 400, nba api or Ollama failures with 502 and anything
+  else with 500
+
+Run it with:
+    >> py -m app.server --port 8000
+=====================================================
+"""
+
+import asyncio
+import io
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from pipelines import baseline, cache, fetch, ingest, metrics, store, transformation
+
+DEFAULT_PORT = 8000
+# Team shot frames, a full league season is 30 per season type
+DEFAULT_SHOT_CACHE_SIZE = 64
+DEFAULT_SUMMARY_CACHE_SIZE = 256  # Opponent and league zone summaries, a few rows each
+DEFAULT_NBA_API_LIMIT = 2
+DEFAULT_OLLAMA_LIMIT = 2
+DEFAULT_MAX_WAITING = 16
+RETRY_AFTER_SECONDS = 5
+CHART_MODES = ("grid", "scatter")
+CHART_KINDS = ("hex", "square")
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+}
+
+
+class Overloaded(Exception):
+    """Raised when a path already has as many waiting requests as it allows"""
+
+
+class BadRequest(Exception):
+    """Raised for invalid query parameters and unknown teams or players, answered with 400"""
+
+
+def _is_upstream_error(exc):
+    # Failures of the nba api or Ollama, ie: throttled pages that don't parse, timeouts, refused connections
+    if fetch.is_retryable(exc):
+        return True
+    return type(exc).__module__.split(".")[0] in ("requests", "httpx", "ollama")
+
+
+class LRUCache:
+    """Small least recently used cache with hit/miss counts
+    Parameters:
+    - max_entries (int): Entries kept before the least recently used one is dropped
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses}
+
+
+class Gate:
+    """Limits how many calls run at once on a path, with a bounded number of callers allowed to wait
+    Parameters:
+    - limit (int): Calls allowed at once
+    - max_waiting (int): Callers allowed to wait for a slot, Overloaded is raised past this
+    """
+
+    def __init__(self, limit, max_waiting=DEFAULT_MAX_WAITING):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self.active = 0
+        self._slots = asyncio.Semaphore(limit)
+
+    async def __aenter__(self):
+        if self._slots.locked() and self.waiting >= self.max_waiting:
+            raise Overloaded(f"{self.waiting} requests are already waiting")
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.active -= 1
+        self._slots.release()
+
+    def stats(self):
+        return {"limit": self.limit, "active": self.active, "waiting": self.waiting}
+
+
+class Coalescer:
+    """Shares one in-flight call between every concurrent caller asking for the same key"""
+
+    def __init__(self):
+        self._in_flight = {}
+
+    def __contains__(self, key):
+        return key in self._in_flight
+
+    async def run(self, key, make_coroutine):
+        """Awaits the in-flight call for key, starting it if there is none
+        Parameters:
+        - key (hashable): Identifies the call
+        - make_coroutine (callable): No argument function returning the coroutine to run
+        Returns:
+        - The call's result, shared by every caller
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(make_coroutine())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Shielding so one caller disconnecting doesn't cancel the fetch for everyone else
+        return await asyncio.shield(task)
+
+
+class ShotService:
+    """The pipeline behind the endpoints, with its warm caches, coalescing and backpressure
+    Parameters:
+    - shot_cache_size (int): Team shot frames kept in memory
+    - summary_cache_size (int): Opponent/league zone summaries kept in memory
+    - nba_api_limit (int): Ingests allowed at once, these may call the nba api
+    - ollama_limit (int): Summaries generating at once
+    - max_waiting (int): Requests allowed to queue on each of those paths
+    """
+
+    def __init__(
+        self,
+        shot_cache_size=DEFAULT_SHOT_CACHE_SIZE,
+        summary_cache_size=DEFAULT_SUMMARY_CACHE_SIZE,
+        nba_api_limit=DEFAULT_NBA_API_LIMIT,
+        ollama_limit=DEFAULT_OLLAMA_LIMIT,
+        max_waiting=DEFAULT_MAX_WAITING,
+    ):
+        self.shots = LRUCache(shot_cache_size)
+        self.summaries = LRUCache(summary_cache_size)
+        self.nba_api = Gate(nba_api_limit, max_waiting)
+        self.ollama = Gate(ollama_limit, max_waiting)
+        self.coalescer = Coalescer()
+        self._io_pool = ThreadPoolExecutor(max(nba_api_limit, 1) + 2)
+        # Matplotlib isn't thread safe, so every chart is drawn on one thread with reusable figures
+        self._chart_pool = ThreadPoolExecutor(1)
+        self._renderers = {}
+
+    async def _in_thread(self, fn, *args, pool=None):
+        return await asyncio.get_running_loop().run_in_executor(
+            pool or self._io_pool, fn, *args
+        )
+
+    async def team_shots(self, team, season, season_type):
+        """Shot frame for a team, from memory, or a single shared ingest on a miss"""
+        key = ("shots", team, season, season_type)
+        cached = self.shots.get(key)
+        if cached is not None:
+            return cached
+
+        async def load():
+            async with self.nba_api:
+                shots = await self._in_thread(
+                    lambda: ingest.ingest_data(
+                        team_name=team,
+                        num_players=-1,
+                        season=season,
+                        season_type=season_type,
+                    )
+                )
+            self.shots.put(key, shots)
+            return shots
+
+        return await self.coalescer.run(key, load)
+
+    async def opponent_summary(self, opponent, season, season_type):
+        """Zone summary of an opponent or the league, from memory or transformation.opponent_summary()"""
+        key = ("opponent", opponent, season, season_type)
+        cached = self.summaries.get(key)
+        if cached is not None:
+            return cached
+
+        async def load():
+            if opponent != "league":
+                # Through team_shots() so the opponent's ingest is shared with requests for that team
+                # and its frame lands in the shot cache
+                opponent_shots = await self.team_shots(opponent, season, season_type)
+                summary = await self._in_thread(
+                    transformation.summarize_team_shots, opponent_shots
+                )
+            else:
+                async with self.nba_api:
+                    summary = await self._in_thread(
+                        transformation.opponent_summary, opponent, season, season_type
+                    )
+            self.summaries.put(key, summary)
+            return summary
+
+        return await self.coalescer.run(key, load)
+
+    async def comparison(self, team, opponent, season, season_type):
+        """Comparison of a team against an opponent or the league"""
+        team_shots, oppo_summary = await asyncio.gather(
+            self.team_shots(team, season, season_type),
+            self.opponent_summary(opponent, season, season_type),
+        )
+        return transformation.compare_summaries(
+            transformation.summarize_team_shots(team_shots), oppo_summary
+        )
+
+    async def stream_summary(self, team, opponent, season, season_type):
+        """Streams the LLM summary of a comparison piece by piece"""
+        from llm.summarizer import astream_comparison
+
+        comparison = await self.comparison(team, opponent, season, season_type)
+        async with self.ollama:
+            async for piece in astream_comparison(team, opponent, comparison):
+                yield piece
+
+    async def chart_png(self, team, season, season_type, player=None, **chart_options):
+        """Renders a team or player shot chart
+        Returns:
+        - (bytes) Png image
+        """
+        team_shots = await self.team_shots(team, season, season_type)
+        shots = team_shots
+        if player:
+            shots = team_shots[team_shots["PLAYER_NAME"] == player]
+            if shots.empty:
+                raise BadRequest(f"No shots for '{player}' on the {team}")
+
+        def render():
+            from viz.batch import ChartRenderer
+
+            options = tuple(sorted(chart_options.items()))
+            if options not in self._renderers:
+                self._renderers[options] = ChartRenderer(**chart_options)
+            buffer = io.BytesIO()
+            self._renderers[options].render(shots, buffer, player or team)
+            return buffer.getvalue()
+
+        return await self._in_thread(render, pool=self._chart_pool)
+
+    def status(self, team, season, season_type):
+        """Where a team's shots for a season can currently be served from"""
+        team_id = ingest.get_team_id(team_name=team)
+        key = ("shots", team, season, season_type)
+        params = ingest.ingest_params(team, -1, season, season_type)
+        return {
+            "team": team,
+            "season": season,
+            "season_type": season_type,
+            "in_memory": key in self.shots,
+            "ingesting": key in self.coalescer,
+            "in_store": store.has_team_slice(season, season_type, team_id),
+            "in_cache": cache.get_cache().lookup("ShotChartDetail", params) is not None,
+            "baseline_built": baseline.load_baseline(season, season_type) is not None,
+        }
+
+    def health(self):
+        return {
+            "shot_cache": self.shots.stats(),
+            "summary_cache": self.summaries.stats(),
+            "nba_api": self.nba_api.stats(),
+            "ollama": self.ollama.stats(),
+        }
+
+
+def _query(target):
+    # Single valued query parameters with defaults for the season
+    split = urlsplit(target)
+    params = {key: values[-1] for key, values in parse_qs(split.query).items()}
+    params.setdefault("season", "2024-25")
+    params.setdefault("season_type", "Playoffs")
+    return unquote(split.path), params
+
+
+async def _send(writer, status, body, content_type="application/json", headers=None):
+    if not isinstance(body, bytes):
+        body = json.dumps(body, default=str).encode("utf-8")
+    head = [
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(body)}",
+        "Connection: close",
+        *[f"{name}: {value}" for name, value in (headers or {}).items()],
+    ]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+
+def _check_team(name, param):
+    # Unknown teams are the caller's mistake, checked before any work starts (the team list is static)
+    try:
+        ingest.get_team_id(team_name=name)
+    except ValueError as exc:
+        raise BadRequest(f"{param}: {exc}") from None
+
+
+async def _send_stream(writer, pieces):
+    # Chunked transfer so the client sees every piece as soon as it is generated
+    writer.write(
+        b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; charset=utf-8\r\n"
+        b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n"
+    )
+    async for piece in pieces:
+        data = piece.encode("utf-8")
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        # Waiting on a slow client here holds back generation instead of buffering without bound
+        await writer.drain()
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+
+def make_handler(service):
+    """Builds the connection handler for asyncio.start_server
+    Parameters:
+    - service (ShotService): Pipeline the endpoints run against
+    Returns:
+    - (coroutine function) handle(reader, writer)
+    """
+
+    async def route(writer, path, params):
+        if path == "/health":
+            return await _send(writer, 200, service.health())
+        if path == "/metrics":
+            return await _send(
+                writer,
+                200,
+                metrics.to_prometheus().encode("utf-8"),
+                content_type="text/plain; version=0.0.4",
+            )
+        team = params.get("team")
+        if not team:
+            raise BadRequest("team is required")
+        _check_team(team, "team")
+        season, season_type = params["season"], params["season_type"]
+        opponent = params.get("opponent", "league")
+        if opponent != "league":
+            _check_team(opponent, "opponent")
+        if path == "/status":
+            return await _send(writer, 200, service.status(team, season, season_type))
+        if path == "/compare":
+            comparison = await service.comparison(team, opponent, season, season_type)
+            return await _send(writer, 200, comparison.to_dict(orient="records"))
+        if path == "/summary":
+            pieces = service.stream_summary(team, opponent, season, season_type)
+            # Pulling the first piece before answering so errors and 503s still get a proper status
+            try:
+                first = await pieces.__anext__()
+            except StopAsyncIteration:
+                # The model ended the stream without any text, an empty summary rather than a server error
+                return await _send(
+                    writer, 200, b"", content_type="text/plain; charset=utf-8"
+                )
+
+            async def rest():
+                yield first
+                async for piece in pieces:
+                    yield piece
+
+            try:
+                return await _send_stream(writer, rest())
+            finally:
+                # A client that went away mid stream leaves the generator suspended, closing it now
+                # gives its Ollama slot back instead of waiting for garbage collection
+                await pieces.aclose()
+        if path == "/chart":
+            # Every mode and kind gets its own cached figure, so only the known ones are accepted
+            mode, kind = params.get("mode", "grid"), params.get("kind", "hex")
+            if mode not in CHART_MODES:
+                raise BadRequest(f"mode must be one of {', '.join(CHART_MODES)}")
+            if kind not in CHART_KINDS:
+                raise BadRequest(f"kind must be one of {', '.join(CHART_KINDS)}")
+            png = await service.chart_png(
+                team,
+                season,
+                season_type,
+                player=params.get("player"),
+                mode=mode,
+                kind=kind,
+            )
+            return await _send(writer, 200, png, content_type="image/png")
+        return await _send(writer, 404, {"error": f"Unknown path {path}"})
+
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            # Skipping the headers, every parameter is in the query string
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) < 2:
+                return
+            if parts[0] != "GET":
+                return await _send(writer, 405, {"error": "Only GET is supported"})
+            path, params = _query(parts[1])
+            try:
+                await route(writer, path, params)
+            except Overloaded as exc:
+                await _send(
+                    writer,
+                    503,
+                    {"error": f"Busy, {exc}"},
+                    headers={"Retry-After": RETRY_AFTER_SECONDS},
+                )
+            except BadRequest as exc:
+                await _send(writer, 400, {"error": str(exc)})
+            except Exception as exc:
+                status = 502 if _is_upstream_error(exc) else 500
+                await _send(writer, status, {"error": f"{type(exc).__name__}: {exc}"})
+        except ConnectionError:
+            # The client went away, nothing left to answer
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    return handle
+
+
+async def serve(host="127.0.0.1", port=DEFAULT_PORT, service=None):
+    """Runs the server until cancelled
+    Parameters:
+    - host (str): Interface to listen on
+    - port (int): Port to listen on
+    - service (ShotService): Optional preconfigured service
+    """
+    service = service or ShotService()
+    server = await asyncio.start_server(make_handler(service), host, port)
+    print(f"Serving on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="NBA shot selection http api")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--nba-api-limit", type=int, default=DEFAULT_NBA_API_LIMIT)
+    parser.add_argument("--ollama-limit", type=int, default=DEFAULT_OLLAMA_LIMIT)
+    parser.add_argument("--max-waiting", type=int, default=DEFAULT_MAX_WAITING)
+    args = parser.parse_args()
+    asyncio.run(
+        serve(
+            args.host,
+            args.port,
+            ShotService(
+                nba_api_limit=args.nba_api_limit,
+                ollama_limit=args.ollama_limit,
+                max_waiting=args.max_waiting,
+            ),
+        )
+    )
@@ -0,0 +1,435 @@
+"""Replayable NBA API Fixtures for NBA-SHOT-SELECTION-LLM benchmarks
+=====================================================
+Serves recorded (or synthetic) stats.nba.com responses from a local http server, so the ingest
+pipelines can be benchmarked end to end without touching the real api or its rate limits.
+
+A fixture is one json file holding the endpoint, the request parameters it answers and the raw response:
+
+    {"endpoint": "shotchartdetail", "params": {"TeamID": "1610612752", "Season": "2024-25", ...},
+     "response": {"resource": ..., "parameters": ..., "resultSets": [...]}}
+
+A request is answered by the first fixture for its endpoint whose params all match the request,
+so a synthetic fixture only lists the parameters that identify it while a recorded one lists every parameter.
+
+Pieces:
+- record_fixtures(fixture_dir): records every real nba_api response made inside the block
+- build_synthetic_fixtures(shots, fixture_dir): writes LeagueGameFinder, CumeStatsTeam, ShotChartDetail,
+  ShotChartLeagueWide and LeagueDashPlayerStats fixtures for shots from benchmarks/synthetic.py
+- serve_fixtures(fixture_dir, latency, throttle_every): runs the server and points nba_api at it inside the block,
+  optionally answering every nth request with a 429 like a throttled stats.nba.com
+
+Example:
+    with record_fixtures("data/fixtures/knicks"):
+        ingest_data("New York Knicks", 5, "2024-25", "Playoffs", exact_minutes=True)
+    with serve_fixtures("data/fixtures/knicks", latency=0.3) as server:
+        ingest_data("New York Knicks", 5, "2024-25", "Playoffs", exact_minutes=True)
+        print(server.requests)
+=====================================================
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import pandas as pd
+from nba_api.stats.library.http import NBAStatsHTTP
+
+DEFAULT_LATENCY = 0.0  # Seconds added to every response, ie: 0.3 is close to stats.nba.com on a good day
+
+
+def fixture_path(fixture_dir, endpoint, params):
+    """File a fixture is stored in, named after its endpoint and a hash of its params
+    Returns:
+    - (Path) Fixture file
+    """
+    digest = hashlib.sha256(
+        json.dumps(params, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:16]
+    return Path(fixture_dir) / f"{endpoint.lower()}-{digest}.json"
+
+
+def save_fixture(fixture_dir, endpoint, params, response):
+    """Writes one fixture
+    Parameters:
+    - fixture_dir (str | Path): Fixture directory
+    - endpoint (str): Endpoint url name, ie: shotchartdetail
+    - params (dict): Request parameters the fixture answers, values are compared as strings
+    - response (dict): Raw api response with resultSets
+    Returns:
+    - (Path) Fixture file
+    """
+    params = {key: "" if value is None else str(value) for key, value in params.items()}
+    path = fixture_path(fixture_dir, endpoint, params)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        json.dumps(
+            {"endpoint": endpoint.lower(), "params": params, "response": response}
+        )
+    )
+    return path
+
+
+def result_set(name, df):
+    # One resultSets entry in the legacy stats.nba.com format
+    rows = df.astype(object).where(df.notna(), None).to_numpy().tolist()
+    return {"name": name, "headers": list(df.columns), "rowSet": rows}
+
+
+def api_response(endpoint, params, result_sets):
+    return {"resource": endpoint, "parameters": params, "resultSets": result_sets}
+
+
+@contextmanager
+def record_fixtures(fixture_dir):
+    """Records every nba_api response made inside the block as a fixture
+    Parameters:
+    - fixture_dir (str | Path): Directory the fixtures are written to
+    Yields:
+    - recorded (list): Paths of the fixtures written so far
+    """
+    original = NBAStatsHTTP.send_api_request
+    recorded = []
+
+    def send_api_request(self, endpoint, parameters, *args, **kwargs):
+        response = original(self, endpoint, parameters, *args, **kwargs)
+        if response.valid_json():
+            recorded.append(
+                save_fixture(fixture_dir, endpoint, parameters, response.get_dict())
+            )
+        return response
+
+    NBAStatsHTTP.send_api_request = send_api_request
+    try:
+        yield recorded
+    finally:
+        NBAStatsHTTP.send_api_request = original
+
+
+def build_synthetic_fixtures(shots, fixture_dir, season_type="Regular Season"):
+    """Writes fixtures for every endpoint the pipelines call, answering for the teams and seasons in shots
+    Parameters:
+    - shots (pd.DataFrame): Shots from benchmarks/synthetic.py, with a SEASON column
+    - fixture_dir (str | Path): Directory the fixtures are written to
+    - season_type (str): Season type the shots were generated for
+    Returns:
+    - (int) Number of fixtures written
+    """
+    from benchmarks.synthetic import league_averages
+
+    season_type = season_type.title()
+    shot_columns = [column for column in shots.columns if column != "SEASON"]
+    written = 0
+    for season, season_shots in shots.groupby("SEASON", observed=True, sort=False):
+        league_avg = league_averages(season_shots)
+        league_rows = result_set("LeagueAverages", league_avg)
+
+        # League wide averages, ShotChartLeagueWide only takes the season
+        save_fixture(
+            fixture_dir,
+            "shotchartleaguewide",
+            {"Season": season},
+            api_response(
+                "shotchartleaguewide",
+                {"Season": season},
+                [result_set("League_Wide", league_avg.assign(GRID_TYPE="League Wide"))],
+            ),
+        )
+        written += 1
+
+        # Shot chart for the whole league (TeamID 0) and for every team
+        team_groups = [(0, season_shots)] + list(
+            season_shots.groupby("TEAM_ID", observed=True)
+        )
+        for team_id, team_shots in team_groups:
+            params = {
+                "TeamID": int(team_id),
+                "PlayerID": 0,
+                "Season": season,
+                "SeasonType": season_type,
+            }
+            save_fixture(
+                fixture_dir,
+                "shotchartdetail",
+                params,
+                api_response(
+                    "shotchartdetail",
+                    params,
+                    [
+                        result_set("Shot_Chart_Detail", team_shots[shot_columns]),
+                        league_rows,
+                    ],
+                ),
+            )
+            written += 1
+            if team_id == 0:
+                continue
+            written += _team_fixtures(
+                fixture_dir, team_id, team_shots, season, season_type
+            )
+    return written
+
+
+def _team_fixtures(fixture_dir, team_id, team_shots, season, season_type):
+    """Writes the game finder, player minutes and per game cumulative stats fixtures for one team
+    Returns:
+    - (int) Number of fixtures written
+    """
+    team_id = int(team_id)
+    team_name = str(team_shots["TEAM_NAME"].iloc[0])
+    games = (
+        team_shots[["GAME_ID", "GAME_DATE"]]
+        .astype(str)
+        .drop_duplicates("GAME_ID")
+        .reset_index(drop=True)
+    )
+    games["GAME_DATE"] = pd.to_datetime(games["GAME_DATE"]).dt.strftime("%Y-%m-%d")
+    params = {"TeamID": team_id, "Season": season, "SeasonType": season_type}
+    finder = pd.DataFrame(
+        {
+            "SEASON_ID": f"2{season[:4]}",
+            "TEAM_ID": team_id,
+            "TEAM_NAME": team_name,
+            "GAME_ID": games["GAME_ID"],
+            "GAME_DATE": games["GAME_DATE"],
+            "MIN": 240,
+        }
+    )
+    save_fixture(
+        fixture_dir,
+        "leaguegamefinder",
+        params,
+        api_response(
+            "leaguegamefinder", params, [result_set("LeagueGameFinderResults", finder)]
+        ),
+    )
+
+    # Minutes follow shot volume, so the players ranked highest by minutes also take the most shots
+    players = (
+        team_shots.groupby(["PLAYER_ID", "PLAYER_NAME"], observed=True)
+        .size()
+        .rename("shots")
+        .reset_index()
+    )
+    minutes = np.round(40 * players["shots"] / players["shots"].max(), 1)
+    player_stats = pd.DataFrame(
+        {
+            "PLAYER_ID": players["PLAYER_ID"].astype(int),
+            "PLAYER_NAME": players["PLAYER_NAME"].astype(str),
+            "TEAM_ID": team_id,
+            "GP": len(games),
+            "MIN": minutes,
+        }
+    )
+    save_fixture(
+        fixture_dir,
+        "leaguedashplayerstats",
+        params,
+        api_response(
+            "leaguedashplayerstats",
+            params,
+            [result_set("LeagueDashPlayerStats", player_stats)],
+        ),
+    )
+
+    game_stats = pd.DataFrame(
+        {
+            "PLAYER": player_stats["PLAYER_NAME"],
+            "PERSON_ID": player_stats["PLAYER_ID"],
+            "TEAM_ID": team_id,
+            "ACTUAL_MINUTES": minutes.astype(int),
+            "ACTUAL_SECONDS": 0,
+        }
+    )
+    # Every game gets the same player minutes, so the result sets are only built once
+    cume_sets = [
+        result_set("GameByGameStats", game_stats),
+        result_set("TotalTeamStats", pd.DataFrame({"TEAM_ID": [team_id], "GP": [1]})),
+    ]
+    for game_id in games["GAME_ID"]:
+        game_params = {"TeamID": team_id, "GameIDs": game_id}
+        save_fixture(
+            fixture_dir,
+            "cumestatsteam",
+            game_params,
+            api_response("cumestatsteam", game_params, cume_sets),
+        )
+    return 2 + len(games)
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """Http server answering /stats/<endpoint> requests from a fixture directory
+    Attributes:
+    - latency (float): Seconds slept before every response
+    - throttle_every (int): Answer every nth request with a 429 and a non-json page, 0 never throttles
+    - requests (Counter): Requests answered per endpoint
+    - throttled (int): Requests answered with a 429
+    - misses (list): (endpoint, params) of requests no fixture matched, answered with a 404
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, fixture_dir, latency=DEFAULT_LATENCY, throttle_every=0):
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.requests = Counter()
+        self.throttled = 0
+        self.misses = []
+        self._received = 0
+        self._lock = threading.Lock()
+        # Only the params are kept in memory, responses are read from disk when they are served
+        self.index = {}
+        for path in sorted(Path(fixture_dir).glob("*.json")):
+            with path.open() as f:
+                fixture = json.load(f)
+            self.index.setdefault(fixture["endpoint"], []).append(
+                (fixture["params"], path)
+            )
+        super().__init__(address, FixtureHandler)
+
+    def find(self, endpoint, params):
+        """Finds the fixture answering a request
+        Returns:
+        - (Path | None) Fixture file
+        """
+        for fixture_params, path in self.index.get(endpoint, []):
+            if all(
+                params.get(key, "") == value for key, value in fixture_params.items()
+            ):
+                return path
+        return None
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        endpoint = url.path.rstrip("/").rsplit("/", 1)[-1].lower()
+        params = dict(parse_qsl(url.query, keep_blank_values=True))
+        if url.path == "/_requests":
+            # Request counts for a server running in another process, ie: from benchmarks/run.py
+            self._send_json(
+                {
+                    "requests": self.server.requests,
+                    "misses": len(self.server.misses),
+                    "throttled": self.server.throttled,
+                }
+            )
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self._throttle():
+            # stats.nba.com answers a throttled request with a page that isn't json
+            body = b"<html><body>Too Many Requests</body></html>"
+            self.send_response(429)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        path = self.server.find(endpoint, params)
+        with self.server._lock:
+            if path is None:
+                self.server.misses.append((endpoint, params))
+            else:
+                self.server.requests[endpoint] += 1
+        if path is None:
+            self.send_error(404, f"No fixture for {endpoint}")
+            return
+        with path.open() as f:
+            self._send_json(json.load(f)["response"])
+
+    def _throttle(self):
+        with self.server._lock:
+            self.server._received += 1
+            throttle = bool(self.server.throttle_every) and (
+                self.server._received % self.server.throttle_every == 0
+            )
+            self.server.throttled += throttle
+        return throttle
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keeping benchmark output readable, misses are collected on the server instead
+        pass
+
+
+def start_fixture_server(
+    fixture_dir, port=0, latency=DEFAULT_LATENCY, throttle_every=0
+):
+    """Starts a fixture server on a background thread
+    Parameters:
+    - fixture_dir (str | Path): Directory of fixture files
+    - port (int): Port to listen on, 0 picks a free one
+    - latency (float): Seconds added to every response
+    - throttle_every (int): Answer every nth request with a 429, 0 never throttles
+    Returns:
+    - server (FixtureServer): Call server.shutdown() to stop it
+    - base_url (str): nba_api base url pointing at the server
+    """
+    server = FixtureServer(
+        ("127.0.0.1", port), fixture_dir, latency=latency, throttle_every=throttle_every
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/stats/{{endpoint}}"
+
+
+@contextmanager
+def serve_fixtures(fixture_dir, latency=DEFAULT_LATENCY, throttle_every=0):
+    """Points nba_api at a fixture server for the duration of the block
+    Parameters:
+    - fixture_dir (str | Path): Directory of fixture files
+    - latency (float): Seconds added to every response
+    - throttle_every (int): Answer every nth request with a 429, 0 never throttles
+    Yields:
+    - server (FixtureServer): For its request counts, throttled requests and misses
+    """
+    server, base_url = start_fixture_server(
+        fixture_dir, latency=latency, throttle_every=throttle_every
+    )
+    original = NBAStatsHTTP.base_url
+    NBAStatsHTTP.base_url = base_url
+    try:
+        yield server
+    finally:
+        NBAStatsHTTP.base_url = original
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Serve nba api fixtures, point nba_api at it with NBAStatsHTTP.base_url"
+    )
+    parser.add_argument("fixture_dir")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY)
+    parser.add_argument(
+        "--throttle-every",
+        type=int,
+        default=0,
+        help="Answer every nth request with a 429",
+    )
+    args = parser.parse_args()
+    server = FixtureServer(
+        ("127.0.0.1", args.port), args.fixture_dir, args.latency, args.throttle_every
+    )
+    print(
+        f"Serving {sum(len(v) for v in server.index.values())} fixtures on "
+        f"http://127.0.0.1:{args.port}/stats/{{endpoint}}"
+    )
+    server.serve_forever()
@@ -0,0 +1,97 @@
+"""Import Time Benchmark for NBA-SHOT-SELECTION-LLM
+=====================================================
+Imports each entry point in a fresh interpreter and checks that
+
+- the import finishes inside its time budget
+- none of the heavy optional dependencies (nba_api endpoints, matplotlib, ollama) were loaded,
+  those are only imported once a request, chart or summary actually needs them
+
+Exits with status 1 when a check fails, so it can run as a regression check:
+    >> py benchmarks/import_time.py
+    >> py benchmarks/import_time.py --output data/bench/import_time.json
+=====================================================
+"""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Modules that must stay out of an import, only loaded on an api cache miss, a chart or a summary
+HEAVY_MODULES = ["nba_api.stats.endpoints", "matplotlib", "ollama"]
+
+# Entry point -> seconds allowed for its import
+BUDGETS = {
+    "pipelines.ingest": 1.0,
+    "pipelines.transformation": 1.0,
+    "llm.summarizer": 1.0,
+    "viz.charts": 1.0,
+    "app.batch": 1.0,
+    "app.cli_bot": 1.0,
+}
+
+# Runs in the child interpreter, prints the import time and the heavy modules that got loaded
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+loaded = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"seconds": seconds, "heavy_loaded": loaded}}))
+"""
+
+
+def measure(module, repeat=3):
+    """Imports a module in fresh interpreters and keeps the fastest run
+    Parameters:
+    - module (str): Dotted module name
+    - repeat (int): Number of fresh interpreters to try
+    Returns:
+    - (dict) seconds and heavy_loaded for the fastest run
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return min(runs, key=lambda run: run["seconds"])
+
+
+def run(budgets=BUDGETS, repeat=3):
+    """Measures every entry point against its budget
+    Returns:
+    - results (list): One dict per module with seconds, budget, heavy_loaded and ok
+    """
+    results = []
+    for module, budget in budgets.items():
+        result = {"module": module, "budget": budget, **measure(module, repeat)}
+        result["ok"] = result["seconds"] <= budget and not result["heavy_loaded"]
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check import times")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Optional json file for the results")
+    args = parser.parse_args()
+    results = run(repeat=args.repeat)
+    for result in results:
+        status = "ok" if result["ok"] else "FAIL"
+        heavy = f" loaded {result['heavy_loaded']}" if result["heavy_loaded"] else ""
+        print(
+            f"{status:4} {result['module']:28} {result['seconds']:.3f}s (budget {result['budget']}s){heavy}"
+        )
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    sys.exit(0 if all(result["ok"] for result in results) else 1)
@@ -0,0 +1,386 @@
+"""Pipeline Benchmarks for NBA-SHOT-SELECTION-LLM
+=====================================================
+Runs every stage of the pipeline against synthetic data, offline, and records per stage
+
+- seconds: wall time
+- peak_mb: peak memory allocated during the stage (tracemalloc, covers NumPy and pandas buffers)
+- max_rss_mb: the process's resident set high water mark once the stage is done (peak_mb on Windows)
+- output_bytes: size of what the stage produced (frame in memory, files on disk, summary text)
+
+Nothing touches the network: the nba api is served from synthetic fixtures by benchmarks/fixtures.py in a
+separate process (with optional latency), summaries come from the stub Ollama server in llm/stub_server.py,
+and the cache and store live in a temporary directory.
+
+Stages: generate, fixtures, ingest_cold, ingest_warm, ingest_exact (opt in, one request per game at the
+default 1 request per second), store_ingest, compare, shot_quality (every stored shot scored with the
+expected points model), chart, summarize
+
+Results are saved as json under data/bench/ so runs can be compared over time:
+    >> py -m benchmarks.run --scale team_playoffs
+    >> py -m benchmarks.run --scale league_season --latency 0.3 --compare data/bench/<earlier run>.json
+=====================================================
+"""
+
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.request import urlopen
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+from benchmarks.synthetic import SCALES, generate_shots
+from pipelines.cache import REPO_ROOT
+
+DEFAULT_OUTPUT_DIR = REPO_ROOT / "data" / "bench"
+DEFAULT_TEAM = "Atlanta Hawks"  # First team by id, so it is in every scale
+DEFAULT_NUM_PLAYERS = 5
+
+
+def dir_size(path):
+    # Bytes of every file under a directory
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+
+def max_rss_mb(fallback=0.0):
+    # ru_maxrss is kilobytes on Linux and bytes on macOS, Windows has no resource
+    # module so the stage's tracemalloc peak stands in
+    if resource is None:
+        return fallback
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+class StageTimer:
+    """Collects the measurements for each stage
+    Attributes:
+    - stages (list): One dict per stage, in the order they ran
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        """Measures the block as one stage, the block fills in output_bytes and any extra fields
+        Yields:
+        - record (dict): Stage record, ie: record["output_bytes"] = dir_size(...)
+        """
+        record = {"stage": name, "output_bytes": 0}
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - started, 4)
+            record["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+            tracemalloc.stop()
+            record["max_rss_mb"] = round(max_rss_mb(record["peak_mb"]), 1)
+            self.stages.append(record)
+            print(
+                f"{name:14} {record['seconds']:8.3f}s  peak {record['peak_mb']:8.1f}MB  "
+                f"out {record['output_bytes'] / 1e6:8.2f}MB"
+            )
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def fixture_process(fixture_dir, latency=0.0):
+    """Runs the fixture server in its own process, so its json encoding isn't counted against the stages,
+    and points nba_api at it
+    Yields:
+    - requests (callable): Returns the server's request counts per endpoint
+    """
+    from nba_api.stats.library.http import NBAStatsHTTP
+
+    port = _free_port()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.fixtures",
+            str(fixture_dir),
+            "--port",
+            str(port),
+            "--latency",
+            str(latency),
+        ],
+        cwd=REPO_ROOT,
+        stdout=subprocess.DEVNULL,
+    )
+    stats_url = f"http://127.0.0.1:{port}/_requests"
+
+    def requests():
+        with urlopen(stats_url) as response:
+            return json.load(response)
+
+    original = NBAStatsHTTP.base_url
+    try:
+        # Waiting for the server to load its fixture index
+        for _ in range(200):
+            try:
+                requests()
+                break
+            except OSError:
+                time.sleep(0.05)
+        NBAStatsHTTP.base_url = f"http://127.0.0.1:{port}/stats/{{endpoint}}"
+        yield requests
+    finally:
+        NBAStatsHTTP.base_url = original
+        server.terminate()
+        server.wait()
+
+
+def run_benchmarks(
+    scale="team_playoffs",
+    latency=0.0,
+    exact_minutes=False,
+    llm_token_delay=0.0,
+    team_name=DEFAULT_TEAM,
+    workdir=None,
+):
+    """Runs every stage at a scale and returns the results
+    Parameters:
+    - scale (str): Key of benchmarks.synthetic.SCALES
+    - latency (float): Seconds the fixture server adds to every api response
+    - exact_minutes (bool): Also run the per game CumeStatsTeam ingest (rate limited, one request per game)
+    - llm_token_delay (float): Seconds between words from the stub Ollama server
+    - team_name (str): Team used for the single team stages
+    - workdir (str | Path): Directory for fixtures, cache, store and charts, a temporary one by default
+    Returns:
+    - results (dict): meta and stages, see save_results()
+    """
+    from pipelines import cache, ingest, metrics, store, transformation
+    from benchmarks.fixtures import build_synthetic_fixtures
+
+    config = SCALES[scale]
+    season_type = config["season_type"]
+    workdir = Path(workdir or tempfile.mkdtemp(prefix="nba-bench-"))
+    fixture_dir, chart_dir = workdir / "fixtures", workdir / "charts"
+    # Everything the pipelines write goes to the work directory
+    cache.configure_cache(root=workdir / "cache")
+    os.environ["NBA_SHOT_STORE_DIR"] = str(workdir / "store")
+    timer = StageTimer()
+
+    with timer.stage("generate") as record:
+        shots = generate_shots(**config)
+        record["rows"] = len(shots)
+        record["output_bytes"] = frame_bytes(shots)
+    seasons = list(dict.fromkeys(shots["SEASON"]))
+    season = seasons[0]
+
+    with timer.stage("fixtures") as record:
+        record["files"] = build_synthetic_fixtures(shots, fixture_dir, season_type)
+        record["output_bytes"] = dir_size(fixture_dir)
+    del shots
+
+    with fixture_process(fixture_dir, latency=latency) as api_requests:
+        for name in ["ingest_cold", "ingest_warm"]:
+            with timer.stage(name) as record:
+                team_shots = ingest.ingest_data(
+                    team_name, DEFAULT_NUM_PLAYERS, season, season_type, use_store=False
+                )
+                record["rows"] = len(team_shots)
+                record["output_bytes"] = dir_size(workdir / "cache")
+        if exact_minutes:
+            with timer.stage("ingest_exact") as record:
+                exact_shots = ingest.ingest_data(
+                    team_name,
+                    DEFAULT_NUM_PLAYERS,
+                    season,
+                    season_type,
+                    exact_minutes=True,
+                    use_store=False,
+                )
+                record["rows"] = len(exact_shots)
+                record["output_bytes"] = frame_bytes(exact_shots)
+
+        with timer.stage("store_ingest") as record:
+            for store_season in seasons:
+                store.ingest_league(store_season, season_type)
+            record["seasons"] = len(seasons)
+            record["output_bytes"] = dir_size(store.get_store_root())
+        requests = api_requests()
+
+    with timer.stage("compare") as record:
+        comparison = transformation.compare_to_league(
+            team_shots, "league", season, season_type
+        )
+        all_teams = transformation.compare_to_all(team_shots, season, season_type)
+        record["rows"] = len(comparison) + len(all_teams)
+        record["output_bytes"] = frame_bytes(comparison) + frame_bytes(all_teams)
+
+    with timer.stage("shot_quality") as record:
+        from pipelines.shot_value import SHOT_VALUE_COLUMNS
+
+        # Like the nightly refresh, every stored shot of every season is scored
+        record["rows"] = record["output_bytes"] = 0
+        for store_season in seasons:
+            league_shots = store.read_team_shots(
+                store_season,
+                season_type,
+                columns=SHOT_VALUE_COLUMNS + ["TEAM_NAME", "PLAYER_NAME"],
+            )
+            quality = transformation.shot_quality(
+                league_shots, store_season, season_type
+            )
+            record["rows"] += len(league_shots)
+            record["output_bytes"] += sum(map(frame_bytes, quality.values()))
+
+    with timer.stage("chart") as record:
+        from viz.batch import render_charts, team_chart_jobs
+
+        paths = render_charts(
+            team_chart_jobs(team_shots, chart_dir, team_name, season, season_type)
+        )
+        record["charts"] = len(paths)
+        record["output_bytes"] = dir_size(chart_dir)
+
+    with timer.stage("summarize") as record:
+        from llm import summarizer
+        from llm.stub_server import start_stub_server
+
+        server, host = start_stub_server(token_delay=llm_token_delay)
+        try:
+            summarizer.configure_client(host=host)
+            started = time.perf_counter()
+            pieces = []
+            for piece in summarizer.stream_comparison(
+                team_name, "league", comparison, use_cache=False
+            ):
+                if not pieces:
+                    record["first_token_s"] = round(time.perf_counter() - started, 4)
+                pieces.append(piece)
+        finally:
+            server.shutdown()
+        record["output_bytes"] = len("".join(pieces).encode("utf-8"))
+
+    return {
+        "meta": {
+            "scale": scale,
+            **config,
+            "latency": latency,
+            "exact_minutes": exact_minutes,
+            "team": team_name,
+            "api_requests": requests["requests"],
+            "api_misses": requests["misses"],
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "stages": timer.stages,
+        # Finer grained spans from inside the stages (api requests, cache io, LLM tokens)
+        "metrics": metrics.snapshot(),
+    }
+
+
+def _git_rev():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(results, output_dir=DEFAULT_OUTPUT_DIR):
+    """Saves a run as data/bench/<scale>-<timestamp>.json
+    Returns:
+    - (Path) Results file
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stamp = results["meta"]["timestamp"].replace(":", "").replace("+0000", "Z")
+    path = output_dir / f"{results['meta']['scale']}-{stamp}.json"
+    path.write_text(json.dumps(results, indent=2))
+    return path
+
+
+def compare_results(baseline, current):
+    """Lines comparing two runs stage by stage, ie: to spot a regression against an earlier commit
+    Parameters:
+    - baseline, current (dict): Results from run_benchmarks() or a saved json file
+    Returns:
+    - lines (list): One line per stage found in both runs
+    """
+    before = {stage["stage"]: stage for stage in baseline["stages"]}
+    lines = [
+        f"{'stage':14} {'seconds':>20} {'peak MB':>22}  "
+        f"(vs {baseline['meta'].get('git_rev')} {baseline['meta']['timestamp']})"
+    ]
+    if baseline["meta"]["scale"] != current["meta"]["scale"]:
+        lines.append(
+            f"Note: comparing {current['meta']['scale']} against a {baseline['meta']['scale']} run"
+        )
+    for stage in current["stages"]:
+        old = before.get(stage["stage"])
+        if old is None:
+            continue
+        cells = []
+        for field in ["seconds", "peak_mb"]:
+            change = (stage[field] - old[field]) / old[field] * 100 if old[field] else 0
+            cells.append(f"{old[field]:8.3f} -> {stage[field]:8.3f} {change:+5.0f}%")
+        lines.append(f"{stage['stage']:14} {cells[0]:>20} {cells[1]:>22}")
+    return lines
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline offline")
+    parser.add_argument("--scale", default="team_playoffs", choices=list(SCALES))
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds per api response"
+    )
+    parser.add_argument(
+        "--exact-minutes",
+        action="store_true",
+        help="Also benchmark the per game CumeStatsTeam ingest",
+    )
+    parser.add_argument(
+        "--llm-token-delay", type=float, default=0.0, help="Seconds between words"
+    )
+    parser.add_argument("--workdir", help="Keep fixtures, cache and charts here")
+    parser.add_argument("--output-dir", default=str(DEFAULT_OUTPUT_DIR))
+    parser.add_argument("--compare", help="Earlier results json to compare against")
+    args = parser.parse_args()
+    results = run_benchmarks(
+        scale=args.scale,
+        latency=args.latency,
+        exact_minutes=args.exact_minutes,
+        llm_token_delay=args.llm_token_delay,
+        workdir=args.workdir,
+    )
+    print(f"Saved results to {save_results(results, args.output_dir)}")
+    if args.compare:
+        print(
+            "\n".join(
+                compare_results(json.loads(Path(args.compare).read_text()), results)
+            )
+        )
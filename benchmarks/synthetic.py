@@ -0,0 +1,316 @@
+"""Synthetic Shot Data for NBA-SHOT-SELECTION-LLM benchmarks
+=====================================================
+Generates ShotChartDetail shaped shots with NumPy, from one team's playoff run up to ten league seasons.
+
+Shot locations are drawn from a mix of rim, paint, mid-range, corner three and above the break three
+clusters, and every other column is derived from the location the same way the nba api does
+(SHOT_DISTANCE, SHOT_ZONE_BASIC/AREA/RANGE, SHOT_TYPE), so zone summaries and charts look like the real thing.
+Teams are the real 30 teams from nba_api's static list so ingest can resolve them by name.
+
+Example:
+    shots = generate_shots(**SCALES["league_season"])
+    league_avg = league_averages(shots)
+=====================================================
+"""
+
+import numpy as np
+import pandas as pd
+from nba_api.stats.static import teams as static_teams
+
+from pipelines.schema import normalize_shots
+
+# teams, seasons, games per team and season type for each benchmark scale
+SCALES = {
+    "team_playoffs": {
+        "n_teams": 1,
+        "n_seasons": 1,
+        "n_games": 12,
+        "season_type": "Playoffs",
+    },
+    "team_season": {
+        "n_teams": 1,
+        "n_seasons": 1,
+        "n_games": 82,
+        "season_type": "Regular Season",
+    },
+    "league_season": {
+        "n_teams": 30,
+        "n_seasons": 1,
+        "n_games": 82,
+        "season_type": "Regular Season",
+    },
+    "league_10_seasons": {
+        "n_teams": 30,
+        "n_seasons": 10,
+        "n_games": 82,
+        "season_type": "Regular Season",
+    },
+}
+
+SHOTS_PER_GAME = 88
+PLAYERS_PER_TEAM = 15
+FIRST_SEASON = 2024  # Later seasons count backwards, ie: 2024-25, 2023-24, ...
+
+# Location clusters: share of shots, x mean/sd, y mean/sd (tenths of a foot, hoop at 0, 0)
+CLUSTERS = {
+    "rim": (0.30, 0, 18, 8, 14),
+    "paint": (0.14, 0, 45, 70, 30),
+    "mid": (0.14, 0, 110, 130, 50),
+    "corner": (0.10, 232, 6, 20, 25),
+    "above_break": (0.315, 0, 140, 245, 35),
+    "backcourt": (0.005, 0, 80, 480, 30),
+}
+
+# Chance a shot goes in, by zone
+MAKE_RATE = {
+    "Restricted Area": 0.66,
+    "In The Paint (Non-RA)": 0.44,
+    "Mid-Range": 0.42,
+    "Left Corner 3": 0.39,
+    "Right Corner 3": 0.39,
+    "Above the Break 3": 0.355,
+    "Backcourt": 0.03,
+}
+
+ZONES = list(MAKE_RATE)
+AREAS = [
+    "Center(C)",
+    "Left Side(L)",
+    "Right Side(R)",
+    "Left Side Center(LC)",
+    "Right Side Center(RC)",
+    "Back Court(BC)",
+]
+RANGES = ["Less Than 8 ft.", "8-16 ft.", "16-24 ft.", "24+ ft.", "Back Court Shot"]
+RIM_ACTIONS = [
+    "Driving Layup Shot",
+    "Layup Shot",
+    "Dunk Shot",
+    "Cutting Layup Shot",
+    "Tip Layup Shot",
+]
+JUMP_ACTIONS = [
+    "Jump Shot",
+    "Pullup Jump shot",
+    "Step Back Jump shot",
+    "Driving Floating Jump Shot",
+    "Fadeaway Jump Shot",
+]
+
+
+def zone_columns(x, y):
+    """Derives the nba api's zone columns from shot locations
+    Parameters:
+    - x, y (np.ndarray): LOC_X and LOC_Y
+    Returns:
+    - zone, area, range (np.ndarray): Codes into ZONES, AREAS and RANGES
+    - distance (np.ndarray): SHOT_DISTANCE in feet
+    """
+    distance = np.hypot(x, y) / 10
+    corner = (np.abs(x) >= 220) & (y <= 92.5)
+    three = corner | (distance >= 23.75)
+    backcourt = y > 422.5
+    zone = np.select(
+        [
+            backcourt,
+            corner & (x > 0),
+            corner & (x <= 0),
+            three,
+            distance <= 4,
+            (np.abs(x) < 80) & (y < 142.5),
+        ],
+        [6, 4, 3, 5, 0, 1],
+        default=2,
+    )
+    # Side of the court from the shot angle, positive LOC_X is the shooter's right
+    angle = np.degrees(np.arctan2(x, np.maximum(y, 1)))
+    area = np.select(
+        [backcourt, np.abs(angle) < 22.5, angle <= -60, angle >= 60, angle < 0],
+        [5, 0, 1, 2, 3],
+        default=4,
+    )
+    shot_range = np.select(
+        [backcourt, distance < 8, distance < 16, distance < 24], [4, 0, 1, 2], default=3
+    )
+    return zone, area, shot_range, np.round(distance).astype(np.int16)
+
+
+def _categorical(codes, categories):
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def _team_abbreviations():
+    return {team["id"]: team["abbreviation"] for team in static_teams.get_teams()}
+
+
+def season_string(start_year):
+    return f"{start_year}-{str(start_year + 1)[-2:]}"
+
+
+def generate_season(
+    season, season_type="Regular Season", n_teams=30, n_games=82, seed=0
+):
+    """Generates one season of shots for the first n_teams teams
+    Parameters:
+    - season (str): Season year string, ie: 2024-25
+    - season_type (str): Regular Season or Playoffs, sets the game id prefix
+    - n_teams (int): Number of teams, 1 to 30
+    - n_games (int): Games per team
+    - seed (int): Random seed, the same seed always gives the same shots
+    Returns:
+    - shots (pd.DataFrame): ShotChartDetail columns in the compact schema (see pipelines/schema.py)
+    """
+    rng = np.random.default_rng([seed, int(season[:4]), len(season_type)])
+    team_list = sorted(static_teams.get_teams(), key=lambda team: team["id"])[:n_teams]
+    abbreviations = _team_abbreviations()
+    n_shots = n_teams * n_games * SHOTS_PER_GAME
+
+    # Which team, game and player took each shot
+    team_index = np.repeat(np.arange(n_teams), n_games * SHOTS_PER_GAME)
+    game_index = np.tile(np.repeat(np.arange(n_games), SHOTS_PER_GAME), n_teams)
+    usage = 1 / np.arange(1, PLAYERS_PER_TEAM + 1) ** 0.9
+    player_slot = rng.choice(PLAYERS_PER_TEAM, size=n_shots, p=usage / usage.sum())
+
+    # Locations from the clusters, mirrored left/right at random
+    cluster_names = list(CLUSTERS)
+    shares = np.array([CLUSTERS[name][0] for name in cluster_names])
+    cluster = rng.choice(len(cluster_names), size=n_shots, p=shares / shares.sum())
+    params = np.array([CLUSTERS[name][1:] for name in cluster_names])[cluster]
+    side = np.where(rng.random(n_shots) < 0.5, -1, 1)
+    x = (params[:, 0] + rng.normal(0, 1, n_shots) * params[:, 1]) * side
+    y = params[:, 2] + np.abs(rng.normal(0, 1, n_shots)) * params[:, 3] * np.sign(
+        rng.random(n_shots) - 0.15
+    )
+    x = np.clip(np.round(x), -250, 250)
+    y = np.clip(np.round(y), -52, 800)
+    zone, area, shot_range, distance = zone_columns(x, y)
+
+    made = rng.random(n_shots) < np.array(list(MAKE_RATE.values()))[zone]
+    at_rim = zone <= 1
+    action_codes = np.where(
+        at_rim,
+        rng.integers(0, len(RIM_ACTIONS), n_shots),
+        len(RIM_ACTIONS) + rng.integers(0, len(JUMP_ACTIONS), n_shots),
+    )
+
+    # Game ids and dates, every team plays its games on consecutive days from the season start
+    prefix = "004" if season_type.lower() == "playoffs" else "002"
+    yy = season[2:4]
+    game_number = team_index * n_games + game_index
+    game_ids = np.array([f"{prefix}{yy}{n:05d}" for n in range(n_teams * n_games)])
+    start = pd.Timestamp(
+        f"{season[:4]}-10-22" if prefix == "002" else f"{int(season[:4]) + 1}-04-19"
+    )
+    dates = (
+        (start + pd.to_timedelta(np.arange(n_games), unit="D"))
+        .strftime("%Y%m%d")
+        .to_numpy()
+    )
+
+    team_ids = np.array([team["id"] for team in team_list], dtype=np.int32)
+    team_names = [team["full_name"] for team in team_list]
+    team_abbr = [abbreviations[team["id"]] for team in team_list]
+    player_names = [
+        f"{abbr} Player {i + 1:02d}"
+        for abbr in team_abbr
+        for i in range(PLAYERS_PER_TEAM)
+    ]
+    player_code = team_index * PLAYERS_PER_TEAM + player_slot
+    # A single team plays a placeholder opponent, otherwise teams rotate through the rest of the league
+    if n_teams > 1:
+        opponent_index = (team_index + 1 + game_index % (n_teams - 1)) % n_teams
+        opponent_abbr = np.array(team_abbr)[opponent_index]
+    else:
+        opponent_abbr = np.full(n_shots, "OPP")
+    home = game_index % 2 == 0
+
+    shots = pd.DataFrame(
+        {
+            "GRID_TYPE": _categorical(
+                np.zeros(n_shots, dtype=np.int8), ["Shot Chart Detail"]
+            ),
+            "GAME_ID": _categorical(game_number, game_ids),
+            "GAME_EVENT_ID": (np.arange(n_shots) % SHOTS_PER_GAME * 7 + 2).astype(
+                np.int32
+            ),
+            "PLAYER_ID": (1_000_000 + player_code).astype(np.int32),
+            "PLAYER_NAME": _categorical(player_code, player_names),
+            "TEAM_ID": team_ids[team_index],
+            "TEAM_NAME": _categorical(team_index, team_names),
+            "PERIOD": (
+                1 + np.arange(n_shots) % SHOTS_PER_GAME * 4 // SHOTS_PER_GAME
+            ).astype(np.int8),
+            "MINUTES_REMAINING": rng.integers(0, 12, n_shots, dtype=np.int8),
+            "SECONDS_REMAINING": rng.integers(0, 60, n_shots, dtype=np.int8),
+            "EVENT_TYPE": _categorical(
+                np.where(made, 0, 1), ["Made Shot", "Missed Shot"]
+            ),
+            "ACTION_TYPE": _categorical(action_codes, RIM_ACTIONS + JUMP_ACTIONS),
+            "SHOT_TYPE": _categorical(
+                (zone >= 3).astype(np.int8), ["2PT Field Goal", "3PT Field Goal"]
+            ),
+            "SHOT_ZONE_BASIC": _categorical(zone, ZONES),
+            "SHOT_ZONE_AREA": _categorical(area, AREAS),
+            "SHOT_ZONE_RANGE": _categorical(shot_range, RANGES),
+            "SHOT_DISTANCE": distance,
+            "LOC_X": x.astype(np.int16),
+            "LOC_Y": y.astype(np.int16),
+            "SHOT_ATTEMPTED_FLAG": np.ones(n_shots, dtype=np.int8),
+            "SHOT_MADE_FLAG": made.astype(np.int8),
+            "GAME_DATE": _categorical(game_index, list(dates)),
+            "HTM": np.where(home, np.array(team_abbr)[team_index], opponent_abbr),
+            "VTM": np.where(home, opponent_abbr, np.array(team_abbr)[team_index]),
+        }
+    )
+    return normalize_shots(shots)
+
+
+def generate_shots(
+    n_teams=1, n_seasons=1, n_games=82, season_type="Regular Season", seed=0
+):
+    """Generates shots for several seasons, see SCALES for the benchmark sizes
+    Parameters:
+    - n_teams (int): Number of teams, 1 to 30
+    - n_seasons (int): Number of seasons, counting back from FIRST_SEASON
+    - n_games (int): Games per team per season
+    - season_type (str): Regular Season or Playoffs
+    - seed (int): Random seed
+    Returns:
+    - shots (pd.DataFrame): Shots with an extra SEASON column
+    """
+    seasons = []
+    for i in range(n_seasons):
+        season = season_string(FIRST_SEASON - i)
+        seasons.append(
+            generate_season(season, season_type, n_teams, n_games, seed).assign(
+                SEASON=season
+            )
+        )
+    # Categoricals with different categories concatenate as object, normalize_shots() makes them categorical again
+    return (
+        normalize_shots(pd.concat(seasons, ignore_index=True))
+        if len(seasons) > 1
+        else seasons[0]
+    )
+
+
+def league_averages(shots):
+    """Builds ShotChartLeagueWide shaped averages from shots
+    Parameters:
+    - shots (pd.DataFrame): Shots from generate_season()
+    Returns:
+    - league_avg (pd.DataFrame): GRID_TYPE, SHOT_ZONE_BASIC/AREA/RANGE, FGA, FGM, FG_PCT
+    """
+    league_avg = (
+        shots.groupby(
+            ["SHOT_ZONE_BASIC", "SHOT_ZONE_AREA", "SHOT_ZONE_RANGE"], observed=True
+        )["SHOT_MADE_FLAG"]
+        .agg(FGA="size", FGM="sum")
+        .reset_index()
+    )
+    for column in ["SHOT_ZONE_BASIC", "SHOT_ZONE_AREA", "SHOT_ZONE_RANGE"]:
+        league_avg[column] = league_avg[column].astype(str)
+    league_avg["FGM"] = league_avg["FGM"].astype(np.int64)
+    league_avg["FG_PCT"] = (league_avg["FGM"] / league_avg["FGA"]).round(3)
+    league_avg.insert(0, "GRID_TYPE", "League Averages")
+    return league_avg
@@ -0,0 +1,155 @@
+"""Batch Summaries for NBA-SHOT-SELECTION-LLM
+=====================================================
+Summarizes many comparisons concurrently, ie: every team against the league each night.
+
+- Items run through a pool of asyncio workers sharing one Ollama async client, concurrency sets how many
+  requests are in flight at once (match it to OLLAMA_NUM_PARALLEL on the server)
+- Every result is appended to a JSONL file as soon as it finishes, with its latency and time to first token
+- Rerunning with the same output file skips the items that already succeeded, so a crash or a failed
+  request only costs the items that didn't finish
+- Cached summaries (see llm/cache.py) are returned without calling the server
+
+Example:
+    items = [{"team_name": name, "opponent_name": "league", "comparison_df": df} for name, df in comparisons]
+    results = summarize_batch(items, "data/summaries/2024-25_Playoffs.jsonl", concurrency=4)
+
+Try it without a model against the stub server (see llm/stub_server.py).
+=====================================================
+"""
+
+import asyncio
+import json
+import time
+from pathlib import Path
+
+from llm.summarizer import astream_comparison
+
+DEFAULT_CONCURRENCY = 4
+
+
+def item_id(item):
+    # Items are identified by an explicit id, or their team and opponent
+    return item.get("id") or f"{item['team_name']} vs {item['opponent_name']}"
+
+
+def load_results(output_path):
+    """Reads the results already written to a JSONL file, the last line for an id wins
+    Parameters:
+    - output_path (str | Path): JSONL results file
+    Returns:
+    - (dict) {id: result}
+    """
+    output_path = Path(output_path)
+    results = {}
+    if not output_path.exists():
+        return results
+    for line in output_path.read_text().splitlines():
+        try:
+            result = json.loads(line)
+        except ValueError:
+            # A line cut off by a crash is skipped and its item reruns
+            continue
+        results[result["id"]] = result
+    return results
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, 2)
+        return f.read(1) == b"\n"
+
+
+async def _summarize_item(item, model, use_cache):
+    # Streams one summary and times it
+    started = time.perf_counter()
+    first_token = None
+    pieces = []
+    result = {
+        "id": item_id(item),
+        "team_name": item["team_name"],
+        "opponent_name": item["opponent_name"],
+    }
+    try:
+        async for piece in astream_comparison(
+            item["team_name"],
+            item["opponent_name"],
+            item["comparison_df"],
+            model=model,
+            use_cache=use_cache,
+        ):
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            pieces.append(piece)
+        result.update(status="ok", summary="".join(pieces))
+    except Exception as exc:
+        result.update(status="error", error=f"{type(exc).__name__}: {exc}")
+    result["latency_s"] = round(time.perf_counter() - started, 4)
+    result["first_token_s"] = None if first_token is None else round(first_token, 4)
+    return result
+
+
+async def summarize_batch_async(
+    items,
+    output_path,
+    concurrency=DEFAULT_CONCURRENCY,
+    resume=True,
+    model=None,
+    use_cache=True,
+    progress=None,
+):
+    """Summarizes many comparisons on the running event loop
+    Parameters:
+    - items (list): Dicts with team_name, opponent_name, comparison_df and an optional id
+    - output_path (str | Path): JSONL file results are appended to as they finish
+    - concurrency (int): Requests in flight at once
+    - resume (bool): Skip items that already succeeded in output_path
+    - model (str): Ollama model name, defaults to the configured model
+    - use_cache (bool): Use the summary cache
+    - progress (callable): Called with each result as it finishes
+    Returns:
+    - results (list): One result per item, in item order
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    previous = load_results(output_path) if resume else {}
+    done = {key: result for key, result in previous.items() if result["status"] == "ok"}
+    results = dict(done)
+
+    queue = asyncio.Queue()
+    for item in items:
+        if item_id(item) not in done:
+            queue.put_nowait(item)
+
+    with open(output_path, "a" if resume else "w") as output:
+        if resume and output.tell() and not _ends_with_newline(output_path):
+            # Ending a line cut off by a crash, so the next result starts on its own line
+            output.write("\n")
+
+        async def worker():
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                result = await _summarize_item(item, model, use_cache)
+                # Writing each result as soon as it is done so a crash loses nothing that finished
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+                results[result["id"]] = result
+                if progress is not None:
+                    progress(result)
+
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return [results[item_id(item)] for item in items]
+
+
+def summarize_batch(items, output_path, concurrency=DEFAULT_CONCURRENCY, **kwargs):
+    """Blocking wrapper around summarize_batch_async()
+    Parameters:
+    - See summarize_batch_async()
+    Returns:
+    - results (list): One result per item, in item order
+    """
+    return asyncio.run(
+        summarize_batch_async(items, output_path, concurrency=concurrency, **kwargs)
+    )
@@ -0,0 +1,236 @@
+"""Summary Cache for NBA-SHOT-SELECTION-LLM
+=====================================================
+Caches LLM summaries so asking the same question twice doesn't re-run the generation.
+
+- Entries are keyed on the system prompt, model, team, opponent and the comparison records rounded to
+  DEFAULT_DECIMALS, so float noise between two runs of the pipeline still hits the same entry
+- Entries live in their own ParquetCache (see pipelines/cache.py) under <cache root>/summaries,
+  which gives them a manifest, a ttl and LRU eviction by size
+- With a tolerance set, a miss falls back to the closest cached summary for the same prompt whose stats
+  all match within the tolerance (absolute for rates, relative for counts)
+
+Example:
+    cache = get_summary_cache()
+    summary = cache.get(SYSTEM_NBA_ANALYST, "llama2", "New York Knicks", "league", comparison_df)
+=====================================================
+"""
+
+import hashlib
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from pipelines.cache import ParquetCache, get_cache
+
+ENDPOINT = "LLMSummary"
+DEFAULT_DECIMALS = 3
+DEFAULT_MAX_BYTES = 64 * 1024**2  # 64 MB, summaries are a few KB each
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60  # A week, then the summary is regenerated
+
+
+def canonical_records(comparison_df, decimals=DEFAULT_DECIMALS):
+    """Rounds a comparison to a canonical, order independent list of records
+    Parameters:
+    - comparison_df (pd.DataFrame): Comparison from pipelines/transformation.py
+    - decimals (int): Decimals floats are rounded to
+    Returns:
+    - records (list): One dict per row, sorted by the row's text columns
+    """
+    text_columns = [
+        column
+        for column in comparison_df.columns
+        if not pd.api.types.is_numeric_dtype(comparison_df[column])
+    ]
+    ordered = comparison_df.sort_values(text_columns) if text_columns else comparison_df
+    records = []
+    for record in ordered.to_dict(orient="records"):
+        row = {}
+        for column, value in record.items():
+            if isinstance(value, (float, np.floating)):
+                value = None if math.isnan(value) else round(float(value), decimals)
+            elif isinstance(value, (int, np.integer)):
+                # to_dict() already gives python ints for int64 columns
+                value = int(value)
+            else:
+                value = value if value is None else str(value)
+            row[str(column)] = value
+        records.append(row)
+    return records
+
+
+def _digest(payload):
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()[:32]
+
+
+def _within_tolerance(records, other, tolerance):
+    # Same rows and columns, and every number close enough
+    if len(records) != len(other):
+        return False
+    for row, other_row in zip(records, other):
+        if row.keys() != other_row.keys():
+            return False
+        for column, value in row.items():
+            other_value = other_row[column]
+            if isinstance(value, (int, float)) and isinstance(
+                other_value, (int, float)
+            ):
+                if not math.isclose(
+                    value, other_value, rel_tol=tolerance, abs_tol=tolerance
+                ):
+                    return False
+            elif value != other_value:
+                return False
+    return True
+
+
+class SummaryCache:
+    """Persistent cache of LLM summaries keyed on the comparison they summarize
+    Parameters:
+    - root (str | Path): Directory of the entries, defaults to <cache root>/summaries
+    - max_bytes (int): Total size before the least recently used summaries are evicted
+    - ttl_seconds (int): Age after which a summary is regenerated
+    - decimals (int): Decimals the comparison is rounded to for the key
+    - tolerance (float): Enables near duplicate hits when set, ie: 0.01
+    """
+
+    def __init__(
+        self,
+        root=None,
+        max_bytes=DEFAULT_MAX_BYTES,
+        ttl_seconds=DEFAULT_TTL_SECONDS,
+        decimals=DEFAULT_DECIMALS,
+        tolerance=None,
+    ):
+        root = Path(root) if root else get_cache().root / "summaries"
+        self.store = ParquetCache(root, max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+        self.decimals = decimals
+        self.tolerance = tolerance
+
+    def params(self, system_prompt, model, team_name, opponent_name, comparison_df):
+        """Builds the cache parameters of a request
+        Returns:
+        - params (dict): prompt identifies everything but the stats, stats is the hash of the rounded records
+        - records (list): The canonical records
+        """
+        records = canonical_records(comparison_df, self.decimals)
+        prompt = _digest(
+            {
+                "system": system_prompt,
+                "model": model,
+                "team": team_name.strip().lower(),
+                "opponent": opponent_name.strip().lower(),
+            }
+        )
+        return {"prompt": prompt, "stats": _digest(records)}, records
+
+    def get(self, system_prompt, model, team_name, opponent_name, comparison_df):
+        """Returns the cached summary for a request
+        Parameters:
+        - system_prompt (str): System prompt the summary was generated with
+        - model (str): Ollama model name
+        - team_name (str): Team name
+        - opponent_name (str): Opponent name or "league"
+        - comparison_df (pd.DataFrame): Comparison that was summarized
+        Returns:
+        - (str | None) Cached summary, or None on a miss
+        """
+        params, records = self.params(
+            system_prompt, model, team_name, opponent_name, comparison_df
+        )
+        cached = self.store.get(ENDPOINT, params)
+        if cached is not None:
+            return cached["summary"].iloc[0]
+        if self.tolerance is None:
+            return None
+        return self._nearest(params, records)
+
+    def _nearest(self, params, records):
+        # Scanning the cached summaries of the same prompt for stats within the tolerance.
+        # Candidates are read straight from their parquet files, so looking at them doesn't count as
+        # a cache request or an access, only the summary that is returned gets both
+        manifest = self.store.load_manifest()
+        candidates = sorted(
+            (
+                (key, record)
+                for key, record in manifest.items()
+                if record.get("endpoint") == ENDPOINT
+                and record["params"].get("prompt") == params["prompt"]
+                and not self.store.is_expired(record)
+            ),
+            key=lambda item: item[1].get("last_access", 0),
+            reverse=True,
+        )
+        for key, record in candidates:
+            try:
+                cached = pd.read_parquet(self.store.entry_dir(key), columns=["records"])
+            except OSError:
+                # Evicted since the manifest was read
+                continue
+            if _within_tolerance(
+                records, json.loads(cached["records"].iloc[0]), self.tolerance
+            ):
+                hit = self.store.get(ENDPOINT, record["params"], columns=["summary"])
+                if hit is not None:
+                    return hit["summary"].iloc[0]
+        return None
+
+    def put(
+        self, system_prompt, model, team_name, opponent_name, comparison_df, summary
+    ):
+        """Stores a summary
+        Parameters:
+        - system_prompt, model, team_name, opponent_name, comparison_df: See get()
+        - summary (str): Generated summary
+        """
+        params, records = self.params(
+            system_prompt, model, team_name, opponent_name, comparison_df
+        )
+        entry = pd.DataFrame({"summary": [summary], "records": [json.dumps(records)]})
+        self.store.put(ENDPOINT, params, entry)
+
+    def clear(self):
+        """Removes every cached summary"""
+        self.store.clear()
+
+
+_default_cache = None
+
+
+def get_summary_cache():
+    """Returns the process wide summary cache, creating it on first use
+    Returns:
+    - (SummaryCache) Shared cache
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = SummaryCache()
+    return _default_cache
+
+
+def configure_summary_cache(
+    root=None,
+    max_bytes=DEFAULT_MAX_BYTES,
+    ttl_seconds=DEFAULT_TTL_SECONDS,
+    decimals=DEFAULT_DECIMALS,
+    tolerance=None,
+):
+    """Replaces the process wide summary cache, ie: to turn on near duplicate hits
+    Parameters:
+    - See SummaryCache
+    Returns:
+    - (SummaryCache) The new shared cache
+    """
+    global _default_cache
+    _default_cache = SummaryCache(
+        root=root,
+        max_bytes=max_bytes,
+        ttl_seconds=ttl_seconds,
+        decimals=decimals,
+        tolerance=tolerance,
+    )
+    return _default_cache
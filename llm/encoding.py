@@ -0,0 +1,121 @@
+"""Prompt Encoding for NBA-SHOT-SELECTION-LLM
+=====================================================
+Renders comparison dataframes as compact tables for the LLM prompt and keeps the prompt inside a token budget.
+
+- Columns are renamed to short stat names (FGA, FGM, FG%) with _team/_opp suffixes
+- Rates are written with a fixed number of decimals, counts as integers, one comma separated line per row
+- Prompt size is estimated from its length (CHARS_PER_TOKEN), and if the table doesn't fit the budget
+  the rows with the fewest attempts are dropped first, since they say the least about shot selection
+
+Example:
+    table, dropped = encode_comparison(comparison_df, max_tokens=300)
+=====================================================
+"""
+
+import numpy as np
+import pandas as pd
+
+# Rough average for English text and numbers with llama style tokenizers
+CHARS_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = 1024  # Whole prompt, system and user message together
+DEFAULT_DECIMALS = 3
+
+# Long column name parts and their short prompt names
+SHORT_NAMES = {
+    "attempts": "FGA",
+    "makes": "FGM",
+    "fg_pct": "FG%",
+    "efg_pct": "eFG%",
+    "pts_per_shot": "PPS",
+    "_opponent": "_opp",
+}
+
+
+def estimate_tokens(text):
+    """Estimates the number of tokens in a piece of text
+    Parameters:
+    - text (str): Prompt text
+    Returns:
+    - (int) Estimated token count
+    """
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def short_name(column):
+    # Shortens a comparison column name, ie: fg_pct_opponent -> FG%_opp
+    for long, short in SHORT_NAMES.items():
+        column = column.replace(long, short)
+    return column
+
+
+def format_table(comparison_df, decimals=DEFAULT_DECIMALS):
+    """Renders a comparison as a header line plus one comma separated line per row
+    Parameters:
+    - comparison_df (pd.DataFrame): Comparison from pipelines/transformation.py
+    - decimals (int): Decimals rates are written with
+    Returns:
+    - (str) Table text
+    """
+    columns = []
+    for column in comparison_df.columns:
+        values = comparison_df[column]
+        if pd.api.types.is_float_dtype(values) and not (
+            "attempts" in column or "makes" in column
+        ):
+            columns.append(
+                values.map(lambda v: "" if pd.isna(v) else f"{v:.{decimals}f}")
+            )
+        elif pd.api.types.is_numeric_dtype(values):
+            # Counts (league averages are summed as floats) are written as whole numbers
+            columns.append(
+                values.map(lambda v: "" if pd.isna(v) else str(int(round(v))))
+            )
+        else:
+            columns.append(values.astype(str))
+    header = ",".join(short_name(str(column)) for column in comparison_df.columns)
+    rows = [",".join(row) for row in zip(*columns)]
+    return "\n".join([header] + rows)
+
+
+def row_importance(comparison_df):
+    """Scores how informative each row is about the team, its team attempts. League and opponent attempts are
+    orders of magnitude larger, so they are only summed in when there is no attempts_team column
+    Parameters:
+    - comparison_df (pd.DataFrame): Comparison from pipelines/transformation.py
+    Returns:
+    - (np.ndarray) One score per row, higher is kept longer
+    """
+    if "attempts_team" in comparison_df.columns:
+        return comparison_df["attempts_team"].fillna(0).to_numpy(float)
+    attempt_columns = [c for c in comparison_df.columns if c.startswith("attempts")]
+    if not attempt_columns:
+        return np.zeros(len(comparison_df))
+    return comparison_df[attempt_columns].fillna(0).to_numpy(float).sum(axis=1)
+
+
+def encode_comparison(
+    comparison_df, max_tokens=None, decimals=DEFAULT_DECIMALS, min_rows=1
+):
+    """Renders a comparison as a compact table, dropping the least informative rows until it fits max_tokens
+    Parameters:
+    - comparison_df (pd.DataFrame): Comparison from pipelines/transformation.py
+    - max_tokens (int): Token budget for the table, None keeps every row
+    - decimals (int): Decimals rates are written with
+    - min_rows (int): Rows that are always kept, even over budget
+    Returns:
+    - table (str): Table text
+    - dropped (int): Number of rows left out
+    """
+    table = format_table(comparison_df, decimals)
+    if max_tokens is None or estimate_tokens(table) <= max_tokens:
+        return table, 0
+    # Removing rows from least to most important, keeping the remaining rows in their original order
+    order = np.argsort(row_importance(comparison_df), kind="stable")
+    keep = order
+    n_rows = len(comparison_df)
+    for dropped in range(1, max(n_rows - min_rows, 0) + 1):
+        keep = np.sort(order[dropped:])
+        table = format_table(comparison_df.iloc[keep], decimals)
+        if estimate_tokens(table) <= max_tokens:
+            break
+    return table, n_rows - len(keep)
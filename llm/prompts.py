@@ -7,4 +7,11 @@ Be clear and concise. Highlight:
 1. Where the team takes the most shots.
 2. Strengths and weaknesses compared to the opponent or league average.
 3. Any interesting patterns or strategic notes.
+
+Shot data is given as a comma separated table with one row per shot zone.
+FGA is attempts, FGM is makes and FG% is field goal percentage.
+Columns ending in _team are the team being analyzed, columns ending in _opp are the opponent or league average.
 """
+
+# The system prompts above never change between requests, so the server can reuse their cached prefix.
+# Everything request specific goes in the user message.
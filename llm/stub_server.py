@@ -0,0 +1,138 @@
+"""Stub Ollama Server for NBA-SHOT-SELECTION-LLM
+=====================================================
+A tiny stand-in for the Ollama chat api, for exercising the LLM code without a model.
+
+POST /api/chat answers every request with a canned summary, streamed one word at a time as
+newline delimited json when "stream" is true, with a configurable delay before the first word
+(prefill) and between words (generation). Everything else returns 404.
+
+Run it and point the summarizer at it:
+    >> py -m llm.stub_server --port 11435 --first-token-delay 0.2 --token-delay 0.01
+    OLLAMA_HOST=http://127.0.0.1:11435 py app/cli_bot.py
+=====================================================
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 11435
+CANNED_SUMMARY = (
+    "The team takes most of its shots at the rim and above the break. "
+    "It converts better than its opponent in the paint but trails from the corners. "
+    "More corner threes would raise its expected points per shot."
+)
+
+
+def make_handler(first_token_delay=0.0, token_delay=0.0, summary=CANNED_SUMMARY):
+    """Builds a request handler class with the given timings
+    Parameters:
+    - first_token_delay (float): Seconds before the first word, like prompt processing
+    - token_delay (float): Seconds between words, like generation
+    - summary (str): Response text
+    Returns:
+    - (type) BaseHTTPRequestHandler subclass
+    """
+
+    class StubChatHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path != "/api/chat":
+                self.send_error(404)
+                return
+            request = json.loads(body or b"{}")
+            model = request.get("model", "stub")
+            prompt_chars = sum(
+                len(m.get("content", "")) for m in request.get("messages", [])
+            )
+            words = [word + " " for word in summary.split(" ")]
+            time.sleep(first_token_delay)
+            if request.get("stream", True):
+                lines = []
+                for word in words:
+                    lines.append(self._chunk(model, word, done=False))
+                lines.append(self._chunk(model, "", True, len(words), prompt_chars))
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i, line in enumerate(lines):
+                    if i and i < len(lines) - 1:
+                        time.sleep(token_delay)
+                    data = (json.dumps(line) + "\n").encode("utf-8")
+                    self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+            else:
+                time.sleep(token_delay * len(words))
+                data = json.dumps(
+                    self._chunk(model, "".join(words), True, len(words), prompt_chars)
+                ).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        def _chunk(self, model, content, done, eval_count=0, prompt_chars=0):
+            chunk = {
+                "model": model,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "message": {"role": "assistant", "content": content},
+                "done": done,
+            }
+            if done:
+                # Same fields a real server reports at the end, with made up token counts
+                chunk.update(
+                    {
+                        "done_reason": "stop",
+                        "prompt_eval_count": prompt_chars // 4,
+                        "prompt_eval_duration": int(first_token_delay * 1e9),
+                        "eval_count": eval_count,
+                        "eval_duration": int(token_delay * eval_count * 1e9),
+                    }
+                )
+            return chunk
+
+        def log_message(self, *args):
+            # Keeping test and benchmark output quiet
+            pass
+
+    return StubChatHandler
+
+
+def start_stub_server(port=0, first_token_delay=0.0, token_delay=0.0):
+    """Starts the stub server on a background thread
+    Parameters:
+    - port (int): Port to listen on, 0 picks a free one
+    - first_token_delay (float): Seconds before the first word
+    - token_delay (float): Seconds between words
+    Returns:
+    - server (ThreadingHTTPServer): Running server, call server.shutdown() to stop it
+    - host (str): Url to pass as the Ollama host
+    """
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", port), make_handler(first_token_delay, token_delay)
+    )
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Stub Ollama chat server")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--first-token-delay", type=float, default=0.0)
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", args.port),
+        make_handler(args.first_token_delay, args.token_delay),
+    )
+    print(f"Stub Ollama server on http://127.0.0.1:{args.port}")
+    server.serve_forever()
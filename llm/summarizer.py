@@ -1,7 +1,86 @@
-import ollama
+import asyncio
+import os
+import time
+
+from llm.cache import get_summary_cache
+from llm.encoding import DEFAULT_TOKEN_BUDGET, encode_comparison, estimate_tokens
 from llm.prompts import SYSTEM_NBA_ANALYST
-from pipelines.transformation import compare_to_league
-import pandas as pd
+from pipelines import metrics
+
+# Model settings, overridable with environment variables or configure_client()
+DEFAULT_MODEL = os.environ.get("OLLAMA_MODEL", "llama2")
+# None lets ollama use http://localhost:11434
+DEFAULT_HOST = os.environ.get("OLLAMA_HOST")
+# Seconds to wait on the server, covers loading the model on a cold start
+DEFAULT_TIMEOUT = 120.0
+DEFAULT_KEEP_ALIVE = "30m"  # How long the server keeps the model loaded after a request
+
+_client = None
+_async_clients = {}
+_settings = {
+    "model": DEFAULT_MODEL,
+    "host": DEFAULT_HOST,
+    "timeout": DEFAULT_TIMEOUT,
+    "keep_alive": DEFAULT_KEEP_ALIVE,
+    "token_budget": DEFAULT_TOKEN_BUDGET,
+}
+
+
+def configure_client(
+    model=None, host=None, timeout=None, keep_alive=None, token_budget=None
+):
+    """Changes the model settings, the next request opens a new client with them
+    Parameters:
+    - model (str): Ollama model name, ie: llama2
+    - host (str): Ollama server url
+    - timeout (float): Seconds to wait on the server
+    - keep_alive (str | float): How long the model stays loaded between requests, ie: "30m", -1 for forever
+    - token_budget (int): Estimated prompt tokens, low volume zones are left out of the prompt to stay under it
+    """
+    global _client
+    _async_clients.clear()
+    updates = {
+        "model": model,
+        "host": host,
+        "timeout": timeout,
+        "keep_alive": keep_alive,
+        "token_budget": token_budget,
+    }
+    _settings.update(
+        {key: value for key, value in updates.items() if value is not None}
+    )
+    _client = None
+
+
+def get_client():
+    """Returns the shared Ollama client, its http connection pool is reused across requests
+    Returns:
+    - (ollama.Client) Client for the configured host
+    """
+    global _client
+    if _client is None:
+        # ollama (httpx, pydantic) is only imported once a summary is actually requested
+        import ollama
+
+        _client = ollama.Client(host=_settings["host"], timeout=_settings["timeout"])
+    return _client
+
+
+def get_async_client():
+    """Returns the Ollama async client for the running event loop, shared by every request on that loop
+    Returns:
+    - (ollama.AsyncClient) Client for the configured host
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        # Async connection pools belong to one event loop, so each loop gets its own client
+        import ollama
+
+        _async_clients.clear()
+        _async_clients[loop] = ollama.AsyncClient(
+            host=_settings["host"], timeout=_settings["timeout"]
+        )
+    return _async_clients[loop]
 
 
 def stats_to_dict(comparison_df):
@@ -14,30 +93,205 @@ def stats_to_dict(comparison_df):
     return comparison_df.to_dict(orient="records")
 
 
-def summarize_comparison(team_name, opponent_name, comparison_df):
+def build_messages(team_name, opponent_name, comparison_df, token_budget=None):
+    """Builds the chat messages for a comparison
+    Parameters:
+    - team_name (str): User submitted full team name
+    - opponent_name (str): User submitted full opponent name, or "league"
+    - comparison_df (pd.DataFrame): Comparison of shot chart data between the team and opponent
+    - token_budget (int): Estimated token limit for the whole prompt, defaults to the configured budget
+    Returns:
+    - messages (list): System and user messages for ollama.chat
+    """
+    opponent = (
+        "the league average" if opponent_name.lower() == "league" else opponent_name
+    )
+    intro = (
+        f"Analyze the {team_name}'s shot selection compared to {opponent}.\n"
+        "Here is the shot zone data:\n"
+    )
+    outro = (
+        "\n\nPlease provide a clear summary of where the team excelled or struggled."
+    )
+    # Whatever the system prompt and instructions don't use of the budget is left for the table
+    token_budget = token_budget or _settings["token_budget"]
+    table_budget = token_budget - estimate_tokens(SYSTEM_NBA_ANALYST + intro + outro)
+    table, dropped = encode_comparison(comparison_df, max_tokens=table_budget)
+    if dropped:
+        table += f"\n({dropped} low volume zones left out)"
+    return [
+        {"role": "system", "content": SYSTEM_NBA_ANALYST},
+        {"role": "user", "content": intro + table + outro},
+    ]
+
+
+class _StreamTimer:
+    """Times a streamed summary for its llm.summary span. The clock is paused while a piece is with the
+    consumer, so the span only counts time spent on the request and the stream
+    """
+
+    def __init__(self, model):
+        self.span = metrics.Span("llm.summary", {"model": model})
+        self.started_at = time.time()
+        self.busy = 0.0
+        self.resumed = time.perf_counter()
+        self.first_token_seconds = None
+
+    def elapsed(self):
+        if self.resumed is None:
+            return self.busy
+        return self.busy + time.perf_counter() - self.resumed
+
+    def pause(self):
+        self.busy, self.resumed = self.elapsed(), None
+
+    def resume(self):
+        self.resumed = time.perf_counter()
+
+    def record_usage(self, chunk):
+        """Records the token counts Ollama reports on its final chunk
+        Parameters:
+        - chunk (ollama.ChatResponse): Final chunk, durations are in nanoseconds
+        """
+        completion_tokens = chunk.get("eval_count") or 0
+        eval_seconds = (chunk.get("eval_duration") or 0) / 1e9
+        if not eval_seconds and self.first_token_seconds is not None:
+            # Falling back to our own clock when the server doesn't report durations
+            eval_seconds = self.elapsed() - self.first_token_seconds
+        self.span.set(
+            prompt_tokens=chunk.get("prompt_eval_count") or 0,
+            completion_tokens=completion_tokens,
+            prefill_seconds=(chunk.get("prompt_eval_duration") or 0) / 1e9,
+            generation_seconds=eval_seconds,
+        )
+        if self.first_token_seconds is not None:
+            self.span.set(first_token_seconds=self.first_token_seconds)
+        if eval_seconds:
+            self.span.set(tokens_per_second=completion_tokens / eval_seconds)
+
+    def piece(self):
+        # Called right before a piece is yielded
+        if self.first_token_seconds is None:
+            self.first_token_seconds = self.elapsed()
+        self.pause()
+
+    def finish(self, error=None):
+        self.pause()
+        self.span.seconds, self.span.error = self.busy, error
+        metrics.record_span(self.span, self.started_at)
+
+
+def stream_comparison(
+    team_name, opponent_name, comparison_df, model=None, use_cache=True
+):
+    """Streams the LLM summary of a comparison as it is generated
+    Parameters:
+    - team_name (str): User submitted full team name
+    - opponent_name (str): User submitted full opponent name, or "league"
+    - comparison_df (pd.DataFrame): Comparison of shot chart data between the team and opponent
+    - model (str): Ollama model name, defaults to the configured model
+    - use_cache (bool): Return a cached summary of the same comparison instead of generating it (see llm/cache.py)
+    Yields:
+    - (str) Pieces of the response as the server produces them, or the whole cached summary at once
+    """
+    model = model or _settings["model"]
+    cache_args = (SYSTEM_NBA_ANALYST, model, team_name, opponent_name, comparison_df)
+    if use_cache:
+        cached = get_summary_cache().get(*cache_args)
+        if cached is not None:
+            yield cached
+            return
+
+    # Not a metrics.span(), it would stay open across the yields below
+    timer, error = _StreamTimer(model), None
+    try:
+        stream = get_client().chat(
+            model=model,
+            messages=build_messages(team_name, opponent_name, comparison_df),
+            stream=True,
+            keep_alive=_settings["keep_alive"],
+        )
+        pieces = []
+        for chunk in stream:
+            content = chunk["message"]["content"]
+            if content:
+                pieces.append(content)
+                timer.piece()
+                yield content
+                timer.resume()
+            if chunk.get("done"):
+                timer.record_usage(chunk)
+    except Exception as exc:
+        error = type(exc).__name__
+        raise
+    finally:
+        timer.finish(error)
+    # Only a fully streamed summary is cached, an interrupted one is regenerated next time
+    if use_cache:
+        get_summary_cache().put(*cache_args, "".join(pieces))
+
+
+async def astream_comparison(
+    team_name, opponent_name, comparison_df, model=None, use_cache=True
+):
+    """Async version of stream_comparison(), for running many summaries on one event loop
+    Parameters:
+    - See stream_comparison()
+    Yields:
+    - (str) Pieces of the response as the server produces them, or the whole cached summary at once
+    """
+    model = model or _settings["model"]
+    cache_args = (SYSTEM_NBA_ANALYST, model, team_name, opponent_name, comparison_df)
+    if use_cache:
+        # The cache reads and writes parquet and its manifest, that runs off the event loop
+        cached = await asyncio.to_thread(get_summary_cache().get, *cache_args)
+        if cached is not None:
+            yield cached
+            return
+
+    # The timer also keeps other coroutines on the loop out of the span, see stream_comparison()
+    timer, error = _StreamTimer(model), None
+    try:
+        stream = await get_async_client().chat(
+            model=model,
+            messages=build_messages(team_name, opponent_name, comparison_df),
+            stream=True,
+            keep_alive=_settings["keep_alive"],
+        )
+        pieces = []
+        async for chunk in stream:
+            content = chunk["message"]["content"]
+            if content:
+                pieces.append(content)
+                timer.piece()
+                yield content
+                timer.resume()
+            if chunk.get("done"):
+                timer.record_usage(chunk)
+    except Exception as exc:
+        error = type(exc).__name__
+        raise
+    finally:
+        timer.finish(error)
+    if use_cache:
+        await asyncio.to_thread(get_summary_cache().put, *cache_args, "".join(pieces))
+
+
+def summarize_comparison(
+    team_name, opponent_name, comparison_df, model=None, use_cache=True
+):
     """Send structured stats to LLM and get a natural language summary.
     Parameters:
     - team_name (str): User submitted full team name
     - opponent_name (str): User submitted full opponent name. Can also be "league" for the league average information
     - comparison_df (pd.DataFrame): Dataframe of the comparison of shot chart data between the selected team and selected opponent
+    - model (str): Ollama model name, defaults to the configured model
+    - use_cache (bool): Return a cached summary of the same comparison instead of generating it
     Returns:
     - Response from the LLM after it has been provided the user prompt and its role as NBA Analyst
     """
-    # Converts the comparison dataframe to a dictionary
-    stats_data = stats_to_dict(comparison_df)
-    # Initializing a prompt to feed the LLM
-    user_prompt = (
-        f"Analyze the {team_name}'s shot selection compared to "
-        f"{'the league average' if opponent_name.lower() == 'league' else opponent_name}.\n"
-        f"Here is the shot zone data:\n{stats_data}\n\n"
-        "Please provide a clear summary of where the team excelled or struggled."
-    )
-    # Feeding the LLM the role and prompt, then getting the response
-    response = ollama.chat(
-        model="llama2",
-        messages=[
-            {"role": "system", "content": SYSTEM_NBA_ANALYST},
-            {"role": "user", "content": user_prompt},
-        ],
+    return "".join(
+        stream_comparison(
+            team_name, opponent_name, comparison_df, model=model, use_cache=use_cache
+        )
     )
-    return response["message"]["content"]
@@ -0,0 +1,239 @@
+"""Shot Aggregation Engine for NBA-SHOT-SELECTION-LLM
+=====================================================
+Aggregates shots for any combination of grouping keys in one pass with NumPy bincount.
+
+Every key column is turned into integer codes (categorical codes, or pd.factorize for anything else),
+the codes are combined into one flat cell index, and attempts/makes/points are summed per cell with
+np.bincount. The result is a ShotCube that can be rolled up to fewer keys or sliced to specific
+values without going back to the shots.
+
+Supported keys are any shot chart column (ie: SHOT_ZONE_BASIC, SHOT_ZONE_AREA, SHOT_ZONE_RANGE,
+PLAYER_NAME, PLAYER_ID, TEAM_ID, GAME_ID, PERIOD) plus TIME_BUCKET, which is derived from
+MINUTES_REMAINING.
+
+Example:
+    cube = build_cube(team_shots, ["PLAYER_NAME", "SHOT_ZONE_BASIC", "PERIOD"])
+    by_zone = cube.rollup(["SHOT_ZONE_BASIC"]).to_frame()
+    fourth_quarter = cube.slice(PERIOD=4).rollup(["PLAYER_NAME"]).to_frame()
+=====================================================
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Zones where every shot is worth 3, used when a frame has no SHOT_TYPE column (ie: league averages)
+THREE_POINT_ZONES = {
+    "Above the Break 3",
+    "Left Corner 3",
+    "Right Corner 3",
+    "Backcourt",
+}
+
+# Minutes remaining in the period, bucketed into [0, 3), [3, 6), [6, 9), [9, 12]
+TIME_BUCKET_EDGES = [3, 6, 9]
+TIME_BUCKET_LABELS = ["0-2 min", "3-5 min", "6-8 min", "9-12 min"]
+
+# Above this many possible cells the cube is built from the distinct cells present instead of a dense array
+DENSE_CELL_LIMIT = 2**24
+
+METRICS = ["attempts", "makes", "fg_pct", "efg_pct", "pts_per_shot"]
+
+
+@dataclass
+class ShotCube:
+    """Sparse cube of shot totals, one entry per combination of key values that has at least one attempt
+    Attributes:
+    - keys (list): Grouping key names, one per dimension
+    - levels (list): pd.Index of the values of each key, codes index into these
+    - cells (np.ndarray): Flat cell index of each entry into the dense shape
+    - attempts / makes / points (np.ndarray): Totals per entry
+    """
+
+    keys: list
+    levels: list
+    cells: np.ndarray
+    attempts: np.ndarray
+    makes: np.ndarray
+    points: np.ndarray
+
+    @property
+    def shape(self):
+        return tuple(len(level) for level in self.levels)
+
+    def coords(self):
+        """Returns the code of every key for every entry
+        Returns:
+        - (tuple) One array of codes per key
+        """
+        if not self.keys:
+            return ()
+        return np.unravel_index(self.cells, self.shape)
+
+    def _aggregate(self, codes, levels, keys, mask=None):
+        # Re-summing the existing totals onto a smaller set of cells, the shots are never touched again
+        attempts, makes, points = self.attempts, self.makes, self.points
+        if mask is not None:
+            codes = [c[mask] for c in codes]
+            attempts, makes, points = attempts[mask], makes[mask], points[mask]
+        shape = tuple(len(level) for level in levels)
+        flat = (
+            np.ravel_multi_index(codes, shape)
+            if keys
+            else np.zeros(len(attempts), dtype=np.int64)
+        )
+        cells, inverse = np.unique(flat, return_inverse=True)
+        return ShotCube(
+            keys=list(keys),
+            levels=list(levels),
+            cells=cells,
+            attempts=np.bincount(inverse, weights=attempts, minlength=len(cells)),
+            makes=np.bincount(inverse, weights=makes, minlength=len(cells)),
+            points=np.bincount(inverse, weights=points, minlength=len(cells)),
+        )
+
+    def rollup(self, keys):
+        """Sums the cube down to a subset of its keys
+        Parameters:
+        - keys (list): Keys to keep, an empty list gives the grand total
+        Returns:
+        - (ShotCube) Rolled up cube
+        """
+        missing = [key for key in keys if key not in self.keys]
+        if missing:
+            raise KeyError(f"Keys {missing} are not in the cube, it has {self.keys}")
+        coords = self.coords()
+        positions = [self.keys.index(key) for key in keys]
+        return self._aggregate(
+            [coords[p] for p in positions], [self.levels[p] for p in positions], keys
+        )
+
+    def slice(self, **selections):
+        """Keeps only the entries matching the given key values, the cube keeps all of its keys
+        Parameters:
+        - selections: key=value or key=[values], ie: cube.slice(PERIOD=4, PLAYER_NAME=["Jalen Brunson"])
+        Returns:
+        - (ShotCube) Sliced cube
+        """
+        coords = self.coords()
+        mask = np.ones(len(self.cells), dtype=bool)
+        for key, values in selections.items():
+            if key not in self.keys:
+                raise KeyError(f"Key '{key}' is not in the cube, it has {self.keys}")
+            position = self.keys.index(key)
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            wanted = self.levels[position].get_indexer(list(values))
+            mask &= np.isin(coords[position], wanted[wanted >= 0])
+        return self._aggregate(list(coords), self.levels, self.keys, mask=mask)
+
+    def to_frame(self, metrics=None):
+        """Converts the cube to a dataframe with one row per entry, sorted by the keys
+        Parameters:
+        - metrics (list): Subset of METRICS to include, defaults to all of them
+        Returns:
+        - frame (pd.DataFrame): Key columns followed by the requested metrics
+        """
+        metrics = metrics or METRICS
+        coords = self.coords()
+        frame = pd.DataFrame(
+            {
+                key: np.asarray(level)[codes]
+                for key, level, codes in zip(self.keys, self.levels, coords)
+            }
+        )
+        attempts = self.attempts
+        # Dividing by attempts only where there are attempts, empty cells are dropped when the cube is built
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = {
+                "attempts": attempts.astype(np.int64),
+                "makes": self.makes.astype(np.int64),
+                "fg_pct": self.makes / attempts,
+                "efg_pct": self.points / (2 * attempts),
+                "pts_per_shot": self.points / attempts,
+            }
+        for metric in metrics:
+            frame[metric] = values[metric]
+        return frame
+
+
+def _encode(df, key):
+    # Returns integer codes (-1 for missing) and the values they point to for one key
+    if key == "TIME_BUCKET" and key not in df.columns:
+        codes = np.digitize(df["MINUTES_REMAINING"].to_numpy(), TIME_BUCKET_EDGES)
+        return codes.astype(np.int64), pd.Index(TIME_BUCKET_LABELS)
+    column = df[key]
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy().astype(np.int64), column.cat.categories
+    codes, levels = pd.factorize(column, sort=True)
+    return codes.astype(np.int64), pd.Index(levels)
+
+
+def _shot_points(df, makes):
+    # Points per make: 3 for three pointers, 2 otherwise
+    if "SHOT_TYPE" in df.columns:
+        is_three = (df["SHOT_TYPE"] == "3PT Field Goal").to_numpy()
+    else:
+        is_three = df["SHOT_ZONE_BASIC"].isin(THREE_POINT_ZONES).to_numpy()
+    return makes * np.where(is_three, 3, 2)
+
+
+def build_cube(df, keys, attempts_col=None, makes_col="SHOT_MADE_FLAG"):
+    """Aggregates shots for a set of grouping keys in a single pass
+    Parameters:
+    - df (pd.DataFrame): Shot chart rows, or pre-aggregated rows such as league averages
+    - keys (list): Grouping keys, see the module docstring
+    - attempts_col (str): Column holding attempts per row, None means every row is one attempt
+    - makes_col (str): Column holding makes per row, ie: SHOT_MADE_FLAG or FGM
+    Returns:
+    - (ShotCube) Totals for every combination of key values present in df
+    """
+    keys = list(keys)
+    encoded = [_encode(df, key) for key in keys]
+    codes = [c for c, _ in encoded]
+    levels = [level for _, level in encoded]
+    attempts = (
+        np.ones(len(df)) if attempts_col is None else df[attempts_col].to_numpy(float)
+    )
+    makes = df[makes_col].to_numpy(float)
+    points = _shot_points(df, makes)
+
+    # Dropping rows with a missing key value
+    valid = np.ones(len(df), dtype=bool)
+    for c in codes:
+        valid &= c >= 0
+    if not valid.all():
+        codes = [c[valid] for c in codes]
+        attempts, makes, points = attempts[valid], makes[valid], points[valid]
+
+    shape = tuple(len(level) for level in levels)
+    flat = (
+        np.ravel_multi_index(codes, shape)
+        if keys
+        else np.zeros(len(attempts), dtype=np.int64)
+    )
+    size = int(np.prod(shape, dtype=np.int64))
+    if size <= DENSE_CELL_LIMIT:
+        # Small key spaces: bincount straight into a dense array and keep the cells with attempts
+        dense_attempts = np.bincount(flat, weights=attempts, minlength=size)
+        cells = np.flatnonzero(dense_attempts)
+        dense_makes = np.bincount(flat, weights=makes, minlength=size)
+        dense_points = np.bincount(flat, weights=points, minlength=size)
+        return ShotCube(
+            keys=keys,
+            levels=levels,
+            cells=cells,
+            attempts=dense_attempts[cells],
+            makes=dense_makes[cells],
+            points=dense_points[cells],
+        )
+    # Large key spaces (ie: player x game x zone x area): bincount over the distinct cells only
+    cells, inverse = np.unique(flat, return_inverse=True)
+    return ShotCube(
+        keys=keys,
+        levels=levels,
+        cells=cells,
+        attempts=np.bincount(inverse, weights=attempts, minlength=len(cells)),
+        makes=np.bincount(inverse, weights=makes, minlength=len(cells)),
+        points=np.bincount(inverse, weights=points, minlength=len(cells)),
+    )
@@ -0,0 +1,201 @@
+"""League Baseline Index for NBA-SHOT-SELECTION-LLM
+=====================================================
+Precomputed zone level attempts/makes for the league and every team in a season and season type,
+so comparisons are a lookup instead of a fresh ingest and groupby.
+
+Built once from the league shot store (pipelines/store.py) and saved next to it:
+
+    <store root>/baselines/SEASON=2024-25/SEASON_TYPE=Playoffs/
+        index.json     zone names, team ids and team names for the rows and columns, and the current version
+        v<build>/
+            attempts.npy   (1 + teams) x zones, row 0 is the league
+            makes.npy      same shape
+
+The arrays are memory mapped when loaded, so opening an index costs almost nothing. Each build goes to a
+new version directory, an index that is still mapped is never overwritten.
+
+Example:
+    build_baseline("2024-25", "Playoffs")
+    index = load_baseline("2024-25", "Playoffs")
+    celtics = index.summary("Boston Celtics")
+=====================================================
+"""
+
+import json
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from pipelines import store
+from pipelines.aggregate import build_cube
+
+LEAGUE = "league"
+
+# Loaded indexes, keyed on directory and index modification time so a rebuild is picked up
+_loaded = {}
+
+
+@dataclass
+class BaselineIndex:
+    """Zone totals for the league (row 0) and every team (rows 1..n)
+    Attributes:
+    - zones (list): SHOT_ZONE_BASIC values, one per column
+    - team_ids (list): Team id of each team row
+    - team_names (list): Team name of each team row
+    - attempts / makes (np.ndarray): (1 + teams) x zones totals, memory mapped when loaded from disk
+    """
+
+    zones: list
+    team_ids: list
+    team_names: list
+    attempts: np.ndarray
+    makes: np.ndarray
+
+    def row(self, team):
+        """Finds the row for a team name, team id, or "league"
+        Returns:
+        - (int) Row number into attempts/makes
+        """
+        if isinstance(team, str) and team.strip().lower() == LEAGUE:
+            return 0
+        if team in self.team_ids:
+            return 1 + self.team_ids.index(team)
+        if team in self.team_names:
+            return 1 + self.team_names.index(team)
+        raise KeyError(f"Team '{team}' is not in the baseline index")
+
+    def summary(self, team=LEAGUE):
+        """Zone summary for the league or a team, same shape as summarize_team_shots()
+        Parameters:
+        - team (str | int): "league", a full team name, or a team id
+        Returns:
+        - summary (pd.DataFrame): SHOT_ZONE_BASIC, attempts, makes, fg_pct for zones with attempts
+        """
+        row = self.row(team)
+        attempts = np.asarray(self.attempts[row])
+        makes = np.asarray(self.makes[row])
+        keep = attempts > 0
+        summary = pd.DataFrame(
+            {
+                "SHOT_ZONE_BASIC": np.asarray(self.zones, dtype=object)[keep],
+                "attempts": attempts[keep].astype(np.int64),
+                "makes": makes[keep].astype(np.int64),
+            }
+        )
+        summary["fg_pct"] = summary["makes"] / summary["attempts"]
+        return summary
+
+
+def baseline_dir(season, season_type, root=None):
+    """Directory of a season/season type's baseline index
+    Returns:
+    - (Path) Index directory
+    """
+    return store.partition_dir("baselines", season, season_type.title(), root=root)
+
+
+def build_baseline(season="2024-25", season_type="Playoffs", root=None):
+    """Builds and saves the baseline index for a season and season type from the league shot store
+    Parameters:
+    - season (str): Season year string
+    - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    - root (str | Path): Store root directory
+    Returns:
+    - (BaselineIndex) The index that was saved
+    """
+    shots = store.read_team_shots(
+        season,
+        season_type,
+        columns=["TEAM_ID", "TEAM_NAME", "SHOT_ZONE_BASIC", "SHOT_MADE_FLAG"],
+        root=root,
+    )
+    if shots is None:
+        raise ValueError(
+            f"No shots stored for {season} {season_type}, run store.ingest_league() first"
+        )
+    league_avg = store.read_league_averages(season, season_type, root=root)
+
+    # One pass over the league's shots for every team x zone total
+    team_cube = build_cube(shots, ["TEAM_ID", "SHOT_ZONE_BASIC"])
+    team_totals = team_cube.to_frame(["attempts", "makes"])
+    zones = sorted(set(team_totals["SHOT_ZONE_BASIC"]))
+    if league_avg is not None:
+        league_totals = build_cube(
+            league_avg, ["SHOT_ZONE_BASIC"], attempts_col="FGA", makes_col="FGM"
+        ).to_frame(["attempts", "makes"])
+        zones = sorted(set(zones) | set(league_totals["SHOT_ZONE_BASIC"]))
+    else:
+        # Without stored league averages the league row is the sum of every team
+        league_totals = team_cube.rollup(["SHOT_ZONE_BASIC"]).to_frame(
+            ["attempts", "makes"]
+        )
+
+    team_names = (
+        shots.drop_duplicates("TEAM_ID")
+        .set_index("TEAM_ID")["TEAM_NAME"]
+        .astype(str)
+        .sort_index()
+    )
+    team_ids = [int(team_id) for team_id in team_names.index]
+
+    # Scattering the long totals into the (1 + teams) x zones matrices
+    zone_position = {zone: i for i, zone in enumerate(zones)}
+    team_position = {team_id: i + 1 for i, team_id in enumerate(team_ids)}
+    attempts = np.zeros((1 + len(team_ids), len(zones)))
+    makes = np.zeros_like(attempts)
+    rows = team_totals["TEAM_ID"].map(team_position).to_numpy()
+    columns = team_totals["SHOT_ZONE_BASIC"].map(zone_position).to_numpy()
+    attempts[rows, columns] = team_totals["attempts"].to_numpy()
+    makes[rows, columns] = team_totals["makes"].to_numpy()
+    league_columns = league_totals["SHOT_ZONE_BASIC"].map(zone_position).to_numpy()
+    attempts[0, league_columns] = league_totals["attempts"].to_numpy()
+    makes[0, league_columns] = league_totals["makes"].to_numpy()
+
+    index_dir = baseline_dir(season, season_type, root=root)
+    version_dir = store.new_version_dir(index_dir)
+    np.save(version_dir / "attempts.npy", attempts)
+    np.save(version_dir / "makes.npy", makes)
+    store.publish_version(
+        index_dir,
+        version_dir,
+        {
+            "season": season,
+            "season_type": season_type.title(),
+            "zones": zones,
+            "team_ids": team_ids,
+            "team_names": team_names.tolist(),
+        },
+    )
+    print(f"Built baseline index for {len(team_ids)} teams: {index_dir}")
+    return BaselineIndex(zones, team_ids, team_names.tolist(), attempts, makes)
+
+
+def load_baseline(season="2024-25", season_type="Playoffs", root=None):
+    """Loads a baseline index, memory mapping its arrays
+    Parameters:
+    - season (str): Season year string
+    - season_type (str): Time of season
+    - root (str | Path): Store root directory
+    Returns:
+    - (BaselineIndex | None) The index, or None if it hasn't been built
+    """
+    index_dir = baseline_dir(season, season_type, root=root)
+    index_path = index_dir / "index.json"
+    if not index_path.exists():
+        return None
+    cache_key = (str(index_dir), index_path.stat().st_mtime_ns)
+    if cache_key not in _loaded:
+        meta = json.loads(index_path.read_text())
+        # Dropping the index a rebuild replaced
+        for stale in [key for key in _loaded if key[0] == str(index_dir)]:
+            del _loaded[stale]
+        version_dir = store.version_path(index_dir, meta)
+        _loaded[cache_key] = BaselineIndex(
+            zones=meta["zones"],
+            team_ids=meta["team_ids"],
+            team_names=meta["team_names"],
+            attempts=np.load(version_dir / "attempts.npy", mmap_mode="r"),
+            makes=np.load(version_dir / "makes.npy", mmap_mode="r"),
+        )
+    return _loaded[cache_key]
@@ -0,0 +1,358 @@
+"""Parquet Cache for NBA-SHOT-SELECTION-LLM
+=====================================================
+Caches api results as parquet so repeat requests don't go back to the nba api.
+
+- Entries are keyed on a hash of the endpoint, every request parameter and SCHEMA_VERSION,
+  so changing any parameter (ie: num_players) or the stored schema can never return the wrong data
+- Each entry is a directory of parquet part files under one root directory
+- manifest.json records the fetch time, row count, bytes and source endpoint of every entry
+- Entries for an in-progress season expire after a ttl, entries for a finished season never expire
+- New rows can be appended to an entry as extra part files (see ParquetCache.append)
+- When the cache grows past max_bytes the least recently used entries are evicted
+
+The root defaults to <repo>/data/cache and can be moved with the NBA_SHOT_CACHE_DIR environment variable
+or configure_cache(root=...).
+
+Example:
+    cache = get_cache()
+    df = cache.get_or_fetch("ShotChartLeagueWide", {"season": "2024-25"}, fetch_fn)
+=====================================================
+"""
+
+import datetime as dt
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from pipelines import metrics
+
+# Bump whenever the layout or dtypes of cached frames change so old entries are never read back
+SCHEMA_VERSION = 2
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_CACHE_ROOT = REPO_ROOT / "data" / "cache"
+DEFAULT_MAX_BYTES = 2 * 1024**3  # 2 GB
+DEFAULT_TTL_SECONDS = 12 * 60 * 60  # In-progress seasons are refreshed twice a day
+MANIFEST_NAME = "manifest.json"
+
+# (Calendar year, month, day) after which a season type is over. The year is 0 for the first year of the
+# season string and 1 for the second, ie: 2024-25 pre season ends 2024-11-01 and its playoffs 2025-07-01
+SEASON_TYPE_END = {
+    "pre season": (0, 11, 1),
+    "regular season": (1, 5, 1),
+    "all star": (1, 5, 1),
+    "playoffs": (1, 7, 1),
+}
+
+
+def make_key(endpoint, params):
+    """Builds the cache key for an endpoint and its request parameters
+    Parameters:
+    - endpoint (str): Name of the source endpoint, ie: ShotChartDetail
+    - params (dict): Every parameter that changes the result of the request
+    Returns:
+    - (str) Hex digest that identifies the entry
+    """
+    payload = json.dumps(
+        {"endpoint": endpoint, "params": params, "schema_version": SCHEMA_VERSION},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def season_is_complete(season, season_type="Regular Season", today=None):
+    """Checks whether a season and season type has finished, meaning its data will not change anymore
+    Parameters:
+    - season (str): Season year string, ie: 2024-25
+    - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    - today (dt.date): Date to check against, defaults to today
+    Returns:
+    - (bool) True if the season type is over
+    """
+    today = today or dt.date.today()
+    try:
+        first_year = int(str(season)[:4])
+    except ValueError:
+        return False
+    year, month, day = SEASON_TYPE_END.get(
+        str(season_type).strip().lower(), SEASON_TYPE_END["playoffs"]
+    )
+    return today >= dt.date(first_year + year, month, day)
+
+
+class ParquetCache:
+    """Content addressed parquet cache with a manifest, ttl expiry and LRU eviction by size
+    Parameters:
+    - root (str | Path): Directory holding the entries and manifest
+    - max_bytes (int): Total size of all entries before the least recently used ones are evicted
+    - ttl_seconds (int): Age after which an entry for an in-progress season is refetched
+    """
+
+    def __init__(
+        self, root=None, max_bytes=DEFAULT_MAX_BYTES, ttl_seconds=DEFAULT_TTL_SECONDS
+    ):
+        self.root = Path(
+            root or os.environ.get("NBA_SHOT_CACHE_DIR", DEFAULT_CACHE_ROOT)
+        )
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.RLock()
+
+    @property
+    def manifest_path(self):
+        return self.root / MANIFEST_NAME
+
+    def entry_dir(self, key):
+        return self.root / key
+
+    def load_manifest(self):
+        """Reads the manifest, an empty manifest is returned if it doesn't exist yet
+        Returns:
+        - (dict) {key: entry record}
+        """
+        if not self.manifest_path.exists():
+            return {}
+        try:
+            return json.loads(self.manifest_path.read_text())
+        except ValueError:
+            # A corrupt manifest only costs a refetch, never a crash
+            return {}
+
+    def save_manifest(self, manifest):
+        # Writing to a temp file first so a crash can't leave a half written manifest
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+        os.replace(tmp_path, self.manifest_path)
+
+    def expires_at(self, params, fetched_at):
+        """Works out when an entry expires from the season in its parameters
+        Parameters:
+        - params (dict): Request parameters, the season and season_type keys are used if present
+        - fetched_at (float): Unix time the data was fetched
+        Returns:
+        - (float | None) Unix time the entry expires, None if it never expires
+        """
+        season = params.get("season")
+        season_type = params.get("season_type", "Regular Season")
+        if season is not None and season_is_complete(season, season_type):
+            return None
+        return fetched_at + self.ttl_seconds
+
+    def is_expired(self, record, now=None):
+        expires_at = record.get("expires_at")
+        return expires_at is not None and (now or time.time()) >= expires_at
+
+    def lookup(self, endpoint, params):
+        """Returns the manifest record for a request if it is cached and still fresh
+        Parameters:
+        - endpoint (str): Name of the source endpoint
+        - params (dict): Request parameters
+        Returns:
+        - (dict | None) Manifest record, or None on a miss
+        """
+        key = make_key(endpoint, params)
+        with self._lock:
+            record = self.load_manifest().get(key)
+        if (
+            record is None
+            or self.is_expired(record)
+            or not self.entry_dir(key).exists()
+        ):
+            return None
+        return record
+
+    def get(self, endpoint, params, columns=None, include_expired=False):
+        """Reads a cached frame
+        Parameters:
+        - endpoint (str): Name of the source endpoint
+        - params (dict): Request parameters
+        - columns (list): Optional subset of columns to read
+        - include_expired (bool): Return an expired entry instead of treating it as a miss, ie: to extend it incrementally
+        Returns:
+        - (pd.DataFrame | None) Cached frame, or None if missing or expired
+        """
+        key = make_key(endpoint, params)
+        with self._lock:
+            manifest = self.load_manifest()
+            record = manifest.get(key)
+            if (
+                record is None
+                or (self.is_expired(record) and not include_expired)
+                or not self.entry_dir(key).exists()
+            ):
+                metrics.count("cache.requests", endpoint=endpoint, result="miss")
+                return None
+            # Recording the access for LRU eviction
+            record["last_access"] = time.time()
+            self.save_manifest(manifest)
+        metrics.count("cache.requests", endpoint=endpoint, result="hit")
+        with metrics.span("cache.read", endpoint=endpoint) as current:
+            df = pd.read_parquet(self.entry_dir(key), columns=columns)
+            # Bytes of the whole entry, a column subset reads less than this
+            current.set(rows=len(df), bytes_read=record.get("bytes", 0))
+        return df
+
+    def put(self, endpoint, params, df):
+        """Writes a frame to the cache, replacing any existing entry for the same request
+        Parameters:
+        - endpoint (str): Name of the source endpoint
+        - params (dict): Request parameters
+        - df (pd.DataFrame): Frame to cache
+        Returns:
+        - record (dict): Manifest record for the new entry
+        """
+        key = make_key(endpoint, params)
+        entry_dir = self.entry_dir(key)
+        with self._lock, metrics.span("cache.write", endpoint=endpoint) as current:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            entry_dir.mkdir(parents=True, exist_ok=True)
+            df.to_parquet(entry_dir / "part-00000.parquet", index=False)
+            now = time.time()
+            record = {
+                "endpoint": endpoint,
+                "params": params,
+                "schema_version": SCHEMA_VERSION,
+                "fetched_at": now,
+                "last_access": now,
+                "expires_at": self.expires_at(params, now),
+                "rows": int(len(df)),
+                "bytes": _dir_size(entry_dir),
+                "parts": 1,
+            }
+            current.set(rows=record["rows"], bytes_written=record["bytes"])
+            manifest = self.load_manifest()
+            manifest[key] = record
+            self.evict(manifest, keep=key)
+            self.save_manifest(manifest)
+        return record
+
+    def append(self, endpoint, params, df):
+        """Adds a frame to an existing entry as a new parquet part file, without rewriting the parts already stored.
+        The entry's fetch time and expiry are refreshed
+        Parameters:
+        - endpoint (str): Name of the source endpoint
+        - params (dict): Request parameters of the existing entry
+        - df (pd.DataFrame): New rows to add, must have the same columns as the stored rows
+        Returns:
+        - record (dict): Updated manifest record
+        """
+        key = make_key(endpoint, params)
+        entry_dir = self.entry_dir(key)
+        with self._lock, metrics.span("cache.append", endpoint=endpoint) as current:
+            manifest = self.load_manifest()
+            record = manifest.get(key)
+            if record is None or not entry_dir.exists():
+                raise KeyError(f"No cached entry to append to for {endpoint} {params}")
+            now = time.time()
+            if len(df):
+                part = record.get("parts", 1)
+                part_path = entry_dir / f"part-{part:05d}.parquet"
+                df.to_parquet(part_path, index=False)
+                current.set(rows=len(df), bytes_written=part_path.stat().st_size)
+                record["parts"] = part + 1
+                record["rows"] = record.get("rows", 0) + int(len(df))
+                record["bytes"] = _dir_size(entry_dir)
+            record["fetched_at"] = now
+            record["last_access"] = now
+            record["expires_at"] = self.expires_at(params, now)
+            self.evict(manifest, keep=key)
+            self.save_manifest(manifest)
+        return record
+
+    def get_or_fetch(self, endpoint, params, fetch_fn, columns=None):
+        """Returns the cached frame for a request, calling fetch_fn and caching its result on a miss
+        Parameters:
+        - endpoint (str): Name of the source endpoint
+        - params (dict): Request parameters
+        - fetch_fn (callable): No argument function that fetches the frame
+        - columns (list): Optional subset of columns to return
+        Returns:
+        - (pd.DataFrame) Cached or freshly fetched frame
+        """
+        df = self.get(endpoint, params, columns=columns)
+        if df is not None:
+            print(
+                f"Loading {endpoint} from cache: {self.entry_dir(make_key(endpoint, params))}"
+            )
+            return df
+        df = fetch_fn()
+        self.put(endpoint, params, df)
+        return df if columns is None else df[columns]
+
+    def evict(self, manifest, keep=None):
+        """Removes entries until the cache fits in max_bytes, expired entries first and then least recently used.
+        Expired entries under the size bound are kept so they can still be extended incrementally.
+        Edits the manifest in place, the caller saves it
+        Parameters:
+        - manifest (dict): Loaded manifest
+        - keep (str): Key that must not be evicted, ie: the entry that was just written
+        """
+        now = time.time()
+        total = sum(record.get("bytes", 0) for record in manifest.values())
+        eviction_order = sorted(
+            manifest,
+            key=lambda k: (
+                not self.is_expired(manifest[k], now),
+                manifest[k].get("last_access", 0),
+            ),
+        )
+        for key in eviction_order:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= manifest[key].get("bytes", 0)
+            self._remove(manifest, key)
+
+    def _remove(self, manifest, key):
+        shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+        manifest.pop(key, None)
+
+    def clear(self):
+        """Removes every entry and the manifest"""
+        with self._lock:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+
+def _dir_size(path):
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+
+_default_cache = None
+
+
+def get_cache():
+    """Returns the process wide cache, creating it on first use
+    Returns:
+    - (ParquetCache) Shared cache
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ParquetCache()
+    return _default_cache
+
+
+def configure_cache(
+    root=None, max_bytes=DEFAULT_MAX_BYTES, ttl_seconds=DEFAULT_TTL_SECONDS
+):
+    """Replaces the process wide cache, ie: to move the root directory
+    Parameters:
+    - root (str | Path): Directory holding the entries and manifest
+    - max_bytes (int): Size bound before LRU eviction
+    - ttl_seconds (int): Age after which an entry for an in-progress season is refetched
+    Returns:
+    - (ParquetCache) The new shared cache
+    """
+    global _default_cache
+    _default_cache = ParquetCache(
+        root=root, max_bytes=max_bytes, ttl_seconds=ttl_seconds
+    )
+    return _default_cache
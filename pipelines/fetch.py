@@ -0,0 +1,254 @@
+"""Rate Limited Fetch Engine for NBA-SHOT-SELECTION-LLM
+=====================================================
+Schedules many nba_api requests across a small thread pool while sharing one
+request budget between every worker.
+
+Pieces:
+- TokenBucket: shared limiter, refills `rate` tokens per second up to `burst`
+- is_retryable(exc): decides whether a failed request is worth trying again
+- call_with_retry(fn, ...): runs one request with jittered exponential backoff
+- fetch_many(fn, items, ...): runs fn(item) for every item and returns {item: result}
+- call_endpoint(endpoint, **params): calls an nba_api endpoint inside a metrics span (see pipelines/metrics.py)
+- request(endpoint, **params): call_endpoint() through the process wide limiter (get_limiter()) with retries,
+  every single request the pipeline makes goes through this
+
+Example:
+    limiter = TokenBucket(rate=2, burst=2)
+    frames = fetch_many(lambda game_id: fetch_game(game_id), game_ids, limiter=limiter)
+=====================================================
+"""
+
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from pipelines import metrics
+
+# Default request budget against stats.nba.com. Roughly what the old fixed sleep allowed, but shared across workers.
+DEFAULT_REQUESTS_PER_SECOND = 1.0
+DEFAULT_BURST = 2
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_BACKOFF_CAP = 30.0
+
+# HTTP status codes that mean "slow down / try later" rather than "this request is wrong"
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_shared_limiter = None
+_shared_limiter_lock = threading.Lock()
+
+
+class TokenBucket:
+    """Thread safe token bucket shared by every worker of a fetch
+    Parameters:
+    - rate (float): Tokens added per second, ie: the sustained requests per second
+    - burst (int): Maximum number of tokens that can be saved up
+    """
+
+    def __init__(self, rate=DEFAULT_REQUESTS_PER_SECOND, burst=DEFAULT_BURST):
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        # Adding the tokens earned since the last refill, capped at the burst size
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self):
+        """Blocks until a token is available and then consumes it
+        Returns:
+        - waited (float): Seconds spent waiting for the token
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                # Time until the next whole token is available
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def is_retryable(exc):
+    """Checks whether a failed request should be retried
+    Parameters:
+    - exc (Exception): Exception raised by the request
+    Returns:
+    - (bool) True for throttling, timeouts, dropped connections and non-json (throttled) responses
+    """
+    # requests is already loaded by nba_api whenever a request has failed
+    import requests
+
+    if isinstance(
+        exc, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)
+    ):
+        return True
+    if isinstance(exc, requests.exceptions.HTTPError):
+        response = getattr(exc, "response", None)
+        return response is not None and response.status_code in RETRYABLE_STATUS_CODES
+    # nba_api does not raise on a 429, the throttled page just fails to parse as json.
+    # Other ValueErrors are bugs (bad params, our own parsing) and retrying won't fix them
+    if isinstance(exc, json.JSONDecodeError):
+        return True
+    status_code = getattr(exc, "status_code", None)
+    return status_code in RETRYABLE_STATUS_CODES
+
+
+def backoff_delay(attempt, base=DEFAULT_BACKOFF_BASE, cap=DEFAULT_BACKOFF_CAP):
+    """Full jitter exponential backoff
+    Parameters:
+    - attempt (int): Zero based retry number
+    - base (float): Delay in seconds for the first retry
+    - cap (float): Largest delay in seconds
+    Returns:
+    - (float) Seconds to wait before the next attempt
+    """
+    return random.uniform(0, min(cap, base * (2**attempt)))
+
+
+def call_with_retry(
+    fn,
+    *args,
+    limiter=None,
+    max_retries=DEFAULT_MAX_RETRIES,
+    backoff_base=DEFAULT_BACKOFF_BASE,
+    **kwargs,
+):
+    """Calls fn(*args, **kwargs), retrying throttled or timed out requests with jittered backoff
+    Parameters:
+    - fn (callable): Function that performs one request
+    - limiter (TokenBucket): Shared limiter, a token is taken before every attempt
+    - max_retries (int): Number of retries after the first attempt
+    - backoff_base (float): Delay in seconds for the first retry
+    Returns:
+    - Result of fn
+    """
+    attempt = 0
+    while True:
+        if limiter is not None:
+            metrics.count("fetch.rate_limit_wait_seconds", limiter.acquire())
+        try:
+            return fn(*args, **kwargs)
+        except Exception as exc:
+            # Re-raising anything that isn't a transient failure, or once we are out of retries
+            if attempt >= max_retries or not is_retryable(exc):
+                raise
+            metrics.count("fetch.retries", error=type(exc).__name__)
+            time.sleep(backoff_delay(attempt, base=backoff_base))
+            attempt += 1
+
+
+def fetch_many(
+    fn,
+    items,
+    limiter=None,
+    max_workers=DEFAULT_MAX_WORKERS,
+    max_retries=DEFAULT_MAX_RETRIES,
+    backoff_base=DEFAULT_BACKOFF_BASE,
+    progress=None,
+):
+    """Runs fn(item) for every item on a thread pool with a shared rate limiter
+    Parameters:
+    - fn (callable): Function that fetches a single item
+    - items (list): Items to fetch, ie: game ids. Must be hashable, they become the keys of the result
+    - limiter (TokenBucket): Shared request budget, defaults to the process wide one (get_limiter())
+    - max_workers (int): Number of requests allowed in flight at once
+    - max_retries (int): Retries per item for transient failures
+    - backoff_base (float): Delay in seconds for the first retry
+    - progress (callable): Optional progress callback called as progress(done, total, item)
+    Returns:
+    - results (dict): {item: fn(item)} in the same order as items
+    """
+    items = list(items)
+    if not items:
+        return {}
+    if limiter is None:
+        limiter = get_limiter()
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+        futures = {
+            pool.submit(
+                call_with_retry,
+                fn,
+                item,
+                limiter=limiter,
+                max_retries=max_retries,
+                backoff_base=backoff_base,
+            ): item
+            for item in items
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            item = futures[future]
+            results[item] = future.result()
+            if progress is not None:
+                progress(done, len(items), item)
+    # Returning results in the order they were requested rather than the order they finished
+    return {item: results[item] for item in items}
+
+
+def call_endpoint(endpoint, **params):
+    """Calls an nba_api endpoint inside a metrics span, recording the size of the response
+    Parameters:
+    - endpoint (callable): Endpoint class, ie: ShotChartDetail
+    - params: Keyword arguments for the endpoint
+    Returns:
+    - The endpoint instance, ie: call .get_data_frames() on it
+    """
+    name = getattr(endpoint, "__name__", "endpoint")
+    with metrics.span("nba_api.request", endpoint=name) as current:
+        result = endpoint(**params)
+        # Fake endpoints used in testing have no raw response
+        response = getattr(result, "nba_response", None)
+        if response is not None:
+            current.set(bytes_read=len(response.get_response() or ""))
+    return result
+
+
+def get_limiter():
+    """The process wide request budget, shared by every fetch that isn't given its own limiter
+    Returns:
+    - (TokenBucket) Limiter at the default rate and burst
+    """
+    global _shared_limiter
+    with _shared_limiter_lock:
+        if _shared_limiter is None:
+            _shared_limiter = TokenBucket()
+        return _shared_limiter
+
+
+def limiter_for(requests_per_second):
+    """The shared limiter at the default rate, or a separate one for a custom rate
+    Parameters:
+    - requests_per_second (float): Request budget asked for
+    Returns:
+    - (TokenBucket) Limiter to pass to fetch_many() or request()
+    """
+    if requests_per_second == DEFAULT_REQUESTS_PER_SECOND:
+        return get_limiter()
+    return TokenBucket(rate=requests_per_second)
+
+
+def request(endpoint, limiter=None, **params):
+    """Calls an nba_api endpoint through the shared limiter, retrying throttled or timed out responses
+    Parameters:
+    - endpoint (callable): Endpoint class, ie: ShotChartDetail
+    - limiter (TokenBucket): Optional limiter, defaults to get_limiter()
+    - params: Keyword arguments for the endpoint
+    Returns:
+    - The endpoint instance, ie: call .get_data_frames() on it
+    """
+    return call_with_retry(
+        call_endpoint, endpoint, limiter=limiter or get_limiter(), **params
+    )
@@ -11,23 +11,30 @@ Parameters user must provide:
 
 Pipeline:
 1. team_id = get_team_id(team_name = "New York Knicks")
-2. game_ids = get_game_ids(team_id, season="2024-25", season_type="playoffs")
-3. cum_team_stats = get_cum_team_stats(team_id, game_ids)
-4. avg_minutes = get_average_playtime(game_stats_dict=cum_team_stats)
-5. top_x_player_ids = top_x_players_by_min(avg_minutes, num_players=5)
-6. team_shots = get_team_shots(team_id: int, player_ids: list, season="2024-25", season_type="Playoffs")
+2. avg_minutes = get_season_minutes(team_id, season="2024-25", season_type="Playoffs")
+3. top_x_player_ids = top_x_players_by_min(avg_minutes, num_players=5)
+4. team_shots = get_team_shots(team_id: int, player_ids: list, season="2024-25", season_type="Playoffs")
+
+Exact minutes mode (exact_minutes=True) replaces step 2 with one request per game:
+2a. game_ids = get_game_ids(team_id, season="2024-25", season_type="playoffs")
+2b. cum_team_stats = get_cum_team_stats(team_id, game_ids)
+2c. avg_minutes = get_average_playtime(game_stats_dict=cum_team_stats)
+
+Steps 2-3 are skipped entirely when all players are requested (num_players = -1).
+
+Incremental mode (incremental=True, see update_team_shots) compares the cached GAME_IDs against
+LeagueGameFinder and only pulls shots for the missing games, appending them to the cache entry.
 =====================================================
 """
 
 import pandas as pd
-import time
 
-from nba_api.stats.endpoints import ShotChartDetail
+# nba_api.stats.endpoints loads every endpoint class (~0.15s), so endpoints are imported where they are
+# called and a fully cached run never pays for them. The static team list is cheap
 from nba_api.stats.static import teams
-from nba_api.stats.endpoints import LeagueGameFinder
-from nba_api.stats.endpoints import CumeStatsTeam
 
-from pathlib import Path
+from pipelines import cache, fetch, metrics, store
+from pipelines.schema import normalize_shots
 
 
 def get_team_id(team_name="New York Knicks"):
@@ -52,6 +59,27 @@ def get_team_id(team_name="New York Knicks"):
     return matches[0]["id"]
 
 
+@metrics.timed("ingest.get_games", rows=True)
+def get_games(team_id, season="2024-25", season_type="playoffs"):
+    """Gets the game id and game date of every game for a given team, year, and season type
+    Parameters:
+    - team_id (int): The team_id corresponding to the provided team_name
+    - season (str): Season year string for the desired time frame
+    - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    Returns:
+    - games (pd.DataFrame): Dataframe with the GAME_ID and GAME_DATE (YYYY-MM-DD) of each game
+    """
+    from nba_api.stats.endpoints import LeagueGameFinder
+
+    games = fetch.request(
+        LeagueGameFinder,
+        team_id_nullable=team_id,
+        season_nullable=season,
+        season_type_nullable=season_type.title(),  # Season type is case sensitive
+    ).get_data_frames()[0]
+    return games[["GAME_ID", "GAME_DATE"]]
+
+
 def get_game_ids(team_id, season="2024-25", season_type="playoffs"):
     """Gets all the game ids for a given team, year, and season type
     Parameters:
@@ -61,40 +89,55 @@ def get_game_ids(team_id, season="2024-25", season_type="playoffs"):
     Returns:
     - game_ids (list): List of game ids
     """
-    # Get a list of game ids from nba api
-    game_ids = (
-        LeagueGameFinder(
-            team_id_nullable=team_id,
-            season_nullable=season,
-            season_type_nullable=season_type.title(),  # Season type is case sensitive
-        )
-        .get_data_frames()[0]["GAME_ID"]
-        .tolist()
-    )
     # Returning a list of all the game ids for that team, season, and season type
-    return game_ids
+    return get_games(team_id, season=season, season_type=season_type)[
+        "GAME_ID"
+    ].tolist()
 
 
-def get_cum_team_stats(team_id, game_ids):
-    """Get the game stats for all game ids for the provided team - rate limited to sleep for 3 seconds
+@metrics.timed("ingest.get_cum_team_stats")
+def get_cum_team_stats(
+    team_id,
+    game_ids,
+    requests_per_second=fetch.DEFAULT_REQUESTS_PER_SECOND,
+    max_workers=fetch.DEFAULT_MAX_WORKERS,
+    limiter=None,
+    endpoint=None,
+):
+    """Get the game stats for all game ids for the provided team - requests are spread over a small thread pool
+    that shares one rate limiter, throttled or timed out requests are retried with jittered backoff
     Parameters:
     - team_id (int): The team_id corresponding to the provided team_name
     - game_ids (list): List of game ids from the get_game_ids() function
+    - requests_per_second (float): Request budget against the nba api, ignored if a limiter is given. The default rate
+      shares the process wide budget (fetch.get_limiter()) with every other request
+    - max_workers (int): Number of requests allowed in flight at once
+    - limiter (fetch.TokenBucket): Optional limiter to share a budget with other fetches
+    - endpoint (callable): Endpoint class to call, defaults to CumeStatsTeam. Swapped out for a fake endpoint when testing
     Returns:
     - game_stats (dict): Dictionary containing dataframes of stats for each game id
     """
-    # Initialzing dictionary to hold all game data
-    game_stats = {}
-    i = 1  # counter for printing progress
-    total_games = len(game_ids)
-    # Looping through each game id and calling nba api to get cumalative stats for that game
-    for game_id in game_ids:
-        game_stats[game_id] = CumeStatsTeam(
-            team_id=team_id, game_ids=game_id
+    if endpoint is None:
+        from nba_api.stats.endpoints import CumeStatsTeam as endpoint
+    if limiter is None:
+        limiter = fetch.limiter_for(requests_per_second)
+
+    def fetch_game(game_id):
+        # Calling nba api to get cumalative stats for a single game
+        return fetch.call_endpoint(
+            endpoint, team_id=team_id, game_ids=game_id
         ).get_data_frames()[0]
-        print(f"Game {i} of {total_games} has been processed - ID = {game_id}")
-        i += 1
-        time.sleep(1)  # Rate limit set to 1 second so nba_api doesn't throttle
+
+    def print_progress(done, total, game_id):
+        print(f"Game {done} of {total} has been processed - ID = {game_id}")
+
+    game_stats = fetch.fetch_many(
+        fetch_game,
+        game_ids,
+        limiter=limiter,
+        max_workers=max_workers,
+        progress=print_progress,
+    )
     return game_stats
 
 
@@ -120,6 +163,44 @@ def get_average_playtime(game_stats_dict):
     return avg_minutes
 
 
+@metrics.timed("ingest.get_season_minutes", rows=True)
+def get_season_minutes(team_id, season="2024-25", season_type="Playoffs"):
+    """Gets the average minutes for each player on a team with one bulk request of season level player stats
+    Parameters:
+    - team_id (int): The team_id corresponding to the provided team_name
+    - season (str): Season year string for the desired time frame
+    - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    Returns:
+    - avg_minutes (pd.DataFrame): Dataframe containing the player name, player id, and average minutes played sorted by minutes.
+    Same shape as the output of get_average_playtime() so it can be passed to top_x_players_by_min()
+    """
+    from nba_api.stats.endpoints import LeagueDashPlayerStats
+
+    # Per game mode returns the average minutes directly, one row per player on the team
+    player_stats = fetch.request(
+        LeagueDashPlayerStats,
+        team_id_nullable=team_id,
+        season=season,
+        season_type_all_star=season_type.title(),
+        per_mode_detailed="PerGame",
+    ).get_data_frames()[0]
+    # Renaming to match the columns produced by get_average_playtime()
+    avg_minutes = (
+        player_stats[["PLAYER_NAME", "MIN", "PLAYER_ID"]]
+        .rename(
+            columns={
+                "PLAYER_NAME": "PLAYER",
+                "MIN": "ACTUAL_MINUTES",
+                "PLAYER_ID": "PERSON_ID",
+            }
+        )
+        .sort_values(by="ACTUAL_MINUTES", ascending=False)
+        .reset_index(drop=True)
+    )
+    avg_minutes["PERSON_ID"] = avg_minutes["PERSON_ID"].astype(int)
+    return avg_minutes
+
+
 def top_x_players_by_min(avg_minutes, num_players=5):
     """Returns the top x player ids to from the output of get_average_playtime() function
     Parameters:
@@ -138,27 +219,40 @@ def top_x_players_by_min(avg_minutes, num_players=5):
     return top_num_player_ids
 
 
+@metrics.timed("ingest.get_team_shots", rows=True)
 def get_team_shots(
-    team_id: int, player_ids: list, season="2024-25", season_type="Playoffs"
+    team_id: int,
+    player_ids: list = None,
+    season="2024-25",
+    season_type="Playoffs",
+    date_from=None,
 ):
     """Pulls data on all shots taken by players on provided team during a year and season type
     Parameters:
     - team_id (int): The team_id corresponding to the provided team_name
-    - player_ids (list): List of the player ids
+    - player_ids (list): List of the player ids. If None, shots for every player on the team are returned
     - season (str): Season year string for the desired time frame
     - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    - date_from (str): Optional first game date to include, MM/DD/YYYY. Used to only pull recent games
     Returns:
-    - df_shots_filtered (pd.DataFrame): Dataframe of all shots taken in period by team and information on makes, shot type, etc.
+    - df_shots_filtered (pd.DataFrame): Dataframe (compact shot schema) of all shots taken in period by team and information on makes, shot type, etc.
     """
+    from nba_api.stats.endpoints import ShotChartDetail
+
     # Getting shot chart information for the whole season for all players on a team
-    shot_chart = ShotChartDetail(
+    shot_chart = fetch.request(
+        ShotChartDetail,
         team_id=team_id,
         season_nullable=season,
         season_type_all_star=season_type.title(),
         player_id=0,  # 0 = all players on team
         context_measure_simple="FGA",
+        date_from_nullable=date_from or "",
     )
-    df_shots = shot_chart.get_data_frames()[0]
+    # Casting to the compact shot schema (categoricals and small ints, see pipelines/schema.py)
+    df_shots = normalize_shots(shot_chart.get_data_frames()[0])
+    if player_ids is None:
+        return df_shots
     # Subset to only the requested players
     df_shots_filtered = df_shots[df_shots["PLAYER_ID"].isin(player_ids)].reset_index(
         drop=True
@@ -166,42 +260,231 @@ def get_team_shots(
     return df_shots_filtered
 
 
-def ingest_data(team_name, num_players, season, season_type):
-    """Runs the full ingestion pipeline in one function
+def get_top_player_ids(
+    team_id,
+    num_players=5,
+    season="2024-25",
+    season_type="Playoffs",
+    exact_minutes=False,
+):
+    """Ranks a team's players by average minutes and returns the top x player ids
     Parameters:
-    - team_name (str): Full team name that corresponds to the NBA api's names
-    - num_players (int): Top number of players to get player ids of
+    - team_id (int): The team_id corresponding to the provided team_name
+    - num_players (int): Top number of players to get player ids of. If "-1" submitted then None is returned, meaning every player
     - season (str): Season year string for the desired time frame
     - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    - exact_minutes (bool): If True, average minutes are built from one CumeStatsTeam request per game instead of one bulk request
     Returns:
-    - team_shots (pd.DataFrame): Filtered dataframe of all shots taken in period by team and information on makes, shot type, etc.
+    - top_x_player_ids (list): List of the top x player ids by minutes played, or None for all players
     """
-    # Sets and creates the data / shotcharts path to cache ingested data. This will reduce api requests in the future.
-    data_dir = Path.cwd() / "data" / "shotcharts"
-    data_dir.mkdir(parents=True, exist_ok=True)
-    team_path = data_dir / f"shots_{team_name}_{season}_{season_type}.parquet"
-    if team_path.exists():
-        team_shots = pd.read_parquet(team_path)
-        print(f"Loading file from cached parquet: {team_path}")
-    else:
-        # Grabs the team id
-        team_id = get_team_id(team_name=team_name)
+    # Every player is wanted so there is nothing to rank, the shot chart request already covers the whole roster
+    if num_players == -1:
+        return None
+    if exact_minutes:
         # Grabs the game ids for the users team, season, and season_type
         game_ids = get_game_ids(team_id=team_id, season=season, season_type=season_type)
-
         # Getting all cumalitive game stats for that team and games
         cum_team_stats = get_cum_team_stats(team_id, game_ids)
         # Calculating the average playtime for all players on the team in that span of games
         avg_minutes = get_average_playtime(game_stats_dict=cum_team_stats)
+    else:
+        # One request for season level per game averages
+        avg_minutes = get_season_minutes(
+            team_id=team_id, season=season, season_type=season_type
+        )
+    # Gets the top x players based on average play time to create shot chart data
+    return top_x_players_by_min(avg_minutes, num_players=num_players)
+
+
+def get_cached_top_player_ids(
+    team_id,
+    num_players=5,
+    season="2024-25",
+    season_type="Playoffs",
+    exact_minutes=False,
+):
+    """Same as get_top_player_ids() but the ranking is kept in the parquet cache, so reading a team from the
+    league shot store only calls the api the first time a top x is asked for
+    Parameters:
+    - team_id (int): The team_id corresponding to the provided team_name
+    - num_players (int): Top number of players to get player ids of, "-1" returns None without a request
+    - season (str): Season year string for the desired time frame
+    - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    - exact_minutes (bool): Rank from per game CumeStatsTeam requests instead of one bulk request
+    Returns:
+    - top_x_player_ids (list): List of the top x player ids by minutes played, or None for all players
+    """
+    if num_players == -1:
+        return None
+    params = {
+        "team_id": int(team_id),
+        "num_players": num_players,
+        "season": season,
+        "season_type": season_type,
+        "exact_minutes": exact_minutes,
+    }
+
+    def fetch_ranking():
+        player_ids = get_top_player_ids(
+            team_id,
+            num_players=num_players,
+            season=season,
+            season_type=season_type,
+            exact_minutes=exact_minutes,
+        )
+        return pd.DataFrame({"PLAYER_ID": pd.Series(player_ids, dtype="int64")})
+
+    ranking = cache.get_cache().get_or_fetch("TopPlayerIds", params, fetch_ranking)
+    return ranking["PLAYER_ID"].tolist()
+
+
+def ingest_params(team_name, num_players, season, season_type, exact_minutes=False):
+    """Builds the cache parameters for an ingest request.
+    Every parameter that changes the result is part of the cache key, so a top 5 pull never answers an all roster request
+    Returns:
+    - params (dict): Cache parameters
+    """
+    return {
+        "team_name": team_name,
+        "num_players": num_players,
+        "season": season,
+        "season_type": season_type,
+        "exact_minutes": exact_minutes,
+    }
+
+
+@metrics.timed("ingest.update_team_shots", rows=True)
+def update_team_shots(team_name, num_players, season, season_type, exact_minutes=False):
+    """Brings a cached shot chart up to date by fetching only the games that aren't stored yet.
+    New games are appended to the cache entry as a new parquet part, the stored games are never rewritten
+    Parameters:
+    - team_name (str): Full team name that corresponds to the NBA api's names
+    - num_players (int): Top number of players to get player ids of
+    - season (str): Season year string for the desired time frame
+    - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    - exact_minutes (bool): Opt in to ranking players from per game CumeStatsTeam requests (one request per game)
+    Returns:
+    - team_shots (pd.DataFrame): Every stored shot plus the newly fetched ones
+    """
+    params = ingest_params(team_name, num_players, season, season_type, exact_minutes)
+    shot_cache = cache.get_cache()
+    # Only the ids are needed to work out what is missing, expired entries are fine since they are being extended
+    stored = shot_cache.get(
+        "ShotChartDetail",
+        params,
+        columns=["GAME_ID", "PLAYER_ID"],
+        include_expired=True,
+    )
+    if stored is None:
+        # Nothing to extend yet, so fall back to a full pull
+        return ingest_data(team_name, num_players, season, season_type, exact_minutes)
+
+    team_id = get_team_id(team_name=team_name)
+    # Comparing the games played so far against the games already stored
+    games = get_games(team_id=team_id, season=season, season_type=season_type)
+    missing = games[~games["GAME_ID"].isin(set(stored["GAME_ID"]))]
+    if missing.empty:
+        print(f"No new games for {team_name}, cache is up to date")
+        new_shots = stored.iloc[0:0]
+    else:
+        print(f"Fetching {len(missing)} new game(s) for {team_name}")
+        # One shot chart request covering every missing game, starting from the earliest one
+        date_from = pd.to_datetime(missing["GAME_DATE"]).min().strftime("%m/%d/%Y")
+        new_shots = get_team_shots(
+            team_id=team_id,
+            player_ids=None,
+            season=season,
+            season_type=season_type,
+            date_from=date_from,
+        )
+        new_shots = new_shots[new_shots["GAME_ID"].isin(set(missing["GAME_ID"]))]
+        # Keeping the same players as the stored entry when it only holds the top x players
+        if num_players != -1:
+            new_shots = new_shots[new_shots["PLAYER_ID"].isin(set(stored["PLAYER_ID"]))]
+    # Appending refreshes the entry's expiry even when there were no new games
+    shot_cache.append("ShotChartDetail", params, new_shots.reset_index(drop=True))
+    return shot_cache.get("ShotChartDetail", params)
+
+
+@metrics.timed("ingest.ingest_data", rows=True)
+def ingest_data(
+    team_name,
+    num_players,
+    season,
+    season_type,
+    exact_minutes=False,
+    incremental=False,
+    use_store=True,
+    columns=None,
+):
+    """Runs the full ingestion pipeline in one function
+    Parameters:
+    - team_name (str): Full team name that corresponds to the NBA api's names
+    - num_players (int): Top number of players to get player ids of
+    - season (str): Season year string for the desired time frame
+    - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    - exact_minutes (bool): Opt in to ranking players from per game CumeStatsTeam requests (one request per game)
+    - incremental (bool): Extend an existing cache entry with only the games it is missing (see update_team_shots())
+    - use_store (bool): Read the team's slice from the league shot store (pipelines/store.py) when it has been ingested,
+      fully offline with num_players=-1 (a top x ranking is fetched once and cached)
+    - columns (list): Optional subset of columns to return, only these are read from disk (ie: schema.SHOT_COLUMNS)
+    Returns:
+    - team_shots (pd.DataFrame): Filtered dataframe of all shots taken in period by team and information on makes, shot type, etc.
+    """
+    if incremental:
+        team_shots = update_team_shots(
+            team_name, num_players, season, season_type, exact_minutes
+        )
+        return team_shots if columns is None else team_shots[columns]
+    if use_store:
+        # Team ids come from nba_api's static team list, so this check doesn't cost a request
+        team_id = get_team_id(team_name=team_name)
+        if store.has_team_slice(season, season_type, team_id):
+            print(f"Loading {team_name} from the league shot store")
+            # Minutes aren't in the shot data, so a top x still needs the ranking. It is cached, so only the first
+            # read calls the api, num_players=-1 never does
+            top_x_player_ids = get_cached_top_player_ids(
+                team_id,
+                num_players=num_players,
+                season=season,
+                season_type=season_type,
+                exact_minutes=exact_minutes,
+            )
+            # PLAYER_ID is needed to filter to the top x players, it is dropped again if it wasn't asked for
+            read_columns = columns
+            if columns is not None and top_x_player_ids is not None:
+                read_columns = list(dict.fromkeys([*columns, "PLAYER_ID"]))
+            team_shots = store.read_team_shots(
+                season, season_type, team_id=team_id, columns=read_columns
+            )
+            if top_x_player_ids is not None:
+                team_shots = team_shots[
+                    team_shots["PLAYER_ID"].isin(top_x_player_ids)
+                ].reset_index(drop=True)
+            return team_shots if columns is None else team_shots[columns]
+    params = ingest_params(team_name, num_players, season, season_type, exact_minutes)
+
+    def fetch_team_shots():
+        # Grabs the team id
+        team_id = get_team_id(team_name=team_name)
         # Gets the top x players based on average play time to create shot chart data
-        top_x_player_ids = top_x_players_by_min(avg_minutes, num_players=num_players)
+        top_x_player_ids = get_top_player_ids(
+            team_id,
+            num_players=num_players,
+            season=season,
+            season_type=season_type,
+            exact_minutes=exact_minutes,
+        )
         # Pulls shot chart data from nba_api
-        team_shots = get_team_shots(
+        return get_team_shots(
             team_id=team_id,
             player_ids=top_x_player_ids,
             season=season,
             season_type=season_type,
         )
-        # If the data didn't exist already, then cache the parquet file
-        team_shots.to_parquet(team_path, index=False)
+
+    # Reads from the parquet cache, only calling the nba api on a miss or an expired entry
+    team_shots = cache.get_cache().get_or_fetch(
+        "ShotChartDetail", params, fetch_team_shots, columns=columns
+    )
     return team_shots
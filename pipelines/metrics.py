@@ -0,0 +1,365 @@
+"""Run Metrics for NBA-SHOT-SELECTION-LLM
+=====================================================
+Lightweight spans and counters for the ingest, transformation, LLM and chart stages, so a slow run
+shows where its time went (api latency, rate limit waits, parquet io, groupbys, LLM prefill vs generation,
+png encoding).
+
+- span(name, **labels): times a block, the block can attach fields, ie: span.set(rows=len(df), bytes_read=n)
+- timed(name): decorator version of span, optionally recording len() of the result as rows
+- record_span(span, started_at): records a span the caller timed itself, ie: a generator that yields mid block
+- count(name, value, **labels): adds to a counter, ie: cache hits and misses, seconds spent waiting on the rate limiter
+
+Spans and counters are aggregated in memory per name and labels. They can be exported as:
+- to_prometheus(): Prometheus text exposition format (served on /metrics by app/server.py)
+- structured logs: one json line per finished span on the "nba_shot.metrics" logger,
+  written to a file with configure_metrics(log_path=...) or NBA_SHOT_METRICS_LOG
+- cProfile: configure_metrics(profile_dir=..., profile_spans=["ingest"]) or NBA_SHOT_PROFILE_DIR
+  saves a .prof file for every run of the listed spans ("*" for every top level span), open with pstats or snakeviz
+
+Example:
+    with span("ingest.shot_chart", team=team_name) as s:
+        shots = fetch()
+        s.set(rows=len(shots))
+    print(to_prometheus())
+=====================================================
+"""
+
+import cProfile
+import functools
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+DEFAULT_MAX_EVENTS = 1000  # Recent finished spans kept in memory
+METRIC_PREFIX = "nba_shot"
+
+logger = logging.getLogger("nba_shot.metrics")
+
+_lock = threading.Lock()
+_spans = {}  # (name, labels) -> aggregate
+_counters = {}  # (name, labels) -> value
+_events = deque(maxlen=DEFAULT_MAX_EVENTS)
+_local = threading.local()
+_profile_ids = itertools.count(1)
+_settings = {
+    "enabled": True,
+    "profile_dir": os.environ.get("NBA_SHOT_PROFILE_DIR"),
+    "profile_spans": {"*"},
+}
+
+
+class Span:
+    """One timed block
+    Attributes:
+    - name (str): Span name, dotted by stage, ie: ingest.shot_chart
+    - labels (dict): Low cardinality labels, ie: endpoint, team, model
+    - fields (dict): Numbers recorded by the block, ie: rows, bytes_read, bytes_written, tokens
+    - seconds (float): Duration, set once the span ends
+    """
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.fields = {}
+        self.seconds = None
+        self.error = None
+
+    def set(self, **fields):
+        """Sets numeric fields, ie: span.set(rows=len(df))"""
+        self.fields.update(fields)
+
+    def add(self, field, value=1):
+        """Adds to a numeric field, ie: span.add("bytes_read", len(body))"""
+        self.fields[field] = self.fields.get(field, 0) + value
+
+
+def _key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _record(span, started_at):
+    with _lock:
+        aggregate = _spans.setdefault(
+            _key(span.name, span.labels),
+            {"count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0, "fields": {}},
+        )
+        aggregate["count"] += 1
+        aggregate["errors"] += span.error is not None
+        aggregate["seconds"] += span.seconds
+        aggregate["max_seconds"] = max(aggregate["max_seconds"], span.seconds)
+        for field, value in span.fields.items():
+            # Rates don't add up, the latest one is kept instead
+            if field.endswith("_per_second"):
+                aggregate["fields"][field] = value
+            else:
+                aggregate["fields"][field] = aggregate["fields"].get(field, 0) + value
+        event = {
+            "span": span.name,
+            "start": round(started_at, 3),
+            "seconds": round(span.seconds, 6),
+            **span.labels,
+            **span.fields,
+        }
+        if span.error is not None:
+            event["error"] = span.error
+        _events.append(event)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(event, default=str))
+
+
+@contextmanager
+def span(name, **labels):
+    """Times a block and records it under name and labels
+    Parameters:
+    - name (str): Span name, ie: transform.compare_to_league
+    - labels: Low cardinality labels, ie: endpoint="ShotChartDetail"
+    Yields:
+    - (Span) Call .set()/.add() on it to record rows, bytes or token counts
+    """
+    current = Span(name, labels)
+    if not _settings["enabled"]:
+        yield current
+        return
+    profiler = _start_profile(name)
+    started_at = time.time()
+    started = time.perf_counter()
+    try:
+        yield current
+    except Exception as exc:
+        current.error = type(exc).__name__
+        raise
+    finally:
+        current.seconds = time.perf_counter() - started
+        if profiler is not None:
+            _stop_profile(profiler, name)
+        _record(current, started_at)
+
+
+def record_span(current, started_at):
+    """Records a span the caller timed itself. For blocks that yield, where span() would count the consumer's
+    time too and profile whatever runs between pieces. Never profiled.
+    Parameters:
+    - current (Span): Span with seconds (and error, if any) set
+    - started_at (float): Unix time the block started
+    """
+    if _settings["enabled"]:
+        _record(current, started_at)
+
+
+def timed(name=None, rows=False, **labels):
+    """Decorator that runs the function inside a span
+    Parameters:
+    - name (str): Span name, defaults to <module>.<function>
+    - rows (bool): Record len() of the result as the span's rows
+    - labels: Fixed labels for the span
+    """
+
+    def decorate(fn):
+        span_name = name or f"{fn.__module__}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name, **labels) as current:
+                result = fn(*args, **kwargs)
+                if rows and result is not None:
+                    current.set(rows=len(result))
+                return result
+
+        return wrapper
+
+    return decorate
+
+
+def count(name, value=1, **labels):
+    """Adds to a counter, ie: count("cache.requests", endpoint="ShotChartDetail", result="hit")
+    Parameters:
+    - name (str): Counter name
+    - value (float): Amount to add
+    - labels: Low cardinality labels
+    """
+    if not _settings["enabled"]:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def _start_profile(name):
+    # Only one profiler runs per thread, nested spans are covered by the outer one
+    profile_dir = _settings["profile_dir"]
+    if not profile_dir or getattr(_local, "profiling", False):
+        return None
+    wanted = _settings["profile_spans"]
+    if "*" not in wanted and name not in wanted:
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another thread already has the profiler (Python 3.12+ allows one at a time)
+        return None
+    _local.profiling = True
+    return profiler
+
+
+def _stop_profile(profiler, name):
+    profiler.disable()
+    _local.profiling = False
+    profile_dir = Path(_settings["profile_dir"])
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    profiler.dump_stats(
+        profile_dir / f"{name}-{stamp}-{os.getpid()}-{next(_profile_ids)}.prof"
+    )
+
+
+def configure_metrics(
+    enabled=None, log_path=None, profile_dir=None, profile_spans=None
+):
+    """Changes how metrics are recorded and exported
+    Parameters:
+    - enabled (bool): Turn recording on or off, spans still run their blocks when off
+    - log_path (str | Path): Append one json line per finished span to this file
+    - profile_dir (str | Path): Save a cProfile .prof file for every run of the profiled spans
+    - profile_spans (list): Span names to profile, "*" profiles every top level span
+    """
+    if enabled is not None:
+        _settings["enabled"] = enabled
+    if log_path is not None:
+        handler = logging.FileHandler(log_path)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+    if profile_dir is not None:
+        _settings["profile_dir"] = str(profile_dir)
+    if profile_spans is not None:
+        _settings["profile_spans"] = set(profile_spans)
+
+
+def reset_metrics():
+    """Clears every recorded span, counter and event"""
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+        _events.clear()
+
+
+def events():
+    """Recently finished spans, oldest first
+    Returns:
+    - (list) One dict per span with span, start, seconds, labels and fields
+    """
+    with _lock:
+        return list(_events)
+
+
+def snapshot():
+    """Aggregated spans and counters as plain dicts, ie: for a json status page
+    Returns:
+    - (dict) spans and counters, each a list of dicts with name, labels and values
+    """
+    with _lock:
+        spans = [
+            {
+                "name": name,
+                "labels": dict(labels),
+                **aggregate,
+                "fields": dict(aggregate["fields"]),
+            }
+            for (name, labels), aggregate in _spans.items()
+        ]
+        counters = [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in _counters.items()
+        ]
+    return {"spans": spans, "counters": counters}
+
+
+def _metric_name(*parts):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", "_".join([METRIC_PREFIX, *parts]))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for _, value in labels
+    )
+    return (
+        "{"
+        + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped))
+        + "}"
+    )
+
+
+def to_prometheus():
+    """Dumps every span and counter in the Prometheus text exposition format
+    Returns:
+    - (str) One sample per line, ie: nba_shot_span_seconds_total{span="ingest.shot_chart"} 1.2
+    """
+    samples = {}
+
+    def add(metric, kind, labels, value):
+        samples.setdefault((metric, kind), []).append((labels, value))
+
+    with _lock:
+        for (name, labels), aggregate in sorted(_spans.items()):
+            labels = (("span", name),) + labels
+            add(_metric_name("span_calls_total"), "counter", labels, aggregate["count"])
+            add(
+                _metric_name("span_errors_total"),
+                "counter",
+                labels,
+                aggregate["errors"],
+            )
+            add(
+                _metric_name("span_seconds_total"),
+                "counter",
+                labels,
+                aggregate["seconds"],
+            )
+            add(
+                _metric_name("span_seconds_max"),
+                "gauge",
+                labels,
+                aggregate["max_seconds"],
+            )
+            for field, value in sorted(aggregate["fields"].items()):
+                if field.endswith("_per_second"):
+                    add(_metric_name("span", field), "gauge", labels, value)
+                else:
+                    add(_metric_name("span", field, "total"), "counter", labels, value)
+        for (name, labels), value in sorted(_counters.items()):
+            add(_metric_name(name, "total"), "counter", labels, value)
+
+    lines = []
+    for (metric, kind), values in samples.items():
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.extend(
+            f"{metric}{_format_labels(labels)} {value:g}" for labels, value in values
+        )
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    """Writes to_prometheus() to a file, ie: for the node exporter's textfile collector
+    Returns:
+    - (Path) File written
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(to_prometheus())
+    return path
+
+
+# Opting in to structured logs from the environment, ie: NBA_SHOT_METRICS_LOG=data/metrics.jsonl
+if os.environ.get("NBA_SHOT_METRICS_LOG"):
+    configure_metrics(log_path=os.environ["NBA_SHOT_METRICS_LOG"])
@@ -0,0 +1,421 @@
+"""Player Shot Profiles for NBA-SHOT-SELECTION-LLM
+=====================================================
+Precomputed shot profile of every player in a season and season type, for questions like
+"who else in the league takes their shots like Jalen Brunson?" without regrouping the league's shots.
+
+A player's profile is their share of attempts in each zone (SHOT_ZONE_BASIC x SHOT_ZONE_AREA) and their
+FG% in each zone. Built once from the league shot store (pipelines/store.py) and saved next to it:
+
+    <store root>/profiles/SEASON=2024-25/SEASON_TYPE=Playoffs/
+        index.json         zone names, player names, the feature settings and the current version
+        v<build>/
+            player_ids.npy   sorted player ids, one per row
+            attempts.npy     players x zones attempts (int32)
+            makes.npy        same shape
+            features.npy     players x (2 * zones) unit length similarity vectors (float32)
+            games.npy        sorted GAME_ID * 10^10 + TEAM_ID of every team game already counted
+
+Similarity is the cosine between feature vectors: the zone attempt shares followed by the zone FG%
+above or below the league, each zone's FG% shrunk toward the league's so a handful of attempts don't
+dominate. A query is one matrix-vector product over every player.
+
+The counts are kept rather than the percentages, so new games are added in place with update_profiles,
+ingest_league does this after every nightly ingest. Each build or update is written to a new version
+directory and index.json is switched to it, so a server still mapping the previous version isn't disturbed.
+
+Example:
+    build_profiles("2024-25", "Playoffs")
+    profiles = load_profiles("2024-25", "Playoffs")
+    profiles.similar("Jalen Brunson", k=10)
+=====================================================
+"""
+
+import json
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from pipelines import metrics, store
+from pipelines.aggregate import build_cube
+
+PROFILE_KEYS = ["SHOT_ZONE_BASIC", "SHOT_ZONE_AREA"]
+PROFILE_COLUMNS = ["PLAYER_ID", "PLAYER_NAME", "GAME_ID", "TEAM_ID", "SHOT_MADE_FLAG"]
+DEFAULT_PRIOR_ATTEMPTS = 20  # League attempts blended into each player zone FG%
+DEFAULT_FG_WEIGHT = 1.0  # Weight of the FG% block against the attempt share block
+# Players below this many attempts are left out of similarity results
+DEFAULT_MIN_ATTEMPTS = 50
+DEFAULT_TOP_K = 10
+# Team ids are 10 digits, so GAME_ID * scale + TEAM_ID is unique per team game
+GAME_KEY_SCALE = 10**10
+
+# Loaded profiles, keyed on directory and index modification time so a rebuild or update is picked up
+_loaded = {}
+
+
+@dataclass
+class PlayerProfiles:
+    """Zone attempts and makes of every player (rows) in every zone (columns)
+    Attributes:
+    - zones (list): "SHOT_ZONE_BASIC | SHOT_ZONE_AREA" values, one per column
+    - player_ids (np.ndarray): Sorted player ids, one per row
+    - player_names (list): Player name of each row
+    - games (np.ndarray): Sorted keys of the team games already counted
+    - attempts / makes (np.ndarray): players x zones totals, memory mapped when loaded from disk
+    - features (np.ndarray): players x (2 * zones) unit length similarity vectors
+    - prior_attempts (float): League attempts blended into each zone FG%
+    - fg_weight (float): Weight of the FG% block in the features
+    """
+
+    zones: list
+    player_ids: np.ndarray
+    player_names: list
+    games: np.ndarray
+    attempts: np.ndarray
+    makes: np.ndarray
+    features: np.ndarray
+    prior_attempts: float = DEFAULT_PRIOR_ATTEMPTS
+    fg_weight: float = DEFAULT_FG_WEIGHT
+
+    def row(self, player):
+        """Finds the row for a player id or full player name
+        Returns:
+        - (int) Row number into attempts/makes/features
+        """
+        if isinstance(player, str):
+            if player in self.player_names:
+                return self.player_names.index(player)
+            raise KeyError(f"Player '{player}' is not in the profiles")
+        position = int(np.searchsorted(self.player_ids, int(player)))
+        if position < len(self.player_ids) and self.player_ids[position] == player:
+            return position
+        raise KeyError(f"Player id {player} is not in the profiles")
+
+    def league_fg_pct(self):
+        """League FG% per zone, the sum over every player
+        Returns:
+        - (np.ndarray) One FG% per zone, 0 for zones without attempts
+        """
+        return _league_fg_pct(np.asarray(self.attempts), np.asarray(self.makes))
+
+    def profile(self, player):
+        """One player's profile
+        Parameters:
+        - player (str | int): Full player name or player id
+        Returns:
+        - (pd.DataFrame) zone, attempts, makes, share, fg_pct and league_fg_pct for zones with attempts
+        """
+        row = self.row(player)
+        attempts = np.asarray(self.attempts[row])
+        makes = np.asarray(self.makes[row])
+        keep = attempts > 0
+        profile = pd.DataFrame(
+            {
+                "zone": np.asarray(self.zones, dtype=object)[keep],
+                "attempts": attempts[keep].astype(np.int64),
+                "makes": makes[keep].astype(np.int64),
+                "share": attempts[keep] / attempts.sum(),
+                "fg_pct": makes[keep] / attempts[keep],
+                "league_fg_pct": self.league_fg_pct()[keep],
+            }
+        )
+        return profile.sort_values("share", ascending=False, ignore_index=True)
+
+    def similar(self, player, k=DEFAULT_TOP_K, min_attempts=DEFAULT_MIN_ATTEMPTS):
+        """Top k players with the most similar shot profile
+        Parameters:
+        - player (str | int): Full player name or player id
+        - k (int): Number of players to return
+        - min_attempts (int): Leave out players with fewer attempts than this
+        Returns:
+        - (pd.DataFrame) PLAYER_ID, PLAYER_NAME, attempts and similarity (cosine, 1 = identical), most similar first
+        """
+        row = self.row(player)
+        with metrics.span("profiles.similar") as current:
+            scores = self.features @ self.features[row]
+            totals = np.asarray(self.attempts).sum(axis=1)
+            scores[totals < min_attempts] = -np.inf
+            scores[row] = -np.inf
+            candidates = np.flatnonzero(np.isfinite(scores))
+            k = min(k, len(candidates))
+            top = np.empty(0, dtype=np.int64)
+            if k:
+                # Partial sort, only the k best are ordered
+                top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+                top = top[np.argsort(-scores[top], kind="stable")]
+            current.set(rows=len(self.player_ids))
+        return pd.DataFrame(
+            {
+                "PLAYER_ID": self.player_ids[top].astype(np.int64),
+                "PLAYER_NAME": [self.player_names[i] for i in top],
+                "attempts": totals[top].astype(np.int64),
+                "similarity": scores[top].astype(float),
+            }
+        )
+
+
+def _league_fg_pct(attempts, makes):
+    league_attempts = attempts.sum(axis=0)
+    return np.divide(
+        makes.sum(axis=0),
+        league_attempts,
+        out=np.zeros(len(league_attempts)),
+        where=league_attempts > 0,
+    )
+
+
+def compute_features(
+    attempts, makes, prior_attempts=DEFAULT_PRIOR_ATTEMPTS, fg_weight=DEFAULT_FG_WEIGHT
+):
+    """Similarity vectors for a players x zones attempts/makes matrix
+    Parameters:
+    - attempts / makes (np.ndarray): players x zones totals
+    - prior_attempts (float): League attempts blended into each zone FG%
+    - fg_weight (float): Weight of the FG% block against the attempt share block
+    Returns:
+    - (np.ndarray) players x (2 * zones) float32 rows of unit length (zero rows for players without attempts)
+    """
+    attempts = np.asarray(attempts, dtype=np.float64)
+    makes = np.asarray(makes, dtype=np.float64)
+    totals = attempts.sum(axis=1, keepdims=True)
+    share = np.divide(attempts, totals, out=np.zeros_like(attempts), where=totals > 0)
+    league = _league_fg_pct(attempts, makes)
+    # Shrinking toward the league so a 2 for 2 zone doesn't look like an elite shooter
+    shrunk = (makes + prior_attempts * league) / (attempts + prior_attempts)
+    features = np.hstack([share, fg_weight * (shrunk - league)])
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    features = np.divide(features, norms, out=np.zeros_like(features), where=norms > 0)
+    return features.astype(np.float32)
+
+
+def profiles_dir(season, season_type, root=None):
+    """Directory of a season/season type's player profiles
+    Returns:
+    - (Path) Profiles directory
+    """
+    return store.partition_dir("profiles", season, season_type.title(), root=root)
+
+
+def _game_keys(shots):
+    # Team game of every shot, a game appears twice in a league ingest, once for each team
+    games = pd.to_numeric(shots["GAME_ID"].astype(str)).to_numpy(np.int64)
+    return games * GAME_KEY_SCALE + shots["TEAM_ID"].to_numpy(np.int64)
+
+
+def _tally(shots):
+    """Long player x zone totals and the player names for a frame of shots
+    Returns:
+    - totals (pd.DataFrame): PLAYER_ID, zone, attempts, makes
+    - names (dict): Player id -> player name
+    """
+    totals = build_cube(shots, ["PLAYER_ID", *PROFILE_KEYS]).to_frame(
+        ["attempts", "makes"]
+    )
+    totals["zone"] = (
+        totals["SHOT_ZONE_BASIC"].astype(str)
+        + " | "
+        + totals["SHOT_ZONE_AREA"].astype(str)
+    )
+    names = (
+        shots.drop_duplicates("PLAYER_ID")
+        .set_index("PLAYER_ID")["PLAYER_NAME"]
+        .astype(str)
+        .to_dict()
+    )
+    return totals[["PLAYER_ID", "zone", "attempts", "makes"]], names
+
+
+def _scatter(totals, player_ids, zones, attempts, makes):
+    # Adding long totals into players x zones matrices, player_ids is sorted
+    rows = np.searchsorted(player_ids, totals["PLAYER_ID"].to_numpy(np.int64))
+    zone_position = {zone: i for i, zone in enumerate(zones)}
+    columns = totals["zone"].map(zone_position).to_numpy()
+    np.add.at(attempts, (rows, columns), totals["attempts"].to_numpy(np.int32))
+    np.add.at(makes, (rows, columns), totals["makes"].to_numpy(np.int32))
+
+
+def _save(profiles, season, season_type, root=None):
+    out_dir = profiles_dir(season, season_type, root=root)
+    # A new version per save, profiles loaded earlier keep mapping the files of theirs
+    version_dir = store.new_version_dir(out_dir)
+    for name in ["player_ids", "attempts", "makes", "features", "games"]:
+        np.save(version_dir / f"{name}.npy", getattr(profiles, name))
+    store.publish_version(
+        out_dir,
+        version_dir,
+        {
+            "season": season,
+            "season_type": season_type.title(),
+            "zones": profiles.zones,
+            "player_names": profiles.player_names,
+            "prior_attempts": profiles.prior_attempts,
+            "fg_weight": profiles.fg_weight,
+        },
+    )
+    return out_dir
+
+
+def _assemble(totals, names, games, prior_attempts, fg_weight, base=None):
+    """Builds profiles from long totals, on top of an existing set of profiles when given
+    Returns:
+    - (PlayerProfiles) Profiles covering every player and zone in base and totals
+    """
+    zones = sorted(set(totals["zone"]) | set(base.zones if base else []))
+    player_ids = np.union1d(
+        totals["PLAYER_ID"].to_numpy(np.int64),
+        base.player_ids if base else np.array([], dtype=np.int64),
+    ).astype(np.int64)
+    attempts = np.zeros((len(player_ids), len(zones)), dtype=np.int32)
+    makes = np.zeros_like(attempts)
+    player_names = {}
+    if base is not None:
+        # Copying the old counts into their (possibly shifted) rows and columns
+        rows = np.searchsorted(player_ids, base.player_ids)
+        columns = np.array([zones.index(zone) for zone in base.zones], dtype=np.int64)
+        attempts[np.ix_(rows, columns)] = base.attempts
+        makes[np.ix_(rows, columns)] = base.makes
+        player_names.update(zip(base.player_ids.tolist(), base.player_names))
+        games = np.union1d(base.games, games)
+    _scatter(totals, player_ids, zones, attempts, makes)
+    player_names.update(names)
+    return PlayerProfiles(
+        zones=zones,
+        player_ids=player_ids,
+        player_names=[player_names[int(player_id)] for player_id in player_ids],
+        games=np.asarray(games, dtype=np.int64),
+        attempts=attempts,
+        makes=makes,
+        features=compute_features(attempts, makes, prior_attempts, fg_weight),
+        prior_attempts=prior_attempts,
+        fg_weight=fg_weight,
+    )
+
+
+def build_profiles(
+    season="2024-25",
+    season_type="Playoffs",
+    root=None,
+    prior_attempts=DEFAULT_PRIOR_ATTEMPTS,
+    fg_weight=DEFAULT_FG_WEIGHT,
+):
+    """Builds and saves every player's profile for a season and season type from the league shot store
+    Parameters:
+    - season (str): Season year string
+    - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    - root (str | Path): Store root directory
+    - prior_attempts (float): League attempts blended into each zone FG%
+    - fg_weight (float): Weight of the FG% block against the attempt share block
+    Returns:
+    - (PlayerProfiles) The profiles that were saved
+    """
+    shots = store.read_team_shots(
+        season, season_type, columns=[*PROFILE_COLUMNS, *PROFILE_KEYS], root=root
+    )
+    if shots is None:
+        raise ValueError(
+            f"No shots stored for {season} {season_type}, run store.ingest_league() first"
+        )
+    with metrics.span("profiles.build") as current:
+        totals, names = _tally(shots)
+        profiles = _assemble(
+            totals, names, np.unique(_game_keys(shots)), prior_attempts, fg_weight
+        )
+        out_dir = _save(profiles, season, season_type, root=root)
+        current.set(rows=len(shots))
+    print(f"Built shot profiles for {len(profiles.player_ids)} players: {out_dir}")
+    return profiles
+
+
+def update_profiles(shots, season="2024-25", season_type="Playoffs", root=None):
+    """Adds the games in shots that the saved profiles haven't counted yet, building the profiles if there are none
+    Parameters:
+    - shots (pd.DataFrame): Shot chart rows for the season and season type, ie: a fresh ingest
+    - season (str): Season year string
+    - season_type (str): Time of season
+    - root (str | Path): Store root directory
+    Returns:
+    - (PlayerProfiles) The updated profiles
+    """
+    profiles = load_profiles(season, season_type, root=root)
+    if profiles is None:
+        return build_profiles(season, season_type, root=root)
+    keys = _game_keys(shots)
+    new = ~np.isin(keys, profiles.games)
+    if not new.any():
+        return profiles
+    new_shots, new_games = shots[new], np.unique(keys[new])
+    with metrics.span("profiles.update") as current:
+        totals, names = _tally(new_shots)
+        profiles = _assemble(
+            totals,
+            names,
+            new_games,
+            profiles.prior_attempts,
+            profiles.fg_weight,
+            base=profiles,
+        )
+        _save(profiles, season, season_type, root=root)
+        current.set(rows=len(new_shots))
+    print(
+        f"Added {len(new_shots)} shots from {len(new_games)} team games to the shot profiles"
+    )
+    return profiles
+
+
+def load_profiles(season="2024-25", season_type="Playoffs", root=None):
+    """Loads a season's player profiles, memory mapping the arrays
+    Parameters:
+    - season (str): Season year string
+    - season_type (str): Time of season
+    - root (str | Path): Store root directory
+    Returns:
+    - (PlayerProfiles | None) The profiles, or None if they haven't been built
+    """
+    index_dir = profiles_dir(season, season_type, root=root)
+    index_path = index_dir / "index.json"
+    if not index_path.exists():
+        return None
+    cache_key = (str(index_dir), index_path.stat().st_mtime_ns)
+    if cache_key not in _loaded:
+        meta = json.loads(index_path.read_text())
+        # Dropping the version an update replaced
+        for stale in [key for key in _loaded if key[0] == str(index_dir)]:
+            del _loaded[stale]
+        version_dir = store.version_path(index_dir, meta)
+        _loaded[cache_key] = PlayerProfiles(
+            zones=meta["zones"],
+            player_ids=np.load(version_dir / "player_ids.npy", mmap_mode="r"),
+            player_names=meta["player_names"],
+            games=np.load(version_dir / "games.npy", mmap_mode="r"),
+            attempts=np.load(version_dir / "attempts.npy", mmap_mode="r"),
+            makes=np.load(version_dir / "makes.npy", mmap_mode="r"),
+            features=np.load(version_dir / "features.npy", mmap_mode="r"),
+            prior_attempts=meta["prior_attempts"],
+            fg_weight=meta["fg_weight"],
+        )
+    return _loaded[cache_key]
+
+
+if __name__ == "__main__":
+    # Build a season's profiles and find similar players, ie: python -m pipelines.profiles 2024-25 Playoffs --player "Jalen Brunson"
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Player shot profiles")
+    parser.add_argument("season", nargs="?", default="2024-25")
+    parser.add_argument("season_type", nargs="?", default="Playoffs")
+    parser.add_argument(
+        "--player", help="Player name or id to find similar players for"
+    )
+    parser.add_argument("-k", type=int, default=DEFAULT_TOP_K)
+    parser.add_argument(
+        "--rebuild", action="store_true", help="Rebuild instead of loading"
+    )
+    args = parser.parse_args()
+
+    profiles = None if args.rebuild else load_profiles(args.season, args.season_type)
+    if profiles is None:
+        profiles = build_profiles(args.season, args.season_type)
+    if args.player:
+        player = int(args.player) if args.player.isdigit() else args.player
+        print(profiles.profile(player).to_string(index=False))
+        print(profiles.similar(player, k=args.k).to_string(index=False))
@@ -0,0 +1,83 @@
+"""Shot Schema for NBA-SHOT-SELECTION-LLM
+=====================================================
+Compact in-memory representation of ShotChartDetail rows.
+
+- Repeated strings (zones, areas, ranges, actions, names, ids) are stored as categoricals,
+  which parquet writes as dictionary encoded columns and reads back as categoricals
+- Coordinates and distances are int16, flags and clock values are int8, player/team ids are int32
+- SHOT_COLUMNS lists the columns the transformation functions actually use, so readers can
+  project down to them instead of loading all 24 columns
+
+Example:
+    shots = normalize_shots(ShotChartDetail(...).get_data_frames()[0])
+    shots = read_shots(path, columns=SHOT_COLUMNS)
+=====================================================
+"""
+
+import pandas as pd
+
+# Target dtype for every ShotChartDetail column
+SHOT_DTYPES = {
+    "GRID_TYPE": "category",
+    "GAME_ID": "category",
+    "GAME_EVENT_ID": "int32",
+    "PLAYER_ID": "int32",
+    "PLAYER_NAME": "category",
+    "TEAM_ID": "int32",
+    "TEAM_NAME": "category",
+    "PERIOD": "int8",
+    "MINUTES_REMAINING": "int8",
+    "SECONDS_REMAINING": "int8",
+    "EVENT_TYPE": "category",
+    "ACTION_TYPE": "category",
+    "SHOT_TYPE": "category",
+    "SHOT_ZONE_BASIC": "category",
+    "SHOT_ZONE_AREA": "category",
+    "SHOT_ZONE_RANGE": "category",
+    "SHOT_DISTANCE": "int16",
+    "LOC_X": "int16",
+    "LOC_Y": "int16",
+    "SHOT_ATTEMPTED_FLAG": "int8",
+    "SHOT_MADE_FLAG": "int8",
+    "GAME_DATE": "category",
+    "HTM": "category",
+    "VTM": "category",
+}
+
+# Columns used by pipelines/transformation.py and viz/charts.py
+SHOT_COLUMNS = [
+    "PLAYER_ID",
+    "PLAYER_NAME",
+    "SHOT_ZONE_BASIC",
+    "SHOT_MADE_FLAG",
+    "LOC_X",
+    "LOC_Y",
+]
+
+
+def normalize_shots(df_shots):
+    """Casts a shot chart frame to the compact schema, columns that aren't in SHOT_DTYPES are left alone
+    Parameters:
+    - df_shots (pd.DataFrame): Raw or already normalized shot chart data
+    Returns:
+    - (pd.DataFrame) Shot chart data using SHOT_DTYPES
+    """
+    dtypes = {
+        column: dtype
+        for column, dtype in SHOT_DTYPES.items()
+        if column in df_shots.columns and str(df_shots[column].dtype) != dtype
+    }
+    if not dtypes:
+        return df_shots
+    return df_shots.astype(dtypes)
+
+
+def read_shots(path, columns=None):
+    """Reads shot chart parquet (a file or a directory of part files), only loading the requested columns
+    Parameters:
+    - path (str | Path): Parquet file or directory
+    - columns (list): Optional subset of columns, ie: SHOT_COLUMNS
+    Returns:
+    - (pd.DataFrame) Shot chart data using SHOT_DTYPES
+    """
+    return normalize_shots(pd.read_parquet(path, columns=columns))
@@ -0,0 +1,245 @@
+"""Expected Shot Value Model for NBA-SHOT-SELECTION-LLM
+=====================================================
+League baseline expected FG% for every shot, from its zone (SHOT_ZONE_BASIC), distance (from LOC_X/LOC_Y)
+and action type (ACTION_TYPE), so shot selection can be judged on the value of the shots taken and not only on makes.
+
+The model is a lookup table of xFG% per zone x 1 ft distance bin x action type, fit from a season's league
+shots. Sparse cells are shrunk toward their parents (zone x distance, then zone, then the league), so a
+rare action type at an odd distance gets a sensible value. Expected points are xFG% times the shot's
+point value (3 for SHOT_TYPE "3PT Field Goal").
+
+Scoring is a gather into the table with integer codes, no per shot python, so millions of shots
+score in a couple of seconds. Saved next to the league shot store:
+
+    <store root>/shot_value/SEASON=2024-25/SEASON_TYPE=Playoffs/
+        index.json   zone and action type names, distance bins, the prior and the current version
+        v<build>/xfg.npy   (zones + 1) x distance bins x (action types + 1) xFG%, the extra row/column is for unseen values
+
+Example:
+    build_shot_value("2024-25", "Playoffs")
+    model = load_shot_value("2024-25", "Playoffs")
+    xpts = model.expected_points(team_shots)
+=====================================================
+"""
+
+import json
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from pipelines import metrics, store
+from pipelines.aggregate import THREE_POINT_ZONES
+
+SHOT_VALUE_COLUMNS = [
+    "SHOT_ZONE_BASIC",
+    "ACTION_TYPE",
+    "SHOT_TYPE",
+    "LOC_X",
+    "LOC_Y",
+    "SHOT_MADE_FLAG",
+]
+DISTANCE_BINS = 41  # 1 ft bins, 40+ ft shots share the last one
+DEFAULT_PRIOR_ATTEMPTS = 25  # Parent cell attempts blended into each cell's FG%
+THREE_POINT_SHOT_TYPE = "3PT Field Goal"
+
+# Loaded models, keyed on directory and index modification time so a rebuild is picked up
+_loaded = {}
+
+
+def _codes(column, values):
+    """Integer position of every value of a column in a list of known values, unseen values get len(values)
+    Parameters:
+    - column (pd.Series): Categorical or plain column
+    - values (list): Known values
+    Returns:
+    - (np.ndarray) One code per row
+    """
+    index = pd.Index(values)
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # Mapping the few categories instead of every row, the row codes then pick from that
+        positions = np.append(index.get_indexer(column.cat.categories), -1)
+        codes = positions[column.cat.codes.to_numpy()]
+    else:
+        codes = index.get_indexer(column)
+    return np.where(codes < 0, len(values), codes)
+
+
+def distance_bins(df_shots):
+    """Shot distance in 1 ft bins from the court coordinates (LOC_X/LOC_Y are in tenths of a foot)
+    Returns:
+    - (np.ndarray) Bin of every shot, 0 to DISTANCE_BINS - 1
+    """
+    x = df_shots["LOC_X"].to_numpy(np.float32)
+    y = df_shots["LOC_Y"].to_numpy(np.float32)
+    return np.minimum(np.hypot(x, y) / 10, DISTANCE_BINS - 1).astype(np.intp)
+
+
+def point_values(df_shots):
+    """Points a make is worth for every shot, from SHOT_TYPE or the zone when there's no SHOT_TYPE
+    Returns:
+    - (np.ndarray) 2 or 3 per shot
+    """
+    if "SHOT_TYPE" in df_shots.columns:
+        threes = (df_shots["SHOT_TYPE"] == THREE_POINT_SHOT_TYPE).to_numpy()
+    else:
+        threes = df_shots["SHOT_ZONE_BASIC"].isin(THREE_POINT_ZONES).to_numpy()
+    return np.where(threes, 3, 2).astype(np.int8)
+
+
+@dataclass
+class ShotValueModel:
+    """xFG% lookup table
+    Attributes:
+    - zones (list): SHOT_ZONE_BASIC values, the table has one more row for unseen zones
+    - action_types (list): ACTION_TYPE values, the table has one more column for unseen action types
+    - xfg (np.ndarray): (zones + 1) x DISTANCE_BINS x (action types + 1) expected FG%
+    - prior_attempts (float): Parent cell attempts blended into each cell when it was fit
+    """
+
+    zones: list
+    action_types: list
+    xfg: np.ndarray
+    prior_attempts: float = DEFAULT_PRIOR_ATTEMPTS
+
+    def expected_fg_pct(self, df_shots):
+        """Expected FG% of every shot
+        Parameters:
+        - df_shots (pd.DataFrame): Shots with SHOT_ZONE_BASIC, LOC_X, LOC_Y and ACTION_TYPE
+        Returns:
+        - (np.ndarray) float32 xFG% per shot
+        """
+        zone_codes = _codes(df_shots["SHOT_ZONE_BASIC"], self.zones)
+        if "ACTION_TYPE" in df_shots.columns:
+            action_codes = _codes(df_shots["ACTION_TYPE"], self.action_types)
+        else:
+            # The unseen column holds the zone x distance value
+            action_codes = np.full(len(df_shots), len(self.action_types))
+        return np.asarray(self.xfg)[zone_codes, distance_bins(df_shots), action_codes]
+
+    def expected_points(self, df_shots):
+        """Expected points of every shot, xFG% times what a make is worth
+        Returns:
+        - (np.ndarray) float32 xPts per shot
+        """
+        return self.expected_fg_pct(df_shots) * point_values(df_shots)
+
+
+def fit_shot_value(df_shots, prior_attempts=DEFAULT_PRIOR_ATTEMPTS):
+    """Fits the xFG% table from a frame of shots, ie: a season of league shots
+    Parameters:
+    - df_shots (pd.DataFrame): Shots with SHOT_VALUE_COLUMNS
+    - prior_attempts (float): Parent cell attempts blended into each cell's FG%
+    Returns:
+    - (ShotValueModel) Fitted model
+    """
+    zones = sorted(df_shots["SHOT_ZONE_BASIC"].dropna().astype(str).unique())
+    action_types = sorted(df_shots["ACTION_TYPE"].dropna().astype(str).unique())
+    shape = (len(zones) + 1, DISTANCE_BINS, len(action_types) + 1)
+    cells = np.ravel_multi_index(
+        (
+            _codes(df_shots["SHOT_ZONE_BASIC"], zones),
+            distance_bins(df_shots),
+            _codes(df_shots["ACTION_TYPE"], action_types),
+        ),
+        shape,
+    )
+    size = int(np.prod(shape))
+    attempts = np.bincount(cells, minlength=size).reshape(shape).astype(np.float64)
+    makes = np.bincount(
+        cells, weights=df_shots["SHOT_MADE_FLAG"].to_numpy(np.float64), minlength=size
+    ).reshape(shape)
+
+    # Shrinking each level toward the one above it: league -> zone -> zone x distance -> zone x distance x action
+    league = makes.sum() / max(attempts.sum(), 1)
+    zone = (makes.sum(axis=(1, 2)) + prior_attempts * league) / (
+        attempts.sum(axis=(1, 2)) + prior_attempts
+    )
+    zone_distance = (makes.sum(axis=2) + prior_attempts * zone[:, None]) / (
+        attempts.sum(axis=2) + prior_attempts
+    )
+    xfg = (makes + prior_attempts * zone_distance[:, :, None]) / (
+        attempts + prior_attempts
+    )
+    return ShotValueModel(zones, action_types, xfg.astype(np.float32), prior_attempts)
+
+
+def shot_value_dir(season, season_type, root=None):
+    """Directory of a season/season type's shot value model
+    Returns:
+    - (Path) Model directory
+    """
+    return store.partition_dir("shot_value", season, season_type.title(), root=root)
+
+
+def build_shot_value(
+    season="2024-25",
+    season_type="Playoffs",
+    root=None,
+    prior_attempts=DEFAULT_PRIOR_ATTEMPTS,
+):
+    """Fits and saves the shot value model for a season and season type from the league shot store
+    Parameters:
+    - season (str): Season year string
+    - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    - root (str | Path): Store root directory
+    - prior_attempts (float): Parent cell attempts blended into each cell's FG%
+    Returns:
+    - (ShotValueModel) The model that was saved
+    """
+    shots = store.read_team_shots(
+        season, season_type, columns=SHOT_VALUE_COLUMNS, root=root
+    )
+    if shots is None:
+        raise ValueError(
+            f"No shots stored for {season} {season_type}, run store.ingest_league() first"
+        )
+    with metrics.span("shot_value.build") as current:
+        model = fit_shot_value(shots, prior_attempts)
+        out_dir = shot_value_dir(season, season_type, root=root)
+        # A new version per fit, models loaded earlier keep mapping the file of theirs
+        version_dir = store.new_version_dir(out_dir)
+        np.save(version_dir / "xfg.npy", model.xfg)
+        store.publish_version(
+            out_dir,
+            version_dir,
+            {
+                "season": season,
+                "season_type": season_type.title(),
+                "zones": model.zones,
+                "action_types": model.action_types,
+                "distance_bins": DISTANCE_BINS,
+                "prior_attempts": prior_attempts,
+            },
+        )
+        current.set(rows=len(shots))
+    print(f"Built shot value model from {len(shots)} shots: {out_dir}")
+    return model
+
+
+def load_shot_value(season="2024-25", season_type="Playoffs", root=None):
+    """Loads a shot value model, memory mapping its table
+    Parameters:
+    - season (str): Season year string
+    - season_type (str): Time of season
+    - root (str | Path): Store root directory
+    Returns:
+    - (ShotValueModel | None) The model, or None if it hasn't been built
+    """
+    model_dir = shot_value_dir(season, season_type, root=root)
+    index_path = model_dir / "index.json"
+    if not index_path.exists():
+        return None
+    cache_key = (str(model_dir), index_path.stat().st_mtime_ns)
+    if cache_key not in _loaded:
+        meta = json.loads(index_path.read_text())
+        # Dropping the model a refit replaced
+        for stale in [key for key in _loaded if key[0] == str(model_dir)]:
+            del _loaded[stale]
+        _loaded[cache_key] = ShotValueModel(
+            zones=meta["zones"],
+            action_types=meta["action_types"],
+            xfg=np.load(store.version_path(model_dir, meta) / "xfg.npy", mmap_mode="r"),
+            prior_attempts=meta["prior_attempts"],
+        )
+    return _loaded[cache_key]
@@ -0,0 +1,322 @@
+"""League Shot Store for NBA-SHOT-SELECTION-LLM
+=====================================================
+Ingests every team for a season and season type into one Hive partitioned parquet dataset:
+
+    <store root>/shots/SEASON=2024-25/SEASON_TYPE=Playoffs/TEAM_ID=1610612752/<uuid>-0.parquet
+    <store root>/league_averages/SEASON=2024-25/SEASON_TYPE=Playoffs/<uuid>-0.parquet
+
+A single ShotChartDetail request with team_id=0 and player_id=0 returns every shot in the league along with
+the league averages for the same season type, so a full league ingest is normally one request instead of
+30 x (game finder + cumulative stats + shot chart). If the league wide request comes back empty, each team is
+fetched on its own through the rate limited fetch engine with bounded concurrency.
+
+Readers only load their slice, the season/season type/team filters are pushed down to the partition directories.
+Each ingest also rebuilds the zone baseline index (pipelines/baseline.py) and the shot value model
+(pipelines/shot_value.py) for the season, rebuilds the multi-season shot warehouse (pipelines/warehouse.py),
+and adds any new games to the player shot profiles (pipelines/profiles.py).
+
+The root defaults to <repo>/data/store and can be moved with the NBA_SHOT_STORE_DIR environment variable.
+
+Example:
+    ingest_league("2024-25", "Playoffs")
+    knicks = read_team_shots("2024-25", "Playoffs", team_id=1610612752)
+=====================================================
+"""
+
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+import pandas as pd
+from nba_api.stats.static import teams
+
+from pipelines import fetch, metrics
+from pipelines.cache import REPO_ROOT
+from pipelines.schema import normalize_shots
+
+DEFAULT_STORE_ROOT = REPO_ROOT / "data" / "store"
+PARTITION_COLUMNS = ["SEASON", "SEASON_TYPE", "TEAM_ID"]
+
+
+def get_store_root(root=None):
+    """Resolves the store root directory
+    Parameters:
+    - root (str | Path): Explicit root, takes priority over the environment variable
+    Returns:
+    - (Path) Store root
+    """
+    return Path(root or os.environ.get("NBA_SHOT_STORE_DIR", DEFAULT_STORE_ROOT))
+
+
+def partition_dir(dataset, season, season_type, team_id=None, root=None):
+    """Builds the directory of a season/season type (and optionally team) partition.
+    Partition values are url encoded on disk, ie: SEASON_TYPE=Regular%20Season
+    Returns:
+    - (Path) Partition directory
+    """
+    path = (
+        get_store_root(root)
+        / dataset
+        / f"SEASON={quote(season, safe='')}"
+        / f"SEASON_TYPE={quote(season_type, safe='')}"
+    )
+    if team_id is not None:
+        path = path / f"TEAM_ID={int(team_id)}"
+    return path
+
+
+def new_version_dir(directory):
+    """Creates an empty directory for one build of an index saved next to the store (profiles, warehouse, ...).
+    Every build gets its own version so files another reader still has memory mapped are never replaced,
+    which Windows refuses to do
+    Parameters:
+    - directory (Path): The index's directory
+    Returns:
+    - (Path) New version directory, ie: <directory>/v1760668800000000000
+    """
+    version_dir = directory / f"v{time.time_ns()}"
+    version_dir.mkdir(parents=True)
+    return version_dir
+
+
+def publish_version(directory, version_dir, meta):
+    """Points the index's index.json at a finished version, then removes older versions.
+    The directory belongs to the index, everything else in it is removed
+    Parameters:
+    - directory (Path): The index's directory
+    - version_dir (Path): Version written by new_version_dir()
+    - meta (dict): Json saved as index.json, the version's name is added to it
+    """
+    # Swapping index.json in one step, its presence marks the index as complete
+    tmp_path = directory / "index.json.tmp"
+    tmp_path.write_text(json.dumps({**meta, "version": version_dir.name}, indent=2))
+    os.replace(tmp_path, directory / "index.json")
+    # Older versions and files saved before versioning, anything still mapped somewhere can't be removed
+    # on Windows and is retried by the next build
+    for old in directory.iterdir():
+        if old == version_dir or old.name == "index.json":
+            continue
+        if old.is_dir():
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+
+
+def version_path(directory, meta):
+    """Directory holding the files of the version index.json points at
+    Returns:
+    - (Path) Version directory, or directory itself for indexes saved before versioning
+    """
+    return directory / meta["version"] if "version" in meta else directory
+
+
+def fetch_league_shots(season="2024-25", season_type="Playoffs", team_id=0, retry=True):
+    """Pulls every shot for a team, or the whole league when team_id is 0, along with the league averages
+    Parameters:
+    - season (str): Season year string for the desired time frame
+    - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    - team_id (int): Team to pull, 0 = every team
+    - retry (bool): Go through the shared limiter and retry throttled responses (fetch.request()). False when
+      fetch_many() already does both
+    Returns:
+    - shots (pd.DataFrame): Shot chart detail rows
+    - league_avg (pd.DataFrame): League average rows by shot zone for the season type
+    """
+    from nba_api.stats.endpoints import ShotChartDetail
+
+    call = fetch.request if retry else fetch.call_endpoint
+    shot_chart = call(
+        ShotChartDetail,
+        team_id=team_id,
+        player_id=0,  # 0 = all players
+        season_nullable=season,
+        season_type_all_star=season_type.title(),
+        context_measure_simple="FGA",
+    )
+    shots, league_avg = shot_chart.get_data_frames()
+    return shots, league_avg
+
+
+def ingest_league(
+    season="2024-25",
+    season_type="Playoffs",
+    root=None,
+    max_workers=fetch.DEFAULT_MAX_WORKERS,
+    requests_per_second=fetch.DEFAULT_REQUESTS_PER_SECOND,
+    per_team=False,
+):
+    """Ingests every team for a season and season type into the partitioned store, replacing that season/season type
+    Parameters:
+    - season (str): Season year string for the desired time frame
+    - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    - root (str | Path): Store root directory
+    - max_workers (int): Requests in flight at once when teams are fetched one by one
+    - requests_per_second (float): Shared request budget when teams are fetched one by one
+    - per_team (bool): Skip the league wide request and fetch each team on its own
+    Returns:
+    - summary (pd.DataFrame): Number of shots stored per team
+    """
+    season_type = season_type.title()
+    shots = pd.DataFrame()
+    league_avg = pd.DataFrame()
+    if not per_team:
+        # One request for the whole league
+        shots, league_avg = fetch_league_shots(season, season_type, team_id=0)
+    if shots.empty:
+        # Falling back to one request per team, all sharing one request budget
+        print("League wide request returned no shots, fetching teams one by one")
+        team_ids = [team["id"] for team in teams.get_teams()]
+        results = fetch.fetch_many(
+            lambda team_id: fetch_league_shots(
+                season, season_type, team_id=team_id, retry=False
+            ),
+            team_ids,
+            limiter=fetch.limiter_for(requests_per_second),
+            max_workers=max_workers,
+            progress=lambda done, total, team_id: print(
+                f"Team {done} of {total} has been processed - ID = {team_id}"
+            ),
+        )
+        shots = pd.concat([r[0] for r in results.values()], ignore_index=True)
+        league_avg = next(iter(results.values()))[1]
+
+    write_partitions(shots, "shots", season, season_type, root=root)
+    write_partitions(league_avg, "league_averages", season, season_type, root=root)
+    # Rebuilding the zone baseline index so comparisons never read a stale one
+    from pipelines.baseline import build_baseline
+
+    build_baseline(season, season_type, root=root)
+    from pipelines.shot_value import build_shot_value
+
+    build_shot_value(season, season_type, root=root)
+    from pipelines.warehouse import build_warehouse
+
+    build_warehouse(root=root)
+    from pipelines.profiles import update_profiles
+
+    update_profiles(shots, season, season_type, root=root)
+    summary = shots.groupby("TEAM_NAME").size().rename("shots").reset_index()
+    print(
+        f"Stored {len(shots)} shots for {len(summary)} teams - {season} {season_type}"
+    )
+    return summary
+
+
+def write_partitions(df, dataset, season, season_type, root=None):
+    """Writes a frame to one of the store's datasets, replacing the season/season type partition if it exists
+    Parameters:
+    - df (pd.DataFrame): Rows for a single season and season type
+    - dataset (str): Dataset name, "shots" or "league_averages"
+    - season (str): Season year string
+    - season_type (str): Time of season
+    - root (str | Path): Store root directory
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    dataset_root = get_store_root(root) / dataset
+    # Dropping the old partition so teams that are no longer present don't linger
+    shutil.rmtree(
+        partition_dir(dataset, season, season_type, root=root), ignore_errors=True
+    )
+    df = normalize_shots(df).assign(SEASON=season, SEASON_TYPE=season_type)
+    partition_cols = [c for c in PARTITION_COLUMNS if c in df.columns]
+    with metrics.span("store.write", dataset=dataset) as current:
+        pq.write_to_dataset(
+            pa.Table.from_pandas(df, preserve_index=False),
+            root_path=str(dataset_root),
+            partition_cols=partition_cols,
+        )
+        written = partition_dir(dataset, season, season_type, root=root).rglob("*")
+        current.set(
+            rows=len(df),
+            bytes_written=sum(f.stat().st_size for f in written if f.is_file()),
+        )
+
+
+def _read(dataset, filters, columns=None, root=None):
+    # Hive partitioning turns the directory names back into columns and lets the filter skip whole directories
+    dataset_root = get_store_root(root) / dataset
+    if not dataset_root.exists():
+        return None
+    import pyarrow.dataset as ds
+
+    with metrics.span("store.read", dataset=dataset) as current:
+        dataset = ds.dataset(str(dataset_root), format="parquet", partitioning="hive")
+        expression = None
+        for name, value in filters.items():
+            term = ds.field(name) == value
+            expression = term if expression is None else expression & term
+        table = dataset.to_table(columns=columns, filter=expression)
+        # Decoded arrow bytes, the compressed files on disk are smaller
+        current.set(rows=table.num_rows, bytes_read=table.nbytes)
+    if table.num_rows == 0:
+        return None
+    df = table.to_pandas()
+    # The partition keys are the same for every row of a slice, the caller already knows them
+    df = df.drop(columns=["SEASON", "SEASON_TYPE"], errors="ignore")
+    return normalize_shots(df)
+
+
+def has_team_slice(season, season_type, team_id, root=None):
+    """Checks whether a team's season/season type slice is in the store
+    Returns:
+    - (bool) True if the partition directory exists
+    """
+    return partition_dir(
+        "shots", season, season_type.title(), team_id=team_id, root=root
+    ).exists()
+
+
+def read_team_shots(season, season_type, team_id=None, columns=None, root=None):
+    """Reads a slice of the shot dataset, only touching the partitions that match
+    Parameters:
+    - season (str): Season year string
+    - season_type (str): Time of season
+    - team_id (int): Team to read, None reads every team
+    - columns (list): Optional subset of columns to read
+    - root (str | Path): Store root directory
+    Returns:
+    - (pd.DataFrame | None) Shots for the slice, None if it isn't stored
+    """
+    filters = {"SEASON": season, "SEASON_TYPE": season_type.title()}
+    if team_id is not None:
+        filters["TEAM_ID"] = int(team_id)
+    return _read("shots", filters, columns=columns, root=root)
+
+
+def read_league_averages(season, season_type, root=None):
+    """Reads the league averages stored alongside a season/season type's shots
+    Returns:
+    - (pd.DataFrame | None) League averages with ShotChartLeagueWide's columns, None if not stored
+    """
+    filters = {"SEASON": season, "SEASON_TYPE": season_type.title()}
+    return _read("league_averages", filters, root=root)
+
+
+if __name__ == "__main__":
+    # Nightly league ingest, ie: python -m pipelines.store 2024-25 "Regular Season"
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ingest every team into the store")
+    parser.add_argument("season", help="Season year string, ie: 2024-25")
+    parser.add_argument("season_type", help="Regular Season, Playoffs, ...")
+    parser.add_argument("--max-workers", type=int, default=fetch.DEFAULT_MAX_WORKERS)
+    parser.add_argument(
+        "--requests-per-second", type=float, default=fetch.DEFAULT_REQUESTS_PER_SECOND
+    )
+    parser.add_argument("--per-team", action="store_true")
+    args = parser.parse_args()
+    ingest_league(
+        args.season,
+        args.season_type,
+        max_workers=args.max_workers,
+        requests_per_second=args.requests_per_second,
+        per_team=args.per_team,
+    )
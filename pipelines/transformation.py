@@ -1,9 +1,23 @@
+import numpy as np
 import pandas as pd
-from pathlib import Path
 import pipelines.ingest as ing
-from nba_api.stats.endpoints import ShotChartLeagueWide
+from pipelines import (
+    baseline,
+    cache,
+    fetch,
+    metrics,
+    profiles,
+    shot_value,
+    store,
+    warehouse,
+)
+from pipelines.aggregate import build_cube
 
+# Metrics reported in the zone summaries and comparisons. See pipelines/aggregate.py for eFG% and points per shot
+SUMMARY_METRICS = ["attempts", "makes", "fg_pct"]
 
+
+@metrics.timed("transform.summarize_team_shots", rows=True)
 def summarize_team_shots(df_shots):
     """Rolls up a teams shot data based on SHOT_ZONE_BASIC, also calculates the fg_pct
     Parameters:
@@ -12,15 +26,11 @@ def summarize_team_shots(df_shots):
     - summary (pd.DataFrame): Dataframe of summarized shot data based on location
     """
     # Rolling up shot chart data on shot zone, calculating the fga/fgm/fg_pct
-    summary = (
-        df_shots.groupby("SHOT_ZONE_BASIC")
-        .agg(attempts=("SHOT_MADE_FLAG", "count"), makes=("SHOT_MADE_FLAG", "sum"))
-        .reset_index()
-    )
-    summary["fg_pct"] = summary["makes"] / summary["attempts"]
+    summary = build_cube(df_shots, ["SHOT_ZONE_BASIC"]).to_frame(SUMMARY_METRICS)
     return summary
 
 
+@metrics.timed("transform.summarize_player_shots", rows=True)
 def summarize_player_shots(df_shots):
     """Rolls up team shot chart data on player name and shot zone
     Parameters:
@@ -29,16 +39,13 @@ def summarize_player_shots(df_shots):
     - summary (pd.DataFrame): Dataframe of summarized shot data based on location and player
     """
     # Rolling up the shot chart data on a player and shot zone level
-    summary = (
-        df_shots.groupby(["PLAYER_NAME", "SHOT_ZONE_BASIC"])
-        .agg(attempts=("SHOT_MADE_FLAG", "count"), makes=("SHOT_MADE_FLAG", "sum"))
-        .reset_index()
+    summary = build_cube(df_shots, ["PLAYER_NAME", "SHOT_ZONE_BASIC"]).to_frame(
+        SUMMARY_METRICS
     )
-    # Calculating the fgm/fga/fg_pct
-    summary["fg_pct"] = summary["makes"] / summary["attempts"]
     return summary
 
 
+@metrics.timed("transform.summarize_league_avg", rows=True)
 def summarize_league_avg(league_avg):
     """Summarizes league average data by rolling up on shot zone
     Parameters:
@@ -48,14 +55,32 @@ def summarize_league_avg(league_avg):
 
     """
     # Rolling up the league average shot chart data to shot zone
-    summary = league_avg.groupby("SHOT_ZONE_BASIC", as_index=False).agg(
-        attempts=("FGA", "sum"), makes=("FGM", "sum")
-    )
-    # Calculating the fgm/fga/fg_pct
-    summary["fg_pct"] = summary["makes"] / summary["attempts"]
+    # League average rows are already totals per zone/area/range, so FGA and FGM are summed as weights
+    summary = build_cube(
+        league_avg, ["SHOT_ZONE_BASIC"], attempts_col="FGA", makes_col="FGM"
+    ).to_frame(SUMMARY_METRICS)
     return summary
 
 
+def compare_summaries(team_summary, oppo_summary):
+    """Outer merges two zone summaries on SHOT_ZONE_BASIC
+    Parameters:
+    - team_summary (pd.DataFrame): Zone summary of the team of interest
+    - oppo_summary (pd.DataFrame): Zone summary of the opponent or league
+    Returns:
+    - comparison (pd.DataFrame): Outer merged dataframe with _team and _opponent suffixes
+    """
+    # Merging results on shot zone and adding suffixes
+    comparison = pd.merge(
+        team_summary,
+        oppo_summary,
+        on="SHOT_ZONE_BASIC",
+        suffixes=("_team", "_opponent"),
+        how="outer",
+    ).fillna(0)
+    return comparison
+
+
 def compare_stats(team_shots, opponent_shots, league_y_n=True):
     """Creates an outer merged dataframe linked on SHOT_ZONE_BASIC between team of interest and selected opponent (league or individual team)
     Parameters:
@@ -75,23 +100,71 @@ def compare_stats(team_shots, opponent_shots, league_y_n=True):
         # summarizing the opponents shot chart
         oppo_summary = summarize_team_shots(opponent_shots)
 
-    # Merging results on shot zone and adding suffixes
-    comparison = pd.merge(
-        team_summary,
-        oppo_summary,
-        on="SHOT_ZONE_BASIC",
-        suffixes=("_team", "_opponent"),
-        how="outer",
-    ).fillna(0)
+    return compare_summaries(team_summary, oppo_summary)
 
-    return comparison
 
+@metrics.timed("transform.opponent_summary", rows=True)
+def opponent_summary(
+    opponent_team_name="league", season="2024-25", season_type="Playoffs"
+):
+    """Zone summary of the opponent or league side of a comparison.
+    Uses the precomputed baseline index (pipelines/baseline.py) when one has been built for the season,
+    otherwise caches/pulls existing shot chart data to reduce api call time.
+    Parameters:
+    - opponent_team_name (str): Full team name to compare against, or "league"
+    - season (str): Season of interest
+    - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    Returns:
+    - summary (pd.DataFrame): SHOT_ZONE_BASIC, attempts, makes, fg_pct
+    """
+    # A built baseline index turns the opponent side into a lookup
+    index = baseline.load_baseline(season, season_type)
+    if index is not None:
+        try:
+            summary = index.summary(opponent_team_name)
+            metrics.count("baseline.lookups", result="hit")
+            return summary
+        except KeyError:
+            pass
+    metrics.count("baseline.lookups", result="miss")
+
+    # Checking if the opponent team name has been submitted
+    if opponent_team_name == "league":
+        # League average mode, preferring the season type specific averages from the league shot store
+        league_avg = store.read_league_averages(season, season_type)
+        if league_avg is None:
+            # Otherwise read from the parquet cache and only fetched from the api on a miss.
+            # ShotChartLeagueWide only covers the regular season, so that is what decides when the entry expires
+            def fetch_league_avg():
+                from nba_api.stats.endpoints import ShotChartLeagueWide
 
+                return fetch.request(
+                    ShotChartLeagueWide, season=season
+                ).get_data_frames()[0]
+
+            league_avg = cache.get_cache().get_or_fetch(
+                "ShotChartLeagueWide",
+                {"season": season, "season_type": "Regular Season"},
+                fetch_league_avg,
+            )
+        return summarize_league_avg(league_avg)
+    # Run ingestion pipeline for opponent, only the zone and result are compared
+    opponent_shots = ing.ingest_data(
+        team_name=opponent_team_name,
+        num_players=-1,
+        season=season,
+        season_type=season_type,
+        columns=["SHOT_ZONE_BASIC", "SHOT_MADE_FLAG"],
+    )
+    return summarize_team_shots(opponent_shots)
+
+
+@metrics.timed("transform.compare_to_league", rows=True)
 def compare_to_league(
     team_shots, opponent_team_name="league", season="2024-25", season_type="Playoffs"
 ):
     """Performs full comparison between the current shot chart data and user selected opponent, season, and season type.
-    Also caches/pulls existing shot chart data to reduce api call time.
+    See opponent_summary() for where the opponent side comes from.
     Parameters:
     - team_shots (pd.DataFrame): Dataframe of shot chart data from ingest.py
     - opponent_team_name (str): Full team name to compare against
@@ -100,32 +173,260 @@ def compare_to_league(
     Returns:
     - comparison (pd.DataFrame): Outer merged dataframe showing the shot chart data for the current team against the opponents fga/fgm/fg_pct
     """
-    # Identifying and creating the data_dir if necessary
-    data_dir = Path.cwd() / "data" / "shotcharts"
-    # Checking if the opponent team name has been submitted
-    if opponent_team_name == "league":
-        # League average mode
-        league_path = data_dir / f"league_avg_{season}.parquet"
-        # Checking if the league average data is cached
-        if league_path.exists():
-            league_avg = pd.read_parquet(league_path)
-        else:
-            # Fetch from API
-            league_avg = ShotChartLeagueWide(season=season).get_data_frames()[0]
-            league_avg.to_parquet(league_path, index=False)
-        # Comparing the current team to league average
-        comparison = compare_stats(team_shots, league_avg, league_y_n=True)
-    else:
-        # Run ingestion pipeline for opponent
-        opponent_shots = ing.ingest_data(
-            team_name=opponent_team_name,
-            num_players=-1,
-            season=season,
-            season_type=season_type,
+    oppo_summary = opponent_summary(opponent_team_name, season, season_type)
+    return compare_summaries(summarize_team_shots(team_shots), oppo_summary)
+
+
+@metrics.timed("transform.compare_to_all", rows=True)
+def compare_to_all(team_shots, season="2024-25", season_type="Playoffs"):
+    """Compares a team against every other team in the baseline index at once
+    Parameters:
+    - team_shots (pd.DataFrame): Dataframe of shot chart data from ingest.py
+    - season (str): Season of the baseline index
+    - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    Returns:
+    - comparison (pd.DataFrame): One row per opponent and zone, with OPPONENT_NAME and the same columns as compare_stats()
+    """
+    index = baseline.load_baseline(season, season_type)
+    if index is None:
+        raise ValueError(
+            f"No baseline index for {season} {season_type}, run store.ingest_league() first"
         )
-        # Comparing the current team to specified opponent
-        comparison = compare_stats(team_shots, opponent_shots, league_y_n=False)
-    return comparison
+    team_summary = summarize_team_shots(team_shots).set_index("SHOT_ZONE_BASIC")
+    zones = list(index.zones) + [z for z in team_summary.index if z not in index.zones]
+    team_summary = team_summary.reindex(zones, fill_value=0)
+
+    # Every opponent row of the index at once, leaving out the team itself
+    rows = np.arange(1, len(index.team_ids) + 1)
+    if "TEAM_ID" in team_shots.columns and len(team_shots):
+        rows = rows[np.asarray(index.team_ids) != int(team_shots["TEAM_ID"].iloc[0])]
+    extra = len(zones) - len(index.zones)
+    oppo_attempts = np.pad(np.asarray(index.attempts)[rows], ((0, 0), (0, extra)))
+    oppo_makes = np.pad(np.asarray(index.makes)[rows], ((0, 0), (0, extra)))
+
+    n_opponents = len(rows)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        oppo_fg_pct = np.where(oppo_attempts > 0, oppo_makes / oppo_attempts, 0)
+    comparison = pd.DataFrame(
+        {
+            "OPPONENT_NAME": np.repeat(
+                np.asarray(index.team_names, dtype=object)[rows - 1], len(zones)
+            ),
+            "SHOT_ZONE_BASIC": np.tile(np.asarray(zones, dtype=object), n_opponents),
+            "attempts_team": np.tile(team_summary["attempts"].to_numpy(), n_opponents),
+            "makes_team": np.tile(team_summary["makes"].to_numpy(), n_opponents),
+            "fg_pct_team": np.tile(team_summary["fg_pct"].to_numpy(), n_opponents),
+            "attempts_opponent": oppo_attempts.ravel().astype(np.int64),
+            "makes_opponent": oppo_makes.ravel().astype(np.int64),
+            "fg_pct_opponent": oppo_fg_pct.ravel(),
+        }
+    )
+    # Dropping zones neither side shot from, like the outer merge in compare_stats()
+    return comparison[
+        (comparison["attempts_team"] > 0) | (comparison["attempts_opponent"] > 0)
+    ].reset_index(drop=True)
+
+
+def aggregate_shots(table, keys):
+    """Attempts, makes and FG% of an Arrow table of shots, grouped in Arrow so only the totals become pandas
+    Parameters:
+    - table (pa.Table): Shots with the key columns and SHOT_MADE_FLAG, ie: a warehouse scan
+    - keys (list): Columns to group on
+    Returns:
+    - summary (pd.DataFrame): Key columns followed by attempts, makes, fg_pct, sorted by the keys
+    """
+    totals = (
+        table.group_by(list(keys))
+        .aggregate([("SHOT_MADE_FLAG", "count"), ("SHOT_MADE_FLAG", "sum")])
+        .to_pandas()
+        .rename(
+            columns={"SHOT_MADE_FLAG_count": "attempts", "SHOT_MADE_FLAG_sum": "makes"}
+        )
+    )
+    for key in keys:
+        if isinstance(totals[key].dtype, pd.CategoricalDtype):
+            totals[key] = totals[key].astype(str)
+    summary = totals[[*keys, "attempts", "makes"]].sort_values(list(keys))
+    summary["fg_pct"] = summary["makes"] / summary["attempts"]
+    return summary.reset_index(drop=True)
+
+
+def _scan_window(team_name, player_id, window, columns):
+    # Scans the shot warehouse (pipelines/warehouse.py) for a team or player, or the whole league
+    shots = warehouse.load_warehouse()
+    if shots is None:
+        raise ValueError("No shot warehouse, run warehouse.build_warehouse() first")
+    team_id = None
+    if team_name is not None and team_name != "league":
+        team_id = ing.get_team_id(team_name=team_name)
+    return shots.scan(
+        team_id=team_id, player_id=player_id, window=window, columns=columns
+    )
+
+
+@metrics.timed("transform.summarize_window", rows=True)
+def summarize_window(
+    team_name=None, player_id=None, window=None, keys=("SHOT_ZONE_BASIC",)
+):
+    """Zone summary over any span of games in the shot warehouse, ie: a team's last five seasons.
+    The scan is a slice of the memory mapped warehouse and is aggregated in Arrow, the shots never become a pandas frame
+    Parameters:
+    - team_name (str): Full team name, None or "league" for every team
+    - player_id (int): Optional player, combined with team_name when both are given
+    - window (warehouse.Window): Dates, seasons, season type and/or last n games, None for the whole history
+    - keys (tuple): Columns to group on, ie: ("SHOT_ZONE_BASIC", "SHOT_ZONE_AREA") or ("SEASON", "SHOT_ZONE_BASIC")
+    Returns:
+    - summary (pd.DataFrame): Key columns followed by attempts, makes, fg_pct
+    """
+    table = _scan_window(team_name, player_id, window, [*keys, "SHOT_MADE_FLAG"])
+    return aggregate_shots(table, list(keys))
+
+
+@metrics.timed("transform.compare_window", rows=True)
+def compare_window(team_name, opponent_team_name="league", window=None):
+    """Same comparison as compare_to_league() over a warehouse window instead of one season
+    Parameters:
+    - team_name (str): Full team name
+    - opponent_team_name (str): Full team name to compare against, or "league"
+    - window (warehouse.Window): Games to cover on both sides
+    Returns:
+    - comparison (pd.DataFrame): See compare_summaries()
+    """
+    return compare_summaries(
+        summarize_window(team_name, window=window),
+        summarize_window(opponent_team_name, window=window),
+    )
+
+
+@metrics.timed("transform.rolling_zone_mix", rows=True)
+def rolling_zone_mix(team_name=None, player_id=None, games=10, window=None):
+    """Share of attempts from each zone over a rolling span of games
+    Parameters:
+    - team_name (str): Full team name
+    - player_id (int): Optional player instead of (or within) the team
+    - games (int): Games in the rolling span
+    - window (warehouse.Window): Games to cover, None for the whole history
+    Returns:
+    - mix (pd.DataFrame): One row per game (GAME_DATE, GAME_ID) with one attempt share column per zone
+    """
+    table = _scan_window(
+        team_name,
+        player_id,
+        window,
+        ["GAME_DATE", "GAME_ID", "SHOT_ZONE_BASIC", "SHOT_MADE_FLAG"],
+    )
+    # Per game totals are small (games x zones), so the rolling part is done in pandas
+    per_game = aggregate_shots(table, ["GAME_DATE", "GAME_ID", "SHOT_ZONE_BASIC"])
+    attempts = per_game.pivot_table(
+        index=["GAME_DATE", "GAME_ID"],
+        columns="SHOT_ZONE_BASIC",
+        values="attempts",
+        aggfunc="sum",
+        fill_value=0,
+    ).sort_index()
+    rolling = attempts.rolling(games, min_periods=1).sum()
+    mix = rolling.div(rolling.sum(axis=1), axis=0)
+    mix.columns.name = None
+    return mix.reset_index()
+
+
+@metrics.timed("transform.similar_players", rows=True)
+def similar_players(
+    player,
+    season="2024-25",
+    season_type="Playoffs",
+    k=profiles.DEFAULT_TOP_K,
+    min_attempts=profiles.DEFAULT_MIN_ATTEMPTS,
+):
+    """Players league wide whose shot profile (zone attempt share and FG%) is closest to a player's
+    Parameters:
+    - player (str | int): Full player name or player id
+    - season (str): Season of the profiles
+    - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    - k (int): Number of players to return
+    - min_attempts (int): Leave out players with fewer attempts than this
+    Returns:
+    - similar (pd.DataFrame): PLAYER_ID, PLAYER_NAME, attempts and similarity, most similar first
+    """
+    player_profiles = profiles.load_profiles(season, season_type)
+    if player_profiles is None:
+        # Built once per season from the league store, ingest_league keeps them current after that
+        player_profiles = profiles.build_profiles(season, season_type)
+    return player_profiles.similar(player, k=k, min_attempts=min_attempts)
+
+
+def _expected_points(df_shots, season, season_type):
+    # Points scored and league baseline expected points of every shot, from the season's shot value model
+    model = shot_value.load_shot_value(season, season_type)
+    if model is None:
+        model = shot_value.build_shot_value(season, season_type)
+    values = shot_value.point_values(df_shots)
+    points = df_shots["SHOT_MADE_FLAG"].to_numpy() * values
+    # float64 so sums over millions of shots stay exact to the point
+    return points, model.expected_fg_pct(df_shots).astype(np.float64) * values
+
+
+def _sum_over_expected(df_shots, keys, points, xpts):
+    # Only the key columns and two arrays go into the groupby, the shots frame isn't copied
+    frame = df_shots[list(keys)].assign(attempts=1, points=points, xpts=xpts)
+    summary = frame.groupby(list(keys), observed=True).sum().reset_index()
+    summary["poe"] = summary["points"] - summary["xpts"]
+    summary["poe_per_shot"] = summary["poe"] / summary["attempts"]
+    return summary
+
+
+@metrics.timed("transform.score_shots", rows=True)
+def score_shots(df_shots, season="2024-25", season_type="Playoffs"):
+    """Adds the league baseline expected points of every shot (see pipelines/shot_value.py)
+    Parameters:
+    - df_shots (pd.DataFrame): Shot chart data with SHOT_ZONE_BASIC, LOC_X, LOC_Y, ACTION_TYPE and SHOT_TYPE
+    - season (str): Season of the shot value model
+    - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    Returns:
+    - scored (pd.DataFrame): df_shots with PTS, XPTS and POE (points over expected) columns
+    """
+    points, xpts = _expected_points(df_shots, season, season_type)
+    return df_shots.assign(PTS=points, XPTS=xpts, POE=points - xpts)
+
+
+@metrics.timed("transform.points_over_expected", rows=True)
+def points_over_expected(
+    df_shots, keys=("SHOT_ZONE_BASIC",), season="2024-25", season_type="Playoffs"
+):
+    """Points scored against the league baseline expected points for any grouping
+    Parameters:
+    - df_shots (pd.DataFrame): Shot chart data, see score_shots()
+    - keys (tuple): Columns to group on, ie: ("PLAYER_NAME",) or ("TEAM_NAME", "SHOT_ZONE_BASIC")
+    - season (str): Season of the shot value model
+    - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    Returns:
+    - summary (pd.DataFrame): keys, attempts, points, xpts, poe and poe_per_shot
+    """
+    points, xpts = _expected_points(df_shots, season, season_type)
+    return _sum_over_expected(df_shots, keys, points, xpts)
+
+
+@metrics.timed("transform.shot_quality")
+def shot_quality(df_shots, season="2024-25", season_type="Playoffs"):
+    """Points over expected per team, player and zone, scoring the shots once
+    Parameters:
+    - df_shots (pd.DataFrame): Shot chart data for a team or the whole league, see score_shots()
+    - season (str): Season of the shot value model
+    - season_type (str): Time of season ^(Regular Season)|(Pre Season)|(Playoffs)|(All Star)$
+    Returns:
+    - (dict) "team", "player" and "zone" summaries like points_over_expected()
+    """
+    points, xpts = _expected_points(df_shots, season, season_type)
+    team_key = "TEAM_NAME" if "TEAM_NAME" in df_shots.columns else "TEAM_ID"
+    player_key = "PLAYER_NAME" if "PLAYER_NAME" in df_shots.columns else "PLAYER_ID"
+    return {
+        name: _sum_over_expected(df_shots, [key], points, xpts)
+        for name, key in [
+            ("team", team_key),
+            ("player", player_key),
+            ("zone", "SHOT_ZONE_BASIC"),
+        ]
+    }
 
 
 def prepare_shot_chart_data(df_shots):
@@ -0,0 +1,355 @@
+"""Shot Warehouse for NBA-SHOT-SELECTION-LLM
+=====================================================
+Every season and season type in the league shot store (pipelines/store.py) in one memory mapped Arrow file,
+for questions that span many seasons, ie: "Knicks corner 3 FG% over the last five seasons" or
+"rolling 10 game zone mix", without reading and concatenating one parquet file per team/season.
+
+Built from the store and saved next to it:
+
+    <store root>/warehouse/
+        index.json         row count, columns, the first/last game date of every season and the current version
+        v<build>/
+            by_team.arrow      every shot sorted by TEAM_ID, GAME_DATE, PLAYER_ID (uncompressed Arrow IPC)
+            by_player.arrow    the same shots sorted by PLAYER_ID, GAME_DATE
+            team_keys.npy / team_offsets.npy       team id -> [start, end) rows in by_team.arrow
+            player_keys.npy / player_offsets.npy   player id -> [start, end) rows in by_player.arrow
+
+Each build is written to a new version directory and index.json is switched to it, so a running server
+keeps scanning the files it has mapped until it picks up the new build.
+
+GAME_DATE is stored as an int32 yyyymmdd, so a date window inside a team's (or player's) rows is two binary
+searches. The files are memory mapped, a scan for one team or player and a date window is a zero-copy slice
+of the mapped file, and only the rows an aggregation touches are ever paged in.
+
+Example:
+    build_warehouse()
+    warehouse = load_warehouse()
+    knicks = warehouse.scan(team_id=1610612752, window=Window(seasons=5))
+    shots = warehouse.scan(player_id=1628973, window=Window(last_games=10))
+=====================================================
+"""
+
+import json
+from dataclasses import dataclass
+
+import numpy as np
+
+from pipelines import metrics, store
+
+WAREHOUSE_DIR = "warehouse"
+SORT_ORDERS = {
+    "by_team": ["TEAM_ID", "GAME_DATE", "PLAYER_ID"],
+    "by_player": ["PLAYER_ID", "GAME_DATE"],
+}
+
+# Loaded warehouses, keyed on directory and index modification time so a rebuild is picked up
+_loaded = {}
+
+
+@dataclass
+class Window:
+    """Which games a scan covers, every field is optional and they combine
+    Attributes:
+    - start / end (str | int): First and last game date, inclusive, ie: "2024-01-01" or 20240101
+    - seasons (int | list): The last n seasons in the warehouse, or a list of season strings
+    - season_type (str): Only one season type, ie: "Playoffs"
+    - last_games (int): Only the last n games of the team or player, after the other filters
+    """
+
+    start: object = None
+    end: object = None
+    seasons: object = None
+    season_type: str = None
+    last_games: int = None
+
+
+def date_key(value):
+    """Converts a date to the warehouse's int yyyymmdd form
+    Parameters:
+    - value (str | int | date): ie: "2024-01-01", "20240101", 20240101 or a datetime
+    Returns:
+    - (int) yyyymmdd
+    """
+    if hasattr(value, "strftime"):
+        return int(value.strftime("%Y%m%d"))
+    return int(str(value).replace("-", "").replace("/", "")[:8])
+
+
+def warehouse_dir(root=None):
+    """Directory of the warehouse files
+    Returns:
+    - (Path) Warehouse directory
+    """
+    return store.get_store_root(root) / WAREHOUSE_DIR
+
+
+def _column(table, name):
+    # Zero-copy NumPy view of a single chunk, fixed width column without nulls
+    return table.column(name).chunk(0).to_numpy(zero_copy_only=True)
+
+
+def _key_offsets(keys):
+    """Start/end offsets of each run of equal keys in a sorted array
+    Returns:
+    - unique (np.ndarray): Distinct keys in order
+    - offsets (np.ndarray): len(unique) + 1 row offsets, key i covers offsets[i]:offsets[i + 1]
+    """
+    unique, starts = np.unique(keys, return_index=True)
+    return unique, np.append(starts, len(keys)).astype(np.int64)
+
+
+def build_warehouse(root=None):
+    """Builds the warehouse from every season and season type in the league shot store
+    Parameters:
+    - root (str | Path): Store root directory
+    Returns:
+    - (ShotWarehouse) The warehouse that was saved
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    shots_root = store.get_store_root(root) / "shots"
+    if not shots_root.exists():
+        raise ValueError("No shots stored, run store.ingest_league() first")
+    with metrics.span("warehouse.build") as current:
+        table = ds.dataset(
+            str(shots_root), format="parquet", partitioning="hive"
+        ).to_table()
+        # Each partition file brings its own categorical dictionary (with int8 codes from pandas),
+        # they are widened and merged into one per column
+        table = table.cast(
+            pa.schema(
+                [
+                    (
+                        field.with_type(
+                            pa.dictionary(pa.int32(), field.type.value_type)
+                        )
+                        if pa.types.is_dictionary(field.type)
+                        else field
+                    )
+                    for field in table.schema
+                ]
+            )
+        )
+        table = table.unify_dictionaries().combine_chunks()
+        dates = pc.cast(pc.cast(table.column("GAME_DATE"), pa.string()), pa.int32())
+        table = table.set_column(
+            table.schema.get_field_index("GAME_DATE"), "GAME_DATE", dates
+        )
+        for name in ["SEASON", "SEASON_TYPE"]:
+            table = table.set_column(
+                table.schema.get_field_index(name),
+                name,
+                pc.dictionary_encode(pc.cast(table.column(name), pa.string())),
+            )
+        table = table.cast(
+            pa.schema(
+                [
+                    (
+                        field.with_type(pa.int32())
+                        if field.name in ("TEAM_ID", "PLAYER_ID")
+                        else field
+                    )
+                    for field in table.schema
+                ]
+            )
+        )
+
+        out_dir = warehouse_dir(root)
+        version_dir = store.new_version_dir(out_dir)
+        for name, order in SORT_ORDERS.items():
+            indices = pc.sort_indices(
+                table, [(column, "ascending") for column in order]
+            )
+            sorted_table = table.take(indices).combine_chunks()
+            # Written as a single uncompressed record batch so every column maps to one contiguous buffer
+            with pa.OSFile(str(version_dir / f"{name}.arrow"), "wb") as sink:
+                with pa.ipc.new_file(sink, sorted_table.schema) as writer:
+                    writer.write_table(sorted_table, max_chunksize=max(1, len(table)))
+            key = order[0].split("_")[0].lower()
+            keys, offsets = _key_offsets(_column(sorted_table, order[0]))
+            np.save(version_dir / f"{key}_keys.npy", keys)
+            np.save(version_dir / f"{key}_offsets.npy", offsets)
+            del sorted_table
+
+        # Seasons never overlap in time, so each one is a date range
+        season_dates = (
+            table.group_by("SEASON")
+            .aggregate([("GAME_DATE", "min"), ("GAME_DATE", "max")])
+            .to_pylist()
+        )
+        seasons = {
+            str(row["SEASON"]): [row["GAME_DATE_min"], row["GAME_DATE_max"]]
+            for row in sorted(season_dates, key=lambda row: row["GAME_DATE_min"])
+        }
+        current.set(rows=len(table), bytes_written=_dir_bytes(version_dir))
+        store.publish_version(
+            out_dir,
+            version_dir,
+            {"rows": len(table), "columns": table.column_names, "seasons": seasons},
+        )
+    print(f"Built shot warehouse with {len(table)} shots: {out_dir}")
+    return load_warehouse(root)
+
+
+def _dir_bytes(path):
+    return sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+
+
+class ShotWarehouse:
+    """Memory mapped view of the warehouse files
+    Attributes:
+    - by_team / by_player (pa.Table): Mapped tables in each sort order
+    - seasons (dict): Season -> [first, last] game date as yyyymmdd
+    """
+
+    def __init__(self, directory):
+        import pyarrow as pa
+
+        meta = json.loads((directory / "index.json").read_text())
+        self.seasons = meta["seasons"]
+        self.rows = meta["rows"]
+        directory = store.version_path(directory, meta)
+        self.by_team = pa.ipc.open_file(
+            pa.memory_map(str(directory / "by_team.arrow"))
+        ).read_all()
+        self.by_player = pa.ipc.open_file(
+            pa.memory_map(str(directory / "by_player.arrow"))
+        ).read_all()
+        self._keys = {
+            key: (
+                np.load(directory / f"{key}_keys.npy", mmap_mode="r"),
+                np.load(directory / f"{key}_offsets.npy", mmap_mode="r"),
+            )
+            for key in ["team", "player"]
+        }
+
+    def _range(self, key, value):
+        # Rows [start, end) of one team or player in its sort order
+        keys, offsets = self._keys[key]
+        position = int(np.searchsorted(keys, value))
+        if position == len(keys) or keys[position] != value:
+            return 0, 0
+        return int(offsets[position]), int(offsets[position + 1])
+
+    def _date_ranges(self, window):
+        # Inclusive yyyymmdd ranges from the window's dates and seasons, one per season when seasons are given
+        # so listed seasons that aren't consecutive don't pull in the ones between them
+        low, high = 0, 99999999
+        if window.start is not None:
+            low = date_key(window.start)
+        if window.end is not None:
+            high = date_key(window.end)
+        if window.seasons is None:
+            return [(low, high)]
+        seasons = list(self.seasons)
+        wanted = (
+            seasons[-window.seasons :]
+            if isinstance(window.seasons, int)
+            else [season for season in seasons if season in window.seasons]
+        )
+        ranges = [
+            (max(low, self.seasons[season][0]), min(high, self.seasons[season][1]))
+            for season in wanted
+        ]
+        return [(first, last) for first, last in ranges if first <= last]
+
+    def scan(self, team_id=None, player_id=None, window=None, columns=None):
+        """Shots for a team and/or player in a window. Team or player alone with a date/season window is
+        a zero-copy slice of the mapped file, a season type or a team and player together filter that slice
+        Parameters:
+        - team_id (int): Team to scan, None for every team
+        - player_id (int): Player to scan, None for every player
+        - window (Window): Games to cover, None for the whole history
+        - columns (list): Optional subset of columns
+        Returns:
+        - (pa.Table) Shots sorted by game date within the team or player
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        window = window or Window()
+        if player_id is not None:
+            table = self.by_player
+            start, end = self._range("player", int(player_id))
+        elif team_id is not None:
+            table = self.by_team
+            start, end = self._range("team", int(team_id))
+        else:
+            table, start, end = self.by_team, 0, self.rows
+        table = table.slice(start, end - start)
+        dates = _column(table, "GAME_DATE")
+
+        ranges = self._date_ranges(window)
+        if player_id is None and team_id is None:
+            # The whole league isn't sorted by date, so a window over it is a mask
+            if ranges != [(0, 99999999)]:
+                mask = np.zeros(len(dates), dtype=bool)
+                for low, high in ranges:
+                    mask |= (dates >= low) & (dates <= high)
+                table = table.filter(pa.array(mask))
+        else:
+            # Sorted by date within the team or player, so each range is a contiguous slice
+            slices = []
+            for low, high in ranges:
+                first = int(np.searchsorted(dates, low, side="left"))
+                last = int(np.searchsorted(dates, high, side="right"))
+                slices.append(table.slice(first, last - first))
+            # Concatenating slices keeps them as chunks of the mapped file, nothing is copied
+            table = pa.concat_tables(slices) if slices else table.slice(0, 0)
+
+        if team_id is not None and player_id is not None:
+            table = table.filter(pc.equal(table.column("TEAM_ID"), int(team_id)))
+        if window.season_type is not None:
+            table = table.filter(
+                pc.equal(
+                    pc.cast(table.column("SEASON_TYPE"), "string"),
+                    window.season_type.title(),
+                )
+            )
+        if window.last_games:
+            # Keeping everything from the nth last distinct game date on
+            game_dates = np.unique(table.column("GAME_DATE").to_numpy())
+            if len(game_dates) > window.last_games:
+                cutoff = game_dates[-window.last_games]
+                table = table.filter(
+                    pc.greater_equal(table.column("GAME_DATE"), cutoff)
+                )
+        return table if columns is None else table.select(columns)
+
+
+def load_warehouse(root=None):
+    """Opens the warehouse, memory mapping its files
+    Parameters:
+    - root (str | Path): Store root directory
+    Returns:
+    - (ShotWarehouse | None) The warehouse, or None if it hasn't been built
+    """
+    directory = warehouse_dir(root)
+    index_path = directory / "index.json"
+    if not index_path.exists():
+        return None
+    cache_key = (str(directory), index_path.stat().st_mtime_ns)
+    if cache_key not in _loaded:
+        _loaded.clear()
+        _loaded[cache_key] = ShotWarehouse(directory)
+    return _loaded[cache_key]
+
+
+def to_shots_frame(table):
+    """Converts a scan to a pandas frame in the compact shot schema, only for small scans
+    Returns:
+    - (pd.DataFrame) Shots, GAME_DATE back as a yyyymmdd category like the api returns
+    """
+    from pipelines.schema import normalize_shots
+
+    df = table.to_pandas()
+    if "GAME_DATE" in df.columns:
+        df["GAME_DATE"] = df["GAME_DATE"].astype(str)
+    return normalize_shots(df)
+
+
+if __name__ == "__main__":
+    # Rebuild after a league ingest, ie: python -m pipelines.warehouse
+    build_warehouse()
@@ -0,0 +1,115 @@
+"""Batch summary tests against the stub Ollama server from llm/stub_server.py"""
+
+import json
+
+import pandas as pd
+import pytest
+
+from llm import summarizer
+from llm.batch import load_results, summarize_batch
+from llm.cache import configure_summary_cache
+from llm.stub_server import CANNED_SUMMARY, start_stub_server
+
+
+def comparison(attempts):
+    return pd.DataFrame(
+        {
+            "SHOT_ZONE_BASIC": ["Restricted Area", "Mid-Range", "Above the Break 3"],
+            "attempts_team": [attempts, 40, 120],
+            "makes_team": [60, 16, 42],
+            "fg_pct_team": [60 / attempts, 0.4, 0.35],
+            "attempts_opponent": [95, 50, 110],
+            "makes_opponent": [58, 21, 37],
+            "fg_pct_opponent": [58 / 95, 0.42, 37 / 110],
+        }
+    )
+
+
+ITEMS = [
+    {
+        "id": f"team-{i}",
+        "team_name": f"Team {i}",
+        "opponent_name": "league",
+        "comparison_df": comparison(100 + i),
+    }
+    for i in range(4)
+]
+
+
+@pytest.fixture
+def stub_host():
+    server, host = start_stub_server(token_delay=0.001)
+    original = summarizer._settings["host"]
+    summarizer.configure_client(host=host)
+    yield host
+    server.shutdown()
+    server.server_close()
+    summarizer.configure_client(host=original)
+
+
+@pytest.fixture
+def summary_cache(tmp_path):
+    cache = configure_summary_cache(root=tmp_path / "summaries")
+    yield cache
+    configure_summary_cache()
+
+
+def test_summarize_batch_streams_every_item(stub_host, tmp_path):
+    output_path = tmp_path / "batch.jsonl"
+    results = summarize_batch(ITEMS, output_path, concurrency=2, use_cache=False)
+    assert [result["id"] for result in results] == [item["id"] for item in ITEMS]
+    assert all(result["status"] == "ok" for result in results)
+    assert all(result["summary"].strip() == CANNED_SUMMARY for result in results)
+    assert all(result["first_token_s"] is not None for result in results)
+    assert set(load_results(output_path)) == {item["id"] for item in ITEMS}
+
+
+def test_summarize_batch_resumes_from_jsonl(stub_host, tmp_path):
+    output_path = tmp_path / "batch.jsonl"
+    summarize_batch(ITEMS[:2], output_path, use_cache=False)
+    # A failed item and a line cut off by a crash, both rerun
+    with open(output_path, "a") as output:
+        output.write(
+            json.dumps({"id": "team-2", "status": "error", "error": "Timeout"}) + "\n"
+        )
+        output.write('{"id": "team-3", "sta')
+
+    results = summarize_batch(ITEMS, output_path, use_cache=False)
+    assert all(result["status"] == "ok" for result in results)
+    lines = output_path.read_text().splitlines()
+    written = [json.loads(line)["id"] for line in lines if line.endswith("}")]
+    # The two items that already succeeded were not summarized again
+    assert sorted(written) == ["team-0", "team-1", "team-2", "team-2", "team-3"]
+
+
+def test_failed_items_are_recorded_and_retried(tmp_path):
+    # Nothing listening yet, every item fails
+    server, host = start_stub_server()
+    server.shutdown()
+    server.server_close()
+    original = summarizer._settings["host"]
+    summarizer.configure_client(host=host)
+    try:
+        output_path = tmp_path / "batch.jsonl"
+        results = summarize_batch(ITEMS, output_path, use_cache=False)
+        assert all(result["status"] == "error" for result in results)
+    finally:
+        summarizer.configure_client(host=original)
+
+    server, host = start_stub_server()
+    summarizer.configure_client(host=host)
+    try:
+        results = summarize_batch(ITEMS, output_path, use_cache=False)
+    finally:
+        server.shutdown()
+        server.server_close()
+        summarizer.configure_client(host=original)
+    assert all(result["status"] == "ok" for result in results)
+
+
+def test_cached_summaries_skip_the_server(stub_host, summary_cache, tmp_path):
+    summarize_batch(ITEMS, tmp_path / "first.jsonl")
+    summarizer.configure_client(host="http://127.0.0.1:9")
+    results = summarize_batch(ITEMS, tmp_path / "second.jsonl", resume=False)
+    assert all(result["status"] == "ok" for result in results)
+    assert all(result["summary"].strip() == CANNED_SUMMARY for result in results)
@@ -0,0 +1,22 @@
+"""Parquet cache tests"""
+
+import datetime as dt
+
+from pipelines.cache import season_is_complete
+
+
+def test_pre_season_is_complete_in_the_first_calendar_year():
+    # 2024-25 pre season is played in October 2024
+    assert not season_is_complete("2024-25", "Pre Season", today=dt.date(2024, 10, 15))
+    assert season_is_complete("2024-25", "Pre Season", today=dt.date(2024, 11, 1))
+    assert season_is_complete("2024-25", "Pre Season", today=dt.date(2025, 1, 15))
+
+
+def test_regular_season_and_playoffs_end_in_the_second_calendar_year():
+    assert not season_is_complete(
+        "2024-25", "Regular Season", today=dt.date(2025, 4, 30)
+    )
+    assert season_is_complete("2024-25", "Regular Season", today=dt.date(2025, 5, 1))
+    assert not season_is_complete("2024-25", "Playoffs", today=dt.date(2025, 6, 30))
+    assert season_is_complete("2024-25", "Playoffs", today=dt.date(2025, 7, 1))
+    assert not season_is_complete("not a season", "Playoffs")
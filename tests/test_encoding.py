@@ -0,0 +1,23 @@
+"""Prompt encoding tests"""
+
+import pandas as pd
+
+from llm.encoding import encode_comparison, estimate_tokens, format_table
+
+
+def test_rows_the_team_never_shot_from_are_dropped_first():
+    comparison = pd.DataFrame(
+        {
+            "SHOT_ZONE_BASIC": ["Backcourt", "Restricted Area", "Mid-Range"],
+            "attempts_team": [0, 300, 120],
+            # The league takes far more shots from everywhere, even the zone the team never used
+            "attempts_opponent": [90000.0, 40000.0, 20000.0],
+            "fg_pct_team": [0.0, 0.65, 0.41],
+            "fg_pct_opponent": [0.03, 0.63, 0.42],
+        }
+    )
+    full = format_table(comparison, 3)
+    table, dropped = encode_comparison(comparison, max_tokens=estimate_tokens(full) - 1)
+    assert dropped == 1
+    assert "Backcourt" not in table
+    assert "Restricted Area" in table and "Mid-Range" in table
@@ -0,0 +1,116 @@
+"""Fetch engine tests against the local fixture server from benchmarks/fixtures.py, which adds latency
+and answers every nth request with a 429 page like a throttled stats.nba.com
+"""
+
+import json
+import time
+
+import pytest
+import requests
+from nba_api.stats.endpoints import CumeStatsTeam
+
+from benchmarks.fixtures import build_synthetic_fixtures, serve_fixtures
+from benchmarks.synthetic import generate_shots
+from pipelines import fetch, ingest, metrics
+
+N_GAMES = 12
+
+
+@pytest.fixture(scope="module")
+def team_fixtures(tmp_path_factory):
+    shots = generate_shots(n_teams=1, n_games=N_GAMES, season_type="Playoffs")
+    fixture_dir = tmp_path_factory.mktemp("fixtures")
+    build_synthetic_fixtures(shots, fixture_dir, "Playoffs")
+    team_id = int(shots["TEAM_ID"].iloc[0])
+    game_ids = list(dict.fromkeys(shots["GAME_ID"].astype(str)))
+    return fixture_dir, team_id, game_ids
+
+
+def test_is_retryable():
+    assert fetch.is_retryable(json.JSONDecodeError("Expecting value", "<html>", 0))
+    assert fetch.is_retryable(requests.exceptions.Timeout())
+    assert fetch.is_retryable(requests.exceptions.ConnectionError())
+    throttled = requests.Response()
+    throttled.status_code = 429
+    assert fetch.is_retryable(requests.exceptions.HTTPError(response=throttled))
+    bad_request = requests.Response()
+    bad_request.status_code = 400
+    assert not fetch.is_retryable(requests.exceptions.HTTPError(response=bad_request))
+    # A plain ValueError is a bug in the request or our parsing, not throttling
+    assert not fetch.is_retryable(ValueError("bad season"))
+    assert not fetch.is_retryable(KeyError("resultSets"))
+
+
+def test_non_retryable_errors_are_raised_at_once():
+    calls = []
+
+    def broken(item):
+        calls.append(item)
+        raise ValueError("bad params")
+
+    with pytest.raises(ValueError):
+        fetch.call_with_retry(broken, 1, max_retries=3, backoff_base=0)
+    assert calls == [1]
+
+
+def test_fetch_many_retries_throttled_requests(team_fixtures):
+    fixture_dir, team_id, game_ids = team_fixtures
+    metrics.reset_metrics()
+
+    def fetch_game(game_id):
+        return fetch.call_endpoint(
+            CumeStatsTeam, team_id=team_id, game_ids=game_id
+        ).get_data_frames()[0]
+
+    with serve_fixtures(fixture_dir, latency=0.05, throttle_every=3) as server:
+        results = fetch.fetch_many(
+            fetch_game,
+            game_ids,
+            limiter=fetch.TokenBucket(rate=200, burst=4),
+            max_workers=4,
+            # Every third request is throttled, enough retries that no game runs out
+            max_retries=20,
+            backoff_base=0.01,
+        )
+    assert list(results) == game_ids
+    assert all(len(frame) for frame in results.values())
+    assert server.requests["cumestatsteam"] == len(game_ids)
+    assert server.throttled >= len(game_ids) // 3
+    retries = {
+        counter["labels"]["error"]: counter["value"]
+        for counter in metrics.snapshot()["counters"]
+        if counter["name"] == "fetch.retries"
+    }
+    assert retries == {"JSONDecodeError": server.throttled}
+
+
+def test_get_cum_team_stats_runs_requests_concurrently(team_fixtures):
+    fixture_dir, team_id, game_ids = team_fixtures
+    latency = 0.2
+    with serve_fixtures(fixture_dir, latency=latency) as server:
+        started = time.perf_counter()
+        game_stats = ingest.get_cum_team_stats(
+            team_id, game_ids, requests_per_second=100, max_workers=4
+        )
+        elapsed = time.perf_counter() - started
+    assert set(game_stats) == set(game_ids)
+    assert server.requests["cumestatsteam"] == len(game_ids)
+    # One at a time would take len(game_ids) * latency
+    assert elapsed < len(game_ids) * latency / 2
+
+
+def test_default_ingest_path_retries_throttled_requests(team_fixtures):
+    fixture_dir, team_id, game_ids = team_fixtures
+    metrics.reset_metrics()
+    with serve_fixtures(fixture_dir, throttle_every=2) as server:
+        # Single requests outside fetch_many go through fetch.request() and the shared limiter
+        minutes = ingest.get_season_minutes(team_id, season="2024-25")
+        shots = ingest.get_team_shots(team_id, season="2024-25")
+    assert len(minutes) and len(shots)
+    assert server.throttled >= 1
+    retries = sum(
+        counter["value"]
+        for counter in metrics.snapshot()["counters"]
+        if counter["name"] == "fetch.retries"
+    )
+    assert retries == server.throttled
@@ -0,0 +1,191 @@
+"""HTTP server tests against the nba api fixture server from benchmarks/fixtures.py and the stub Ollama
+server from llm/stub_server.py
+"""
+
+import asyncio
+import json
+from urllib.parse import urlencode
+
+import pytest
+
+from app.server import ShotService, make_handler
+from benchmarks.fixtures import build_synthetic_fixtures, serve_fixtures
+from benchmarks.synthetic import generate_shots
+from llm import summarizer
+from llm.cache import configure_summary_cache
+from llm.stub_server import CANNED_SUMMARY, start_stub_server
+from pipelines.cache import configure_cache
+
+SEASON = {"season": "2024-25", "season_type": "Playoffs"}
+
+
+@pytest.fixture(scope="module")
+def team_names(tmp_path_factory):
+    shots = generate_shots(n_teams=3, n_games=4, season_type="Playoffs")
+    fixture_dir = tmp_path_factory.mktemp("fixtures")
+    build_synthetic_fixtures(shots, fixture_dir, "Playoffs")
+    return fixture_dir, list(dict.fromkeys(shots["TEAM_NAME"].astype(str)))
+
+
+@pytest.fixture
+def nba_api(team_names, tmp_path, monkeypatch):
+    # Empty cache and store so every team is a fresh ingest
+    monkeypatch.setenv("NBA_SHOT_STORE_DIR", str(tmp_path / "store"))
+    configure_cache(root=tmp_path / "cache")
+    fixture_dir, names = team_names
+    with serve_fixtures(fixture_dir, latency=0.2) as server:
+        yield server, names
+    configure_cache()
+
+
+@pytest.fixture
+def ollama(tmp_path):
+    server, host = start_stub_server(token_delay=0.05)
+    original = summarizer._settings["host"]
+    summarizer.configure_client(host=host)
+    configure_summary_cache(root=tmp_path / "summaries")
+    yield host
+    server.shutdown()
+    server.server_close()
+    summarizer.configure_client(host=original)
+    configure_summary_cache()
+
+
+async def get(port, path, **params):
+    # One GET request, returns the status, headers and body
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path}?{urlencode(params)} HTTP/1.1\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    headers = dict(line.split(": ", 1) for line in header_lines)
+    return int(status_line.split()[1]), headers, body
+
+
+def run_server(service, scenario):
+    # Runs scenario(port) against a server on a free port
+    async def main():
+        server = await asyncio.start_server(make_handler(service), "127.0.0.1", 0)
+        async with server:
+            return await scenario(server.sockets[0].getsockname()[1])
+
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_share_one_ingest_per_team(nba_api):
+    fixture_server, (team_a, team_b, team_c) = nba_api
+    service = ShotService()
+
+    async def scenario(port):
+        return await asyncio.gather(
+            get(port, "/compare", team=team_a, opponent=team_c, **SEASON),
+            get(port, "/compare", team=team_b, opponent=team_c, **SEASON),
+            get(port, "/compare", team=team_c, **SEASON),
+        )
+
+    responses = run_server(service, scenario)
+    assert [status for status, _, _ in responses] == [200, 200, 200]
+    assert all(json.loads(body) for _, _, body in responses)
+    # team_c is an opponent twice and a team once, it is still fetched once
+    assert fixture_server.requests["shotchartdetail"] == 3
+    assert service.shots.stats()["entries"] == 3
+
+
+def test_opponent_shots_are_kept_in_the_shot_cache(nba_api):
+    fixture_server, (team_a, team_b, _) = nba_api
+    service = ShotService()
+    opponent_key = ("shots", team_b, *SEASON.values())
+
+    async def scenario(port):
+        first = await get(port, "/compare", team=team_a, opponent=team_b, **SEASON)
+        opponent_in_memory = opponent_key in service.shots
+        # The reverse comparison is answered from memory
+        second = await get(port, "/compare", team=team_b, opponent=team_a, **SEASON)
+        return first[0], opponent_in_memory, second[0]
+
+    assert run_server(service, scenario) == (200, True, 200)
+    assert fixture_server.requests["shotchartdetail"] == 2
+
+
+def test_requests_past_the_wait_queue_get_503(nba_api):
+    _, names = nba_api
+    service = ShotService(nba_api_limit=1, max_waiting=1)
+
+    async def scenario(port):
+        return await asyncio.gather(
+            *(get(port, "/compare", team=team, **SEASON) for team in names)
+        )
+
+    responses = run_server(service, scenario)
+    statuses = [status for status, _, _ in responses]
+    assert 200 in statuses and 503 in statuses
+    busy = next(headers for status, headers, _ in responses if status == 503)
+    assert busy["Retry-After"]
+
+
+def test_error_status_mapping(nba_api):
+    _, (team, _, _) = nba_api
+    service = ShotService()
+
+    async def scenario(port):
+        statuses = {
+            "no team": (await get(port, "/compare"))[0],
+            "unknown team": (await get(port, "/compare", team="Nowhere Nobodies"))[0],
+            "unknown opponent": (
+                await get(port, "/compare", team=team, opponent="Nowhere Nobodies")
+            )[0],
+            "chart mode": (await get(port, "/chart", team=team, mode="pie"))[0],
+            "chart kind": (await get(port, "/chart", team=team, kind="pie"))[0],
+        }
+
+        async def bug(*args):
+            raise KeyError("SHOT_ZONE_BASIC")
+
+        service.comparison = bug
+        statuses["pipeline bug"] = (await get(port, "/compare", team=team))[0]
+
+        async def throttled(*args):
+            raise json.JSONDecodeError("Expecting value", "<html>", 0)
+
+        service.comparison = throttled
+        statuses["throttled upstream"] = (await get(port, "/compare", team=team))[0]
+        return statuses
+
+    assert run_server(service, scenario) == {
+        "no team": 400,
+        "unknown team": 400,
+        "unknown opponent": 400,
+        "chart mode": 400,
+        "chart kind": 400,
+        "pipeline bug": 500,
+        "throttled upstream": 502,
+    }
+    # Nothing was cached for the rejected modes and kinds
+    assert not service._renderers
+
+
+def test_summary_streams_and_frees_its_slot_when_the_client_leaves(nba_api, ollama):
+    _, (team, opponent, _) = nba_api
+    service = ShotService(ollama_limit=1)
+
+    async def scenario(port):
+        status, _, body = await get(port, "/summary", team=team, **SEASON)
+        # A second, uncached summary that the client abandons after the first piece
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        query = urlencode({"team": team, "opponent": opponent, **SEASON})
+        writer.write(f"GET /summary?{query} HTTP/1.1\r\n\r\n".encode())
+        await writer.drain()
+        await reader.readuntil(b"\r\n\r\n")
+        writer.close()
+        for _ in range(100):
+            if not service.ollama.active:
+                break
+            await asyncio.sleep(0.05)
+        return status, body, service.ollama.stats()
+
+    status, body, ollama_stats = run_server(service, scenario)
+    assert status == 200
+    assert CANNED_SUMMARY.split(" ")[0].encode() in body
+    assert ollama_stats["active"] == 0
@@ -0,0 +1,236 @@
+# viz/batch.py
+"""Headless batch rendering of shot charts.
+
+A ChartRenderer owns one non-interactive (Agg) figure with the court and FG% colorbar drawn once.
+Each chart only adds its shot markers, saves the png and removes them again, so memory stays flat
+no matter how many charts are rendered. render_charts() can spread the work over a process pool,
+with one renderer per worker process.
+
+Example:
+    jobs = team_chart_jobs(team_shots, "data/visuals", "New York Knicks", "2024-25", "Playoffs")
+    render_charts(jobs, processes=4)
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from pipelines import metrics
+from pipelines.schema import SHOT_COLUMNS
+from viz.binning import DEFAULT_BIN_SIZE
+from viz.charts import add_fg_pct_colorbar, draw_shots, save_figure
+from viz.court import COURT_FIGSIZE, draw_court
+
+
+class ChartRenderer:
+    """Reusable court figure for rendering many charts without pyplot
+    Parameters:
+    - mode (str): "grid" or "scatter", see viz/charts.plot_shot_chart()
+    - kind (str): Bin shape for grid mode, "hex" or "square"
+    - bin_size (float): Bin size for grid mode in court units (tenths of a foot)
+    - dpi (int): Resolution of the saved pngs
+    """
+
+    def __init__(self, mode="grid", kind="hex", bin_size=DEFAULT_BIN_SIZE, dpi=150):
+        self.mode = mode
+        self.kind = kind
+        self.bin_size = bin_size
+        self.dpi = dpi
+        # Building the figure outside of pyplot, so nothing is registered globally and no gui backend is needed
+        self.fig = Figure(figsize=COURT_FIGSIZE)
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        draw_court(ax=self.ax)
+        if mode != "scatter":
+            add_fg_pct_colorbar(self.fig, self.ax)
+        # Drawing once so the layout (aspect, colorbar) is settled before markers are sized against it
+        self.fig.canvas.draw()
+
+    def render(self, df_shots, output_path, title="Shot Chart", cache_grid=False):
+        """Renders one chart onto the shared court and saves it
+        Parameters:
+        - df_shots (pd.DataFrame): DataFrame with columns ['LOC_X', 'LOC_Y', 'SHOT_MADE_FLAG']
+        - output_path (str): Filepath to export the png to
+        - title (str): Title to be displayed above the shot chart
+        - cache_grid (bool): Keep the binned grid in the parquet cache
+        Returns:
+        - output_path (str): Where the png was written
+        """
+        with metrics.span("chart.draw", mode=self.mode) as current:
+            artists = draw_shots(
+                self.ax,
+                df_shots,
+                mode=self.mode,
+                kind=self.kind,
+                bin_size=self.bin_size,
+                cache_grid=cache_grid,
+            )
+            self.ax.set_title(title, fontsize=18)
+            current.set(rows=len(df_shots))
+        try:
+            save_figure(self.fig, output_path, dpi=self.dpi)
+        finally:
+            # Removing this chart's markers so the court is clean for the next one
+            for artist in artists:
+                artist.remove()
+        return str(output_path)
+
+
+def chart_filename(name, season, season_type):
+    # Same naming as app/cli_bot.py
+    return f"{name}_{season}_{season_type}_shot_chart.png"
+
+
+def team_chart_jobs(
+    team_shots, output_dir, team_name, season, season_type, players=True
+):
+    """Builds render jobs for a team chart and, optionally, one chart per player
+    Parameters:
+    - team_shots (pd.DataFrame): Shot chart data from ingest.py
+    - output_dir (str | Path): Directory to write the pngs to
+    - team_name (str): Team name, used for the title and file name
+    - season (str): Season year string
+    - season_type (str): Time of season
+    - players (bool): Also build a job for every player on the team
+    Returns:
+    - jobs (list): (df_shots, output_path, title) tuples for render_charts()
+    """
+    output_dir = Path(output_dir)
+    # Only the columns a chart needs are sent to the workers
+    columns = [c for c in SHOT_COLUMNS if c in team_shots.columns]
+    team_shots = team_shots[columns]
+    jobs = [
+        (
+            team_shots,
+            output_dir / chart_filename(team_name, season, season_type),
+            team_name,
+        )
+    ]
+    if players:
+        for player_name, player_shots in team_shots.groupby(
+            "PLAYER_NAME", observed=True
+        ):
+            jobs.append(
+                (
+                    player_shots,
+                    output_dir / chart_filename(player_name, season, season_type),
+                    str(player_name),
+                )
+            )
+    return jobs
+
+
+_worker_renderer = None
+
+
+def _init_worker(mode, kind, bin_size, dpi):
+    # Each worker process builds its court figure once and reuses it for every job it gets
+    global _worker_renderer
+    _worker_renderer = ChartRenderer(mode=mode, kind=kind, bin_size=bin_size, dpi=dpi)
+
+
+def render_job(job):
+    """Renders one (df_shots, output_path, title) job on a render pool worker
+    Returns:
+    - (str) Written png path
+    """
+    df_shots, output_path, title = job
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    return _worker_renderer.render(df_shots, output_path, title)
+
+
+def make_render_pool(
+    processes, mode="grid", kind="hex", bin_size=DEFAULT_BIN_SIZE, dpi=150
+):
+    """Starts a process pool whose workers each hold a ChartRenderer, submit render_job() to it
+    Parameters:
+    - processes (int): Number of worker processes
+    - mode, kind, bin_size, dpi: See ChartRenderer
+    Returns:
+    - (ProcessPoolExecutor) The pool, the caller shuts it down
+    """
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_init_worker,
+        initargs=(mode, kind, bin_size, dpi),
+    )
+
+
+def render_charts(
+    jobs, processes=None, mode="grid", kind="hex", bin_size=DEFAULT_BIN_SIZE, dpi=150
+):
+    """Renders many charts headless, in this process or over a process pool
+    Parameters:
+    - jobs (list): (df_shots, output_path, title) tuples, ie: from team_chart_jobs()
+    - processes (int): Number of worker processes, None or 1 renders in this process
+    - mode (str): "grid" or "scatter"
+    - kind (str): Bin shape for grid mode, "hex" or "square"
+    - bin_size (float): Bin size for grid mode in court units (tenths of a foot)
+    - dpi (int): Resolution of the saved pngs
+    Returns:
+    - paths (list): Written png paths, in job order
+    """
+    jobs = list(jobs)
+    if not processes or processes <= 1:
+        _init_worker(mode, kind, bin_size, dpi)
+        return [render_job(job) for job in jobs]
+    with make_render_pool(processes, mode, kind, bin_size, dpi) as pool:
+        return list(pool.map(render_job, jobs, chunksize=4))
+
+
+def render_league_charts(
+    season, season_type, output_dir, processes=None, players=True, **chart_options
+):
+    """Renders a team chart (and player charts) for every team in the league shot store
+    Parameters:
+    - season (str): Season year string
+    - season_type (str): Time of season
+    - output_dir (str | Path): Directory to write the pngs to
+    - processes (int): Number of worker processes
+    - players (bool): Also render every player
+    - chart_options: mode, kind, bin_size, dpi passed to render_charts()
+    Returns:
+    - paths (list): Written png paths
+    """
+    from pipelines import store
+
+    shots = store.read_team_shots(
+        season, season_type, columns=SHOT_COLUMNS + ["TEAM_NAME"]
+    )
+    if shots is None:
+        raise ValueError(f"No shots stored for {season} {season_type}")
+    jobs = []
+    for team_name, team_shots in shots.groupby("TEAM_NAME", observed=True):
+        jobs.extend(
+            team_chart_jobs(
+                team_shots, output_dir, str(team_name), season, season_type, players
+            )
+        )
+    return render_charts(jobs, processes=processes, **chart_options)
+
+
+if __name__ == "__main__":
+    # Nightly chart refresh from the league store, ie: python -m viz.batch 2024-25 Playoffs --processes 4
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Render every team's shot charts")
+    parser.add_argument("season", help="Season year string, ie: 2024-25")
+    parser.add_argument("season_type", help="Regular Season, Playoffs, ...")
+    parser.add_argument("--output-dir", default="data/visuals")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--teams-only", action="store_true")
+    parser.add_argument("--mode", default="grid", choices=["grid", "scatter"])
+    parser.add_argument("--kind", default="hex", choices=["hex", "square"])
+    args = parser.parse_args()
+    paths = render_league_charts(
+        args.season,
+        args.season_type,
+        args.output_dir,
+        processes=args.processes,
+        players=not args.teams_only,
+        mode=args.mode,
+        kind=args.kind,
+    )
+    print(f"Rendered {len(paths)} charts to {args.output_dir}")
@@ -0,0 +1,160 @@
+# viz/binning.py
+"""Spatial binning of shot locations for shot charts.
+
+Shots are binned on LOC_X/LOC_Y (tenths of a foot, hoop at 0, 0) into a square or hexagonal grid with
+vectorized NumPy. Every non-empty bin gets its attempts, makes, FG% and share of all attempts, so a chart
+draws one marker per bin no matter how many shots there are.
+
+Grids are cached by a hash of the shot locations and results, in memory and in the parquet cache
+(see pipelines/cache.py), so re-rendering the same data skips the binning entirely.
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from pipelines import metrics
+from pipelines.cache import get_cache
+
+# Court extent used by viz/court.py
+X_MIN, X_MAX = -250, 250
+Y_MIN, Y_MAX = -47.5, 422.5
+
+DEFAULT_BIN_SIZE = 15  # Tenths of a foot, ie: 1.5 ft bins
+MEMORY_CACHE_SIZE = 64
+
+_grid_cache = OrderedDict()
+
+
+def dataset_hash(df_shots):
+    """Hashes the columns a grid depends on
+    Parameters:
+    - df_shots (pd.DataFrame): DataFrame with columns ['LOC_X', 'LOC_Y', 'SHOT_MADE_FLAG']
+    Returns:
+    - (str) Hex digest of the shot locations and results
+    """
+    row_hashes = pd.util.hash_pandas_object(
+        df_shots[["LOC_X", "LOC_Y", "SHOT_MADE_FLAG"]].astype("int64"), index=False
+    )
+    # Sorting makes the hash independent of row order
+    return hashlib.sha256(np.sort(row_hashes.to_numpy()).tobytes()).hexdigest()[:32]
+
+
+def square_bin(x, y, size):
+    """Assigns every shot to a square bin
+    Parameters:
+    - x, y (np.ndarray): Shot coordinates
+    - size (float): Bin width
+    Returns:
+    - col, row (np.ndarray): Integer lattice position of each shot's bin
+    """
+    return np.floor((x - X_MIN) / size), np.floor((y - Y_MIN) / size)
+
+
+def square_centers(col, row, size):
+    # Center of a square bin from its lattice position
+    return X_MIN + (col + 0.5) * size, Y_MIN + (row + 0.5) * size
+
+
+def hex_bin(x, y, size):
+    """Assigns every shot to a pointy top hexagon
+    Parameters:
+    - x, y (np.ndarray): Shot coordinates
+    - size (float): Hexagon radius (center to corner)
+    Returns:
+    - q, r (np.ndarray): Axial lattice position of each shot's hexagon
+    """
+    # Fractional axial coordinates, then cube rounding to the nearest hexagon
+    q = (np.sqrt(3) / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq, rr
+
+
+def hex_centers(q, r, size):
+    # Center of a hexagon from its axial position
+    return size * np.sqrt(3) * (q + r / 2), size * 1.5 * r
+
+
+def bin_shots(df_shots, kind="hex", size=DEFAULT_BIN_SIZE):
+    """Bins shots and computes per bin attempts, makes, FG% and attempt share
+    Parameters:
+    - df_shots (pd.DataFrame): DataFrame with columns ['LOC_X', 'LOC_Y', 'SHOT_MADE_FLAG']
+    - kind (str): "hex" or "square"
+    - size (float): Bin size in court units (tenths of a foot)
+    Returns:
+    - grid (pd.DataFrame): One row per non-empty bin with x, y, attempts, makes, fg_pct, share
+    """
+    if kind not in ("hex", "square"):
+        raise ValueError(f"Unknown bin kind '{kind}', use 'hex' or 'square'")
+    columns = ["x", "y", "attempts", "makes", "fg_pct", "share"]
+    if df_shots.empty:
+        return pd.DataFrame(columns=columns)
+    x = df_shots["LOC_X"].to_numpy(dtype=float)
+    y = df_shots["LOC_Y"].to_numpy(dtype=float)
+    made = df_shots["SHOT_MADE_FLAG"].to_numpy(dtype=float)
+    binner, centers = (
+        (hex_bin, hex_centers) if kind == "hex" else (square_bin, square_centers)
+    )
+    i, j = binner(x, y, size)
+
+    # Flattening the lattice position into one bin id so a single bincount covers every bin
+    i_min, j_min = int(i.min()), int(j.min())
+    i = i.astype(np.int64) - i_min
+    j = j.astype(np.int64) - j_min
+    n_j = int(j.max()) + 1
+    flat = i * n_j + j
+    attempts = np.bincount(flat)
+    makes = np.bincount(flat, weights=made, minlength=len(attempts))
+    occupied = np.flatnonzero(attempts)
+    center_x, center_y = centers(occupied // n_j + i_min, occupied % n_j + j_min, size)
+    grid = pd.DataFrame(
+        {
+            "x": center_x,
+            "y": center_y,
+            "attempts": attempts[occupied],
+            "makes": makes[occupied].astype(np.int64),
+        }
+    )
+    grid["fg_pct"] = grid["makes"] / grid["attempts"]
+    grid["share"] = grid["attempts"] / len(df_shots)
+    return grid
+
+
+def get_grid(df_shots, kind="hex", size=DEFAULT_BIN_SIZE, use_disk=True):
+    """Returns the binned grid for a set of shots, reusing a cached grid when the same shots were binned before
+    Parameters:
+    - df_shots (pd.DataFrame): DataFrame with columns ['LOC_X', 'LOC_Y', 'SHOT_MADE_FLAG']
+    - kind (str): "hex" or "square"
+    - size (float): Bin size in court units (tenths of a foot)
+    - use_disk (bool): Also cache grids in the parquet cache, so they are shared across runs
+    Returns:
+    - grid (pd.DataFrame): See bin_shots()
+    """
+    params = {"dataset": dataset_hash(df_shots), "kind": kind, "size": size}
+    key = (params["dataset"], kind, size)
+    if key in _grid_cache:
+        metrics.count("grid_cache.requests", result="hit")
+        _grid_cache.move_to_end(key)
+        return _grid_cache[key]
+    # Misses here can still be answered by the parquet cache, counted there under ShotGrid
+    metrics.count("grid_cache.requests", result="miss")
+    if use_disk:
+        grid = get_cache().get_or_fetch(
+            "ShotGrid", params, lambda: bin_shots(df_shots, kind=kind, size=size)
+        )
+    else:
+        grid = bin_shots(df_shots, kind=kind, size=size)
+    _grid_cache[key] = grid
+    # Keeping the in memory cache bounded
+    while len(_grid_cache) > MEMORY_CACHE_SIZE:
+        _grid_cache.popitem(last=False)
+    return grid
@@ -1,29 +1,154 @@
 # viz/charts.py
-import matplotlib.pyplot as plt
+import os
+
+import numpy as np
+from pipelines import metrics
 from viz.court import draw_court
+from viz.binning import DEFAULT_BIN_SIZE, get_grid
+
+# Color range for FG% in binned charts, roughly a cold mid-range to a hot restricted area
+FG_PCT_RANGE = (0.25, 0.65)
+FG_PCT_CMAP = "RdYlGn"
 
 
-def plot_shot_chart(df_shots, output_path, plt_title="Shot Chart"):
+def plot_shot_chart(
+    df_shots,
+    output_path,
+    plt_title="Shot Chart",
+    mode="grid",
+    kind="hex",
+    bin_size=DEFAULT_BIN_SIZE,
+    show=True,
+):
     """Plots the shot chart data onto the empty half court plot
     Parameters:
     - df_shots (pd.DataFrame): DataFrame with columns ['LOC_X', 'LOC_Y', 'SHOT_MADE_FLAG']
     - output_path (str): Filepath to export the png to
     - plt_title (str): Title to be displayed above the shot chart
+    - mode (str): "grid" draws one marker per bin (size = attempt share, color = FG%), "scatter" draws every shot
+    - kind (str): Bin shape for grid mode, "hex" or "square"
+    - bin_size (float): Bin size for grid mode in court units (tenths of a foot)
+    - show (bool): Display the plot after saving it. Use viz/batch.py to render many charts headless
+    """
+    # pyplot is only needed once a chart is requested
+    import matplotlib.pyplot as plt
+
+    with metrics.span("chart.draw", mode=mode) as current:
+        ax = draw_court()
+        fig = ax.get_figure()
+
+        draw_shots(ax, df_shots, mode=mode, kind=kind, bin_size=bin_size)
+        if mode != "scatter":
+            add_fg_pct_colorbar(fig, ax)
+        ax.set_title(plt_title, fontsize=18)
+        current.set(rows=len(df_shots))
+
+    # Saving the plot to a png file
+    save_figure(fig, output_path, dpi=300)
+    print(f"Saving plot to: {output_path}")
+    # Displaying the plot for the user to see
+    if show:
+        plt.show()
+    # Closing the figure so charts made in a loop don't pile up in memory
+    plt.close(fig)
+
+
+def save_figure(fig, output_path, dpi):
+    """Saves a chart as a png, timing the rasterize and encode step on its own
+    Parameters:
+    - fig (Figure): Figure to save
+    - output_path (str | file): Filepath or binary file object, ie: io.BytesIO
+    - dpi (int): Resolution of the png
     """
-    ax = draw_court()
+    with metrics.span("chart.save", dpi=dpi) as current:
+        fig.savefig(output_path, dpi=dpi, bbox_inches="tight")
+        if hasattr(output_path, "tell"):
+            current.set(bytes_written=output_path.tell())
+        else:
+            current.set(bytes_written=os.path.getsize(output_path))
+
+
+def draw_shots(
+    ax, df_shots, mode="grid", kind="hex", bin_size=DEFAULT_BIN_SIZE, cache_grid=True
+):
+    """Draws shots onto a court axes
+    Parameters:
+    - ax (plt.Axes): Court axes from draw_court()
+    - df_shots (pd.DataFrame): DataFrame with columns ['LOC_X', 'LOC_Y', 'SHOT_MADE_FLAG']
+    - mode (str): "grid" or "scatter", see plot_shot_chart()
+    - kind (str): Bin shape for grid mode, "hex" or "square"
+    - bin_size (float): Bin size for grid mode in court units (tenths of a foot)
+    - cache_grid (bool): Keep the binned grid in the parquet cache (see viz/binning.py)
+    Returns:
+    - artists (list): Every artist added, so a reused figure can remove them again
+    """
+    if mode != "scatter":
+        grid = get_grid(df_shots, kind=kind, size=bin_size, use_disk=cache_grid)
+        return [draw_grid(ax, grid, kind, bin_size)] if not grid.empty else []
 
     # Scatter: makes vs misses
     made = df_shots[df_shots["SHOT_MADE_FLAG"] == 1]
     missed = df_shots[df_shots["SHOT_MADE_FLAG"] == 0]
 
-    ax.scatter(missed["LOC_X"], missed["LOC_Y"], c="red", alpha=0.6, label="Miss", s=50)
-    ax.scatter(made["LOC_X"], made["LOC_Y"], c="green", alpha=0.6, label="Make", s=50)
+    artists = [
+        ax.scatter(
+            missed["LOC_X"], missed["LOC_Y"], c="red", alpha=0.6, label="Miss", s=50
+        ),
+        ax.scatter(
+            made["LOC_X"], made["LOC_Y"], c="green", alpha=0.6, label="Make", s=50
+        ),
+    ]
+    artists.append(ax.legend(loc="upper right"))
+    return artists
 
-    ax.legend(loc="upper right")
-    ax.set_title(plt_title, fontsize=18)
 
-    # Saving the plot to a png file
-    plt.savefig(output_path, dpi=300, bbox_inches="tight")
-    print(f"Saving plot to: {output_path}")
-    # Displaying the plot for the user to see
-    plt.show()
+def draw_grid(ax, grid, kind="hex", bin_size=DEFAULT_BIN_SIZE):
+    """Draws a binned grid from viz/binning.py, one marker per bin, so the cost doesn't grow with the number of shots
+    Parameters:
+    - ax (plt.Axes): Court axes from draw_court()
+    - grid (pd.DataFrame): Binned shots with columns ['x', 'y', 'attempts', 'fg_pct', 'share']
+    - kind (str): "hex" or "square", sets the marker shape
+    - bin_size (float): Bin size in court units, sets the largest marker
+    Returns:
+    - (PathCollection) The markers that were drawn
+    """
+    # Converting one bin width from data units to points so the busiest bin fills its cell
+    fig = ax.get_figure()
+    origin, corner = ax.transData.transform([(0, 0), (bin_size, 0)])
+    width_points = (corner[0] - origin[0]) * 72 / fig.dpi
+    if kind == "hex":
+        # Hex centers are sqrt(3) radii apart, trimmed a little so neighbouring full bins don't overlap
+        width_points *= 1.6
+    # Marker area grows with the bin's share of attempts, relative to the busiest bin
+    relative = np.sqrt(grid["attempts"] / grid["attempts"].max())
+    return ax.scatter(
+        grid["x"],
+        grid["y"],
+        s=(width_points * relative) ** 2,
+        c=grid["fg_pct"],
+        cmap=FG_PCT_CMAP,
+        vmin=FG_PCT_RANGE[0],
+        vmax=FG_PCT_RANGE[1],
+        marker="h" if kind == "hex" else "s",
+        linewidths=0,
+    )
+
+
+def add_fg_pct_colorbar(fig, ax):
+    """Adds the FG% colorbar for grid charts. The color range is fixed, so one colorbar fits every chart
+    Parameters:
+    - fig (plt.Figure): Figure holding the court axes
+    - ax (plt.Axes): Court axes
+    Returns:
+    - colorbar (Colorbar) The colorbar that was added
+    """
+    from matplotlib import colormaps
+    from matplotlib.cm import ScalarMappable
+    from matplotlib.colors import Normalize
+
+    mappable = ScalarMappable(
+        norm=Normalize(*FG_PCT_RANGE), cmap=colormaps[FG_PCT_CMAP]
+    )
+    colorbar = fig.colorbar(mappable, ax=ax, fraction=0.03, pad=0.01)
+    colorbar.set_label("FG%")
+    return colorbar
@@ -1,17 +1,24 @@
 # viz/court.py
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
 
+COURT_FIGSIZE = (15, 7.5)
 
-def draw_court(color="black", lw=2):
+
+def draw_court(color="black", lw=2, ax=None):
     """Draws an NBA court using matplotlib patches
     Parameters:
     - color (str): Color of the halfcourt lines, defaults to black
     - lw (int): Size of the line widths
+    - ax (plt.Axes): Optional existing axes to draw onto, a new pyplot figure is created if not given
     Returns
     - ax (plt): Emtpy plot of half court to display shot chart information on
     """
-    fig, ax = plt.subplots(figsize=(15, 7.5))
+    # matplotlib is imported on the first chart so runs without charts don't pay for it
+    import matplotlib.patches as patches
+
+    if ax is None:
+        import matplotlib.pyplot as plt
+
+        fig, ax = plt.subplots(figsize=COURT_FIGSIZE)
 
     # Hoop
     hoop = patches.Circle((0, 0), radius=7.5, linewidth=lw, color=color, fill=False)